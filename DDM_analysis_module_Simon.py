@@ -31,11 +31,31 @@ Written by Simon
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+from scipy.optimize import curve_fit, least_squares, lsq_linear
 import os
 import datetime
 import re
-#from numba import njit
+import io
+import shutil
+import hashlib
+import inspect
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+import threading
+import warnings
+from multiprocessing import shared_memory
+from numpy.lib.format import open_memmap
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs): # without numba the kernels stay plain python functions
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 #from mpl_toolkits import mplot3d
 from tqdm import tqdm
 import time
@@ -55,6 +75,30 @@ plt.rcParams.update({"axes.grid" : True,
                      "legend.loc": "best",
                      "svg.fonttype": "none"})
 
+# fitting backend used by fit_corr ("scipy" or "numba"), see set_fit_backend:
+FIT_BACKEND = "scipy"
+
+# rungs of the fit fallback ladder, fit_path_array stores indices into this list (see fit_corr):
+FIT_PATHS = ["1exp", "2exp", "loglin", "nan"]
+
+# in-process LRU cache of loaded npz / npy files, keyed by (path, mtime), see cached_load:
+CACHE_LIMIT = 1024**3 # bytes, see set_cache_limit
+_CACHE = OrderedDict() # (path, mtime) -> (data, nbytes)
+_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+_CACHE_LOCK = threading.RLock() # cached_load is also called from the prefetch threads (see prefetch_folders)
+
+# version of the fitting code in the keys of the persistent fit cache (see cached_fit), raise it when fit results change:
+FIT_CACHE_VERSION = 1
+
+# on-disk experiment catalog (Experiment_folder/Results/ddm_catalog.json), see experiment_catalog:
+CATALOG_NAME = "ddm_catalog.json"
+CATALOG_VERSION = 1
+
+# per-run dependency state (run_folder/ddm_state.json) and registry of aggregate outputs (Results/ddm_outputs.json), see update_experiment:
+STATE_NAME = "ddm_state.json"
+OUTPUTS_NAME = "ddm_outputs.json"
+STATE_VERSION = 1
+
 # theory constants:
 M_all = [1,2,3,4] # E7, GCQ2, N19, N19C
 gamma_all = [1,2,3,4] # E7, GCQ2, N19, N19C
@@ -163,6 +207,320 @@ def initial_settings2(folder, sample):
     FOLDER = folder
 
 
+def set_fit_backend(backend):
+    """
+    Sets the default fitting backend of fit_corr globally in the module file.
+
+    Parameters:
+        backend (str): "scipy" (curve_fit, default) or "numba" (compiled kernels, needs numba installed)
+    """
+    global FIT_BACKEND
+    if backend == "numba" and not NUMBA_AVAILABLE:
+        print("numba is not installed, keeping the scipy fitting backend.")
+        return
+    FIT_BACKEND = backend
+
+
+def _data_nbytes(data):
+    arrays = data.values() if isinstance(data, dict) else [data]
+    nbytes = 0
+    for array in arrays:
+        nbytes += array.nbytes
+        if array.dtype == object: # popt_2D / pcov_2D: the elements are arrays too
+            nbytes += sum(getattr(element, "nbytes", 0) for element in array.flat)
+    return nbytes
+
+
+def _evict_cache():
+    while _CACHE and sum(nbytes for _, nbytes in _CACHE.values()) > CACHE_LIMIT:
+        _CACHE.popitem(last=False)
+        _CACHE_STATS["evictions"] += 1
+
+
+def cached_load(path, allow_pickle=False):
+    """
+    np.load through the module LRU cache: the file is read (and decompressed) once, later calls with the same path and
+    modification time get the arrays from memory. A rewritten file (new mtime) is read again. The least recently used
+    files are dropped when the cache grows over CACHE_LIMIT (see set_cache_limit). Used for corr.npz, var.npz and fit files.
+    The returned arrays are shared between the calls, so they are read-only.
+
+    Parameters:
+        path (str): .npz or .npy file.
+        allow_pickle (bool): as in np.load (needed for popt_pcov_2D files).
+
+    Returns:
+        dict or numpy.ndarray: {name: array} for .npz files (used like the np.load result), the array for .npy files.
+    """
+    filename = os.path.abspath(path)
+    key = (filename, os.path.getmtime(filename))
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            _CACHE_STATS["hits"] += 1
+            return _CACHE[key][0]
+        _CACHE_STATS["misses"] += 1
+
+    loaded = np.load(filename, allow_pickle=allow_pickle)
+    if isinstance(loaded, np.ndarray):
+        data = loaded
+        data.flags.writeable = False
+    else:
+        with loaded:
+            data = {name: loaded[name] for name in loaded.files}
+        for array in data.values():
+            array.flags.writeable = False
+
+    nbytes = _data_nbytes(data)
+    with _CACHE_LOCK:
+        for old_key in [old_key for old_key in _CACHE if old_key[0] == filename]: # older versions of the file
+            del _CACHE[old_key]
+        if nbytes <= CACHE_LIMIT:
+            _CACHE[key] = (data, nbytes)
+            _evict_cache()
+    return data
+
+
+def set_cache_limit(max_bytes):
+    """
+    Sets the memory limit of the cached_load cache globally in the module file (0 = no caching).
+
+    Parameters:
+        max_bytes (int or float): max. size of the cached arrays in bytes.
+    """
+    global CACHE_LIMIT
+    CACHE_LIMIT = max_bytes
+    with _CACHE_LOCK:
+        _evict_cache()
+
+
+def clear_cache():
+    """
+    Empties the cached_load cache and the index of point overrides (the statistics are kept).
+    """
+    with _CACHE_LOCK:
+        _CACHE.clear()
+    _OVERRIDES.clear()
+
+
+def cache_stats(printout=False):
+    """
+    Statistics of the cached_load cache.
+
+    Returns:
+        dict: hits, misses, evictions, hit_rate, files (cached now), nbytes (cached now) and limit.
+    """
+    calls = _CACHE_STATS["hits"] + _CACHE_STATS["misses"]
+    stats = dict(_CACHE_STATS,
+                 hit_rate=_CACHE_STATS["hits"] / calls if calls else np.nan,
+                 files=len(_CACHE),
+                 nbytes=sum(nbytes for _, nbytes in _CACHE.values()),
+                 limit=CACHE_LIMIT)
+    if printout == True:
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions, "
+              f"{stats['files']} files, {stats['nbytes'] / 1024**2:.1f} / {CACHE_LIMIT / 1024**2:.1f} MB")
+    return stats
+
+
+# storage types of quantize_corr / convert_corr_to_npy / compress_corr_npz
+CORR_STORAGE = ["float64", "float32", "int16"]
+
+
+def _save_npy(filename, array):
+    # write to a temporary file first, so an interrupted conversion never leaves a truncated .npy behind
+    with open(filename + ".tmp", "wb") as file:
+        np.save(file, np.ascontiguousarray(array))
+    os.replace(filename + ".tmp", filename)
+
+
+def quantize_corr(corr, storage="float32"):
+    """
+    Reduced-precision copy of corr for storage:
+    "float64" = unchanged, "float32" = half the bytes (complex64 for complex data),
+    "int16" = a quarter of the bytes, every k-point curve is scaled to the full int16 range by its own
+    float32 factor (max|corr| / 32767), so the error is at most 1.5e-5 of the curve's maximum.
+    Complex data is stored in int16 as (re, im) pairs in an extra last axis.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        storage (str): "float64", "float32" or "int16".
+
+    Returns:
+        tuple: stored array and scale (numpy.ndarray (kx, ky, 1) or (kx, ky, 1, 1), None if storage is not int16).
+    """
+    corr = np.asarray(corr)
+    if storage == "float64":
+        return corr, None
+    if storage == "float32":
+        return corr.astype(np.complex64 if np.iscomplexobj(corr) else np.float32), None
+    if storage == "int16":
+        values = np.stack([corr.real, corr.imag], axis=-1) if np.iscomplexobj(corr) else corr.astype(np.float64)
+        axes = (2, 3) if np.iscomplexobj(corr) else (2,)
+        scale = np.nanmax(np.abs(values), axis=axes, keepdims=True) / 32767
+        scale[~(scale > 0)] = 1
+        scale = scale.astype(np.float32)
+        return np.round(np.nan_to_num(values / scale)).astype(np.int16), scale
+    raise ValueError(f"Unknown storage {storage}, use one of {CORR_STORAGE}.")
+
+
+def dequantize_corr(stored, scale=None):
+    """
+    Inverse of quantize_corr: upcast stored corr (float32 / complex64 / scaled int16) back to float64 / complex128.
+    """
+    if scale is None:
+        return np.asarray(stored).astype(np.complex128 if np.iscomplexobj(stored) else np.float64)
+    corr = stored.astype(np.float64) * scale
+    if corr.ndim == 4: # complex data, (re, im) pairs
+        return corr[..., 0] + 1j * corr[..., 1]
+    return corr
+
+
+def _save_npz(filename, **arrays):
+    # np.savez through a temporary file, so an interrupted save never leaves a truncated .npz behind
+    with open(filename + ".tmp", "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(filename + ".tmp", filename)
+
+
+def convert_corr_to_npy(folder, remove_npz=False, storage="float64"):
+    """
+    One-time conversion of corr.npz / var.npz of a run folder into uncompressed .npy files
+    (corr.npy, corr_t.npy, var1.npy, var2.npy), which load_corr / load_var open as memory maps.
+    corr is stored in C order (kx, ky, t), so the curve of one k-point is one contiguous block of the file.
+    With storage "float32" or "int16" corr.npy is stored in reduced precision (see quantize_corr, int16 adds corr_scale.npy),
+    load_corr then upcasts the indexed curves to float64 (see QuantizedCorr) - half / a quarter of the bytes are read from disk.
+
+    Parameters:
+        folder (str): run folder.
+        remove_npz (bool): delete corr.npz / var.npz after the conversion.
+        storage (str): "float64" (memory-mapped on loading), "float32" or "int16".
+    """
+    t, corr = load_corr(folder, mmap=not os.path.exists(folder + "/" +  "corr.npz")) # re-conversion of an already removed corr.npz
+    stored, scale = quantize_corr(corr, storage)
+    _save_npy(folder + "/" +  "corr_t.npy", t)
+    if scale is not None:
+        _save_npy(folder + "/" +  "corr_scale.npy", scale)
+    elif os.path.exists(folder + "/" +  "corr_scale.npy"):
+        os.remove(folder + "/" +  "corr_scale.npy")
+    _save_npy(folder + "/" +  "corr.npy", stored) # written after corr_scale.npy, so it is never newer than a stale scale
+    if os.path.exists(folder + "/" +  "var.npz"):
+        with np.load(folder + "/" +  "var.npz") as datavar:
+            _save_npy(folder + "/" +  "var1.npy", datavar["var1"])
+            _save_npy(folder + "/" +  "var2.npy", datavar["var2"])
+        if remove_npz == True:
+            os.remove(folder + "/" +  "var.npz")
+    if remove_npz == True:
+        os.remove(folder + "/" +  "corr.npz")
+
+
+def convert_experiment_to_npy(exp_folder, remove_npz=False, storage="float64"):
+    """
+    convert_corr_to_npy for every run folder of an experiment that still has only corr.npz (see catalog_runs).
+    """
+    for run_folder in tqdm(catalog_runs(exp_folder, "corr.npz"), desc="Converting corr.npz", ncols=100, colour="#82e0aa"):
+        if _npy_current(run_folder, "corr.npz", ["corr.npy", "corr_t.npy"]) == False:
+            convert_corr_to_npy(run_folder, remove_npz=remove_npz, storage=storage)
+
+
+def compress_corr_npz(folder, storage="float32", remove_original=False):
+    """
+    Rewrite corr.npz of a run folder compressed (np.savez_compressed) and in reduced precision (see quantize_corr).
+    load_corr upcasts it back transparently. The original file is kept as corr_float64.npz unless remove_original.
+    """
+    t, corr = load_corr(folder, mmap=False)
+    stored, scale = quantize_corr(corr, storage)
+    if remove_original == False and not os.path.exists(folder + "/" +  "corr_float64.npz"):
+        shutil.copy2(folder + "/" +  "corr.npz", folder + "/" +  "corr_float64.npz")
+    with open(folder + "/" +  "corr.npz.tmp", "wb") as file:
+        np.savez_compressed(file, t=t, corr=stored, **({} if scale is None else {"corr_scale": scale}))
+    os.replace(folder + "/" +  "corr.npz.tmp", folder + "/" +  "corr.npz")
+
+
+def _npy_current(folder, npz_name, npy_names):
+    # True if the .npy files exist and are not older than the .npz file (if it still exists)
+    npz_file = folder + "/" + npz_name
+    if not all(os.path.exists(folder + "/" + name) for name in npy_names):
+        return False
+    if os.path.exists(npz_file) and min(os.path.getmtime(folder + "/" + name) for name in npy_names) < os.path.getmtime(npz_file):
+        print(f"{npz_file} is newer than its .npy files, run convert_corr_to_npy again.")
+        return False
+    return True
+
+
+class QuantizedCorr(object):
+    """
+    Read-only float64 view of a reduced-precision corr.npy memory map (float32 / int16, see quantize_corr).
+    Indexing reads and dequantizes only the selected curves (corr[kx, ky], corr[kx], corr[..., 0], ...),
+    np.asarray(corr) dequantizes the whole array. shape and dtype are those of the float64 (complex128) corr.
+    """
+
+    def __init__(self, stored, scale=None):
+        self.stored, self.scale = stored, scale
+        self.pairs = scale is not None and stored.ndim == 4 # complex int16 data, (re, im) pairs in the last axis
+        self.shape = stored.shape[:3] if self.pairs else stored.shape
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(np.complex128 if self.pairs or np.iscomplexobj(stored) else np.float64)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        corr = dequantize_corr(self.stored, self.scale)
+        return corr if dtype is None else corr.astype(dtype)
+
+    def reshape(self, *shape):
+        return np.asarray(self).reshape(*shape)
+
+    def __getitem__(self, key):
+        if self.scale is None:
+            return dequantize_corr(self.stored[key])
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key): # written out, so the (re, im) axis of stored is never indexed
+            i = [k is Ellipsis for k in key].index(True)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        values = self.stored[key].astype(np.float64) * np.broadcast_to(self.scale, self.stored.shape)[key]
+        if self.pairs:
+            return values[..., 0] + 1j * values[..., 1]
+        return values
+
+
+def load_corr(folder, deltat=1, mmap=True):
+    """
+    t and corr of a run folder. If the folder was converted (convert_corr_to_npy), corr is a read-only memory map,
+    so indexing one k-point or a slice only reads those bytes from disk; else corr.npz is loaded through cached_load.
+    corr.npy stored in reduced precision (float32 / int16, see quantize_corr) is returned as a QuantizedCorr, which keeps
+    the memory map and upcasts only the indexed curves to float64. Reduced-precision corr.npz is upcast in memory.
+
+    Parameters:
+        folder (str): run folder.
+        deltat (float): time step, t is multiplied by it.
+        mmap (bool): use the converted .npy files if they are there.
+
+    Returns:
+        tuple: t (numpy.ndarray) and corr (numpy.ndarray, numpy.memmap or QuantizedCorr, (kx, ky, t)).
+    """
+    if mmap == True and _npy_current(folder, "corr.npz", ["corr.npy", "corr_t.npy"]):
+        corr = np.load(folder + "/" +  "corr.npy", mmap_mode="r")
+        if corr.dtype == np.int16:
+            corr = QuantizedCorr(corr, np.load(folder + "/" +  "corr_scale.npy"))
+        elif corr.dtype in (np.float32, np.complex64):
+            corr = QuantizedCorr(corr)
+        return np.load(folder + "/" +  "corr_t.npy") * deltat, corr
+    data = cached_load(folder + "/" +  "corr.npz")
+    if "corr_scale" in data or data["corr"].dtype in (np.float32, np.complex64):
+        return data["t"] * deltat, dequantize_corr(data["corr"], data.get("corr_scale"))
+    return data["t"] * deltat, data["corr"]
+
+
+def load_var(folder, mmap=True):
+    """
+    var1, var2 of a run folder, as memory maps if the folder was converted (see load_corr).
+    """
+    if mmap == True and _npy_current(folder, "var.npz", ["var1.npy", "var2.npy"]):
+        return np.load(folder + "/" +  "var1.npy", mmap_mode="r"), np.load(folder + "/" +  "var2.npy", mmap_mode="r")
+    datavar = cached_load(folder + "/" +  "var.npz")
+    return datavar["var1"], datavar["var2"]
+
+
 def closest_element_index(lst, target):
     """
    Find the index of the element in the list with the closest value to the target.
@@ -194,6 +552,47 @@ def q(k, pixelsize=0.00025/720, pixels=540):
     return k * 2 * np.pi / pixelsize / pixels
 
 
+def roi_mask(shape, q_min=None, q_max=None, angle_min=None, angle_max=None, qx_range=None, qy_range=None, mask=None, pixelsize=0.00025/720, pixels=540):
+    """
+    Region of interest in the (kx, ky) grid for full-grid fits, defined in physical units (see q()).
+    All given conditions must hold. Points outside the ROI are not fitted (NaN).
+
+    Parameters:
+        shape (tuple): (kx, ky) shape of the grid, e.g. corr.shape[:2]. kx is in fftfreq order, ky = 0, 1, ...
+        q_min, q_max (float or None): annulus |q| in 1/m.
+        angle_min, angle_max (float or None): angular sector in degrees, measured from the q_parallel axis (0 to 180).
+        qx_range (tuple or None): (min, max) window of q_parallel in 1/m.
+        qy_range (tuple or None): (min, max) window of q_perp in 1/m.
+        mask (numpy.ndarray or None): additional boolean (kx, ky) mask.
+        pixelsize (float, optional): The pixel size, passed to q().
+        pixels (int, optional): The number of pixels, passed to q().
+
+    Returns:
+        numpy.ndarray: boolean (kx, ky) mask, True = fit this point.
+    """
+    qx = q(np.fft.fftfreq(shape[0], 1 / shape[0]), pixelsize=pixelsize, pixels=pixels)[:, None]
+    qy = q(np.arange(shape[1]), pixelsize=pixelsize, pixels=pixels)[None, :]
+    q_abs = np.hypot(qx, qy)
+    angle = np.degrees(np.arctan2(qy, qx))
+
+    roi = np.ones(shape, dtype=bool)
+    if q_min is not None:
+        roi &= q_abs >= q_min
+    if q_max is not None:
+        roi &= q_abs <= q_max
+    if angle_min is not None:
+        roi &= angle >= angle_min
+    if angle_max is not None:
+        roi &= angle <= angle_max
+    if qx_range is not None:
+        roi &= (qx >= qx_range[0]) & (qx <= qx_range[1])
+    if qy_range is not None:
+        roi &= (qy >= qy_range[0]) & (qy <= qy_range[1])
+    if mask is not None:
+        roi &= np.asarray(mask, dtype=bool)
+    return roi
+
+
 
 def extract_mag_field(run_folder):
     """
@@ -231,8 +630,9 @@ def extract_polarizers_config(run_folder):
         return ""
 
 
-def npz_to_csv(path, output_folder="D:/IJS report 4/EE polarizers/Results/"):
-    """convert any npz file to CSV for further analysis. Subarrays whitin files become new arrays"""
+def npz_to_csv(path, output_folder="D:/IJS report 4/EE polarizers/Results/", overwrite=False):
+    """convert any npz file to CSV for further analysis. Subarrays whitin files become new arrays.
+    overwrite = True writes the csv under the name of the npz even if it exists (else a new "_i" name, see filename_update)."""
 
     def flatten_subarrays(data, prefix="", delimiter="_"):
         flat_data = {}
@@ -253,7 +653,7 @@ def npz_to_csv(path, output_folder="D:/IJS report 4/EE polarizers/Results/"):
     # Load npz file
     npz_data = np.load(path, allow_pickle=True)
     output_name = os.path.basename(path)[:-4]
-    output_path = filename_update(output_folder + output_name + ".csv")
+    output_path = output_folder + output_name + ".csv" if overwrite == True else filename_update(output_folder + output_name + ".csv")
 
     # Flatten subarrays (including potential sub-sub arrays) using recursion
     flat_data = flatten_subarrays(npz_data)
@@ -297,7 +697,67 @@ def magnetic_field(hall_voltage_V, ratio=1.27):
 ### FUNCTIONS FOR FITTING ###
 #############################
 
-def fit_corr(corr, t, kx, ky, tolerance=0.0001, init_pars=[100, 1, 0.01, 600, 0.01], bounds=([1, 0, 0, 100, 0], [3000, 1, 1, np.inf, 1]), showplot = False, plotsave=False, overwrite=False, old_return=True, canvas1=False, curr=None, mag_field="", pol_config="", out_folder=None, plotshow=False, cutoff=0.6):
+def _budgeted(func, deadline):
+    # wraps a fit model so that curve_fit stops with a RuntimeError once the wall-clock deadline has passed
+    if deadline is None:
+        return func
+
+    def budgeted_func(t, *pars):
+        if time.perf_counter() > deadline:
+            raise RuntimeError("Fit time budget exceeded.")
+        return func(t, *pars)
+    return budgeted_func
+
+
+def _loglin_fit_exp1(t, y, tail=0.2):
+    """
+    Cheap non-iterative 1-exp estimate (last rung of the fit fallback ladder): y0 is the mean of the last tail of the curve,
+    f and C0 come from a weighted linear fit of log(y - y0) over the decay (weights (y - y0)^2, as for an exponential).
+
+    Returns:
+        tuple: popt [f, C0, y0], pcov (3x3, y0 is not fitted and has zero variance).
+    """
+    t, y = np.asarray(t, dtype=float), np.asarray(y, dtype=float)
+    y0 = np.mean(y[- max(2, int(len(y) * tail)):])
+    amp = y - y0
+    use = amp > 0.1 * amp[0] # the decay, before the curve reaches the noise around y0
+    use &= np.cumprod(use).astype(bool)
+    if amp[0] <= 0 or np.sum(use) < 3:
+        raise RuntimeError("No decay for the log-linear estimate.")
+    coef, cov = np.polyfit(t[use], np.log(amp[use]), 1, w=amp[use], cov="unscaled")
+    res = np.log(amp[use]) - np.polyval(coef, t[use])
+    cov = cov * np.sum((amp[use] * res)**2) / max(np.sum(use) - 2, 1)
+    popt = np.array([- coef[0], np.exp(coef[1]), y0])
+    pcov = np.zeros((3, 3))
+    pcov[0, 0], pcov[1, 1] = cov[0, 0], popt[1]**2 * cov[1, 1]
+    pcov[0, 1] = pcov[1, 0] = - popt[1] * cov[0, 1]
+    return popt, pcov
+
+
+def log_bin_corr(corr, t, points_per_decade=10):
+    """
+    Log-bins correlation curves onto a quasi-logarithmic time grid: the first lags are kept as they are,
+    later ones are averaged in bins whose width grows with the lag (about points_per_decade bins per decade of lag index).
+    A bin mean of counts samples has 1 / counts of the variance of one sample, so binned curves are fitted
+    with weights sqrt(counts) (curve_fit: sigma = 1 / sqrt(counts)).
+
+    Parameters:
+        corr (numpy.ndarray): correlation curve(s), time along the last axis (one curve or (kx, ky, t)).
+        t (numpy.ndarray): 1D array representing the time values.
+        points_per_decade (int): number of bins per decade of lag index.
+
+    Returns:
+        tuple: t_binned (mean time of every bin), corr_binned, counts (number of samples in every bin).
+    """
+    n = len(t)
+    edges = np.unique(np.round(np.logspace(0, np.log10(n + 1), int(np.ceil(np.log10(n + 1) * points_per_decade)) + 1)).astype(int)) - 1
+    counts = np.diff(edges)
+    t_binned = np.add.reduceat(np.asarray(t, dtype=float), edges[:-1]) / counts
+    corr_binned = np.add.reduceat(np.asarray(corr, dtype=float)[..., :n], edges[:-1], axis=-1) / counts
+    return t_binned, corr_binned, counts
+
+
+def fit_corr(corr, t, kx, ky, tolerance=0.0001, init_pars=[100, 1, 0.01, 600, 0.01], bounds=([1, 0, 0, 100, 0], [3000, 1, 1, np.inf, 1]), showplot = False, plotsave=False, overwrite=False, old_return=True, canvas1=False, curr=None, mag_field="", pol_config="", out_folder=None, plotshow=False, cutoff=0.6, backend=None, varpro=False, init_pars1=[10, 1, 0.01], max_nfev=None, time_budget=None, fallback=False, return_path=False, log_bins=None):
     """
     Fits the correlation function in a given (kx, ky) point.
     If the error is large enough (tolerance), fitting with two exponential functions is used.
@@ -322,12 +782,35 @@ def fit_corr(corr, t, kx, ky, tolerance=0.0001, init_pars=[100, 1, 0.01, 600, 0.
         out_folder (str or None): where to save plot
         plotshow (bool): show plot flag
         cutoff (float): where to cutoff fiting
+        backend (str or None): "scipy" (curve_fit) or "numba" (compiled LM kernels), None = FIT_BACKEND (see set_fit_backend)
+        varpro (bool): 2-exp fit by variable projection (only f, f1 are searched, see _varpro_fit_exp2),
+            with the usual curve_fit from init_pars as fallback. Only for the scipy backend.
+        init_pars1 (list): Initial parameter values [f, C0, y0] for the 1-exp fit.
+        max_nfev (int or None): max. number of function evaluations of every curve_fit call (None = scipy default).
+        time_budget (float or None): wall-clock budget (s) of the curve_fit calls in this point, a fit over budget counts as failed.
+        fallback (bool): fallback ladder 1-exp -> 2-exp -> log-linear estimate (_loglin_fit_exp1) -> NaN. If the fits fail
+            (or are unreliable), the cheap log-linear estimate is used instead of NaN.
+        return_path (bool): also return the rung of the ladder that produced the result (one of FIT_PATHS) as the last value.
+        log_bins (int or None): fit the log-binned curve (see log_bin_corr) with this many points per decade, weighted by the bin counts
+            (the numba backend fits the binned curve unweighted). None = all samples up to cutoff.
 
     Returns:
         tuple: A tuple containing the fitC0, fittau(=1/tau), sigmatau, and sigmaC0 values.
     """
     if showplot == True:
         plotshow = True
+    if backend is None:
+        backend = FIT_BACKEND
+    if backend == "numba" and not NUMBA_AVAILABLE:
+        print("numba is not installed, using the scipy fitting backend.")
+        backend = "scipy"
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    budget_kwargs = {} if max_nfev is None else {"maxfev": max_nfev}
+    fit_path = "nan"
+    t_fit, y_fit, sigma_fit = t[:int(len(t) * cutoff)], corr[kx, ky][:int(len(t) * cutoff)], None
+    if log_bins is not None:
+        t_fit, y_fit, counts = log_bin_corr(y_fit, t_fit, log_bins)
+        sigma_fit = 1 / np.sqrt(counts)
     kx_plot = np.fft.fftfreq(len(corr), 1/len(corr))[kx] # sort correctly just for plot label (the whole array is sorted in later steps). Indexing works anyway, because fftfreq [-kx] = - kx.
     twoexp = False
 
@@ -346,25 +829,53 @@ def fit_corr(corr, t, kx, ky, tolerance=0.0001, init_pars=[100, 1, 0.01, 600, 0.
 
     try:
         # try with one exponent:
-        popt, pcov = curve_fit(fit_func, t[:int(len(t) * cutoff)], corr[kx, ky][:int(len(t) * cutoff)], p0=[10, 1, 0.01])
+        if backend == "numba":
+            popt, pcov = _numba_curve_fit(1, t_fit, y_fit, init_pars=init_pars1)
+        else:
+            popt, pcov = curve_fit(_budgeted(fit_func, deadline), t_fit, y_fit, p0=init_pars1, sigma=sigma_fit, **budget_kwargs)
         fitC0, fittau, fity0, sigmatau, sigmaC0, sigmay0 = popt[1], popt[0], popt[2] ,np.sqrt(pcov[0, 0]), np.sqrt(pcov[1, 1]),np.sqrt(pcov[2, 2])
+        fit_path = "1exp"
         # if one-exp fit doesnt work, use two-exp:
 
         if sigmatau / fittau > tolerance:
             twoexp = True
-            popt, pcov = curve_fit(fit_func2, t[:int(len(t) * cutoff)], corr[kx, ky][:int(len(t) * cutoff)],
-                                   p0=init_pars,
-                                   bounds=bounds) # we set initial estimations so that the roles of both exponent terms remain the same.
+            popt1, popt = popt, None
+            if backend == "numba":
+                popt, pcov = _numba_curve_fit(2, t_fit, y_fit, popt1=popt1, init_pars=init_pars, bounds=bounds)
+            elif varpro:
+                try:
+                    popt, pcov, _ = _varpro_fit_exp2(t_fit, y_fit, popt1, bounds, sigma=sigma_fit)
+                except (RuntimeError, ValueError, np.linalg.LinAlgError):
+                    pass # no allowed varpro optimum, use the usual fit below
+            if popt is None:
+                popt, pcov = curve_fit(_budgeted(fit_func2, deadline), t_fit, y_fit,
+                                       p0=init_pars, sigma=sigma_fit,
+                                       bounds=bounds, **budget_kwargs) # we set initial estimations so that the roles of both exponent terms remain the same.
             fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], np.sqrt(pcov[0, 0]), np.sqrt(pcov[1, 1])
             fitC1, fittau2 = popt[2], popt[3] # for initial parameters loop or for corrector
             fity0, sigmay = popt[4], np.sqrt(pcov[4][4])
+            fit_path = "2exp"
 
         if sigmatau / fittau > 1: # tau = 1/tau
             fitC0, fittau, sigmatau, sigmaC0 = np.nan, np.nan, np.nan, np.nan
+            fit_path = "nan"
 
     except:
         #print("Could not perform fit.")
         fitC0, fittau, sigmatau, sigmaC0 = np.nan, np.nan, np.nan, np.nan
+        fit_path = "nan"
+
+    if fallback == True and fit_path == "nan":
+        try:
+            popt, pcov = _loglin_fit_exp1(t_fit, y_fit)
+            twoexp = False
+            fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], np.sqrt(pcov[0, 0]), np.sqrt(pcov[1, 1])
+            fit_path = "loglin"
+            if not sigmatau / fittau <= 1:
+                fitC0, fittau, sigmatau, sigmaC0 = np.nan, np.nan, np.nan, np.nan
+                fit_path = "nan"
+        except (RuntimeError, ValueError, np.linalg.LinAlgError):
+            pass
 
     if plotshow == True or plotsave == True:
         try:
@@ -446,14 +957,15 @@ def fit_corr(corr, t, kx, ky, tolerance=0.0001, init_pars=[100, 1, 0.01, 600, 0.
             except:
                 print("Plotting the correlation function was not possible.")
 
+    path_return = (fit_path,) if return_path == True else ()
     if old_return==True:
-        return fitC0, fittau, sigmatau, sigmaC0 #original
+        return (fitC0, fittau, sigmatau, sigmaC0) + path_return #original
 
     else:
         if twoexp:
-            return fitC0, fittau, sigmatau, sigmaC0, fitC1, fittau2, popt, pcov #original
+            return (fitC0, fittau, sigmatau, sigmaC0, fitC1, fittau2, popt, pcov) + path_return #original
         else:
-            return fitC0, fittau, sigmatau, sigmaC0, popt, pcov  # original
+            return (fitC0, fittau, sigmatau, sigmaC0, popt, pcov) + path_return  # original
 
 
 def plot_fit_from_existing(corr, t, kx, ky, popt, pcov, plotshow, plotsave=False, overwrite=False, out_folder=None, canvas10=False, deriv=False, curr="", mag_field="", pol_config="", cutoff=0.7):
@@ -573,39 +1085,1726 @@ def plot_fit_from_existing(corr, t, kx, ky, popt, pcov, plotshow, plotsave=False
                 dif = np.diff(sign)
                 crossings_plus = np.where((dif == 2) | (dif == 1))[0]
 
-            if len(crossings_plus) == 2:
-                p1, p2 = [np.log10(t)[crossings_plus[0]], grad2[crossings_plus[0]]],  [np.log10(t)[crossings_plus[1]], grad2[crossings_plus[1]]]
-                plt.axvline(x=t[crossings_plus[0]],
-                            label=f"2nd order derivative roots: \n1/t = {round(1 / t[crossings_plus[0]], 1)} 1/s", c="C3",
-                            linestyle="-.")
-                plt.axvline(x=t[crossings_plus[1]], label=f"1/t = {round(1 / t[crossings_plus[1]], 1)} 1/s", c="C3",
-                            linestyle=":")
+            if len(crossings_plus) == 2:
+                p1, p2 = [np.log10(t)[crossings_plus[0]], grad2[crossings_plus[0]]],  [np.log10(t)[crossings_plus[1]], grad2[crossings_plus[1]]]
+                plt.axvline(x=t[crossings_plus[0]],
+                            label=f"2nd order derivative roots: \n1/t = {round(1 / t[crossings_plus[0]], 1)} 1/s", c="C3",
+                            linestyle="-.")
+                plt.axvline(x=t[crossings_plus[1]], label=f"1/t = {round(1 / t[crossings_plus[1]], 1)} 1/s", c="C3",
+                            linestyle=":")
+
+            if len(crossings_plus) == 1:
+                p1 = [np.log10(t)[crossings_plus[0]], grad2[crossings_plus[0]]]
+                plt.axvline(x=t[crossings_plus[0]],
+                            label=f"2nd order derivative roots: \n 1/t = {round(1 / t[crossings_plus[0]], 1)} 1/s", c="C3",
+                            linestyle="-.")
+    except:
+        plt.title("Correlation function")
+
+
+    if plotsave == True:
+        plt.legend()
+        try:
+            save_figure(f"corr_func_fit_{SAMPLE}_{curr}_mA_{round(mag_field,1)}_mT_kx{int(kx_name)}_ky{int(ky)}", overwrite=overwrite, out_folder=out_folder) ###
+        except:
+            save_figure(f"corr_func_fit_{SAMPLE}_000_mA_000_mT_kx{int(kx_name)}_ky{int(ky)}",
+                        overwrite=overwrite, out_folder=out_folder)
+    if plotshow == True:
+        plt.legend()
+        if canvas10:
+            print("plotting fit from ex")
+            canvas1.draw()
+        else:
+            plt.show()
+    else:
+        plt.cla()
+
+####################################
+### NUMBA FITTING KERNELS (FAST) ###
+####################################
+
+# Per-point versions of the fit_corr fits, compiled with numba if it is installed (fit_corr(..., backend="numba")).
+# Parameters: 1-exp p = [f, C0, y0], 2-exp p = [f, C0, C1, f1, y0] (same as popt of fit_func / fit_func2).
+# Like in fit_corr_full, the 2-exp LM runs in u = [log f, C0, C1, log(f1 / f - 3), y0], so f1 / f > 3 always holds.
+
+_NB_FTOL, _NB_XTOL = 1.49012e-8, 1.49012e-8 # curve_fit defaults
+
+
+@njit(cache=True)
+def _nb_cost(model, t, y, p, f1_lower, f1_upper, r):
+    # fills residuals r = y - model(p) and returns the cost, np.inf outside of the allowed region
+    if model == 1:
+        for i in range(len(t)):
+            r[i] = y[i] - (p[1] * np.exp(- p[0] * t[i]) + p[2])
+    else:
+        f = np.exp(p[0])
+        f1 = f * (3 + np.exp(p[3]))
+        if f1 < f1_lower or f1 > f1_upper or not p[2] < p[1]: # bounds on f1 and the C1 < C0 condition of fit_func2
+            return np.inf
+        for i in range(len(t)):
+            r[i] = y[i] - (p[1] * np.exp(- f * t[i]) + p[2] * np.exp(- f1 * t[i]) + p[4])
+    cost = 0.0
+    for i in range(len(t)):
+        cost += r[i] * r[i]
+    if not np.isfinite(cost):
+        return np.inf
+    return cost
+
+
+@njit(cache=True)
+def _nb_jac(model, t, p, J, natural):
+    # jacobian of the model; for model 2 in u (natural=False) or in [f, C0, C1, f1, y0] (natural=True)
+    if model == 1:
+        for i in range(len(t)):
+            e0 = np.exp(- p[0] * t[i])
+            J[i, 0], J[i, 1], J[i, 2] = - p[1] * t[i] * e0, e0, 1.0
+    else:
+        if natural:
+            f, f1 = p[0], p[3]
+        else:
+            f = np.exp(p[0])
+            f1 = f * (3 + np.exp(p[3]))
+        for i in range(len(t)):
+            e0, e1 = np.exp(- f * t[i]), np.exp(- f1 * t[i])
+            df, df1 = - p[1] * t[i] * e0, - p[2] * t[i] * e1
+            J[i, 1], J[i, 2], J[i, 4] = e0, e1, 1.0
+            if natural:
+                J[i, 0], J[i, 3] = df, df1
+            else:
+                J[i, 0] = df * f + df1 * f1
+                J[i, 3] = df1 * f * np.exp(p[3])
+
+
+@njit(cache=True)
+def _nb_solve_spd(A, b):
+    # Cholesky solution of a small symmetric positive definite system, ok=False if A is not positive definite
+    n = len(b)
+    L = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1):
+            s = A[i, j]
+            for k in range(j):
+                s -= L[i, k] * L[j, k]
+            if i == j:
+                if not s > 0:
+                    return np.zeros(n), False
+                L[i, i] = np.sqrt(s)
+            else:
+                L[i, j] = s / L[j, j]
+    x = np.empty(n)
+    for i in range(n):
+        s = b[i]
+        for k in range(i):
+            s -= L[i, k] * x[k]
+        x[i] = s / L[i, i]
+    for i in range(n - 1, -1, -1):
+        s = x[i]
+        for k in range(i + 1, n):
+            s -= L[k, i] * x[k]
+        x[i] = s / L[i, i]
+    return x, True
+
+
+@njit(cache=True)
+def _nb_lm(model, t, y, p0, lower, upper, f1_lower, f1_upper, max_iter):
+    """Levenberg-Marquardt for one curve, same scheme as _batched_lm. Returns popt, cost, n_iter, success."""
+    n_par = len(p0)
+    p = np.minimum(np.maximum(p0.copy(), lower), upper)
+    r, r_new = np.empty(len(t)), np.empty(len(t))
+    J = np.empty((len(t), n_par))
+    cost = _nb_cost(model, t, y, p, f1_lower, f1_upper, r)
+    if not np.isfinite(cost):
+        return p, cost, 0, False
+    lam = 1e-3
+    A, g = np.empty((n_par, n_par)), np.empty(n_par)
+    for it in range(1, max_iter + 1):
+        _nb_jac(model, t, p, J, False)
+        for a in range(n_par):
+            g[a] = 0.0
+            for i in range(len(t)):
+                g[a] += J[i, a] * r[i]
+            for b in range(a + 1):
+                s = 0.0
+                for i in range(len(t)):
+                    s += J[i, a] * J[i, b]
+                A[a, b], A[b, a] = s, s
+        d_max = 0.0
+        for a in range(n_par):
+            d_max = max(d_max, A[a, a])
+        if not (np.isfinite(d_max) and d_max > 0):
+            return p, cost, it, False
+        M = A.copy()
+        for a in range(n_par):
+            # parameters sitting on a bound and pushed outwards are kept fixed in this step
+            if (p[a] <= lower[a] and g[a] < 0) or (p[a] >= upper[a] and g[a] > 0):
+                for b in range(n_par):
+                    M[a, b], M[b, a] = 0.0, 0.0
+                M[a, a], g[a] = 1.0, 0.0
+            else:
+                M[a, a] += lam * max(A[a, a], 1e-12 * d_max)
+        step, ok = _nb_solve_spd(M, g)
+        if not ok:
+            return p, cost, it, False
+        p_new = np.minimum(np.maximum(p + step, lower), upper)
+        cost_new = _nb_cost(model, t, y, p_new, f1_lower, f1_upper, r_new)
+
+        small_step = True
+        for a in range(n_par):
+            if abs(p_new[a] - p[a]) > _NB_XTOL * (abs(p[a]) + _NB_XTOL):
+                small_step = False
+        if cost_new < cost:
+            small_red = cost - cost_new <= _NB_FTOL * cost
+            p, cost = p_new, cost_new
+            r, r_new = r_new, r
+            lam = max(lam / 10, 1e-12)
+        else:
+            small_red = False
+            lam *= 10
+        if small_step or small_red or cost == 0 or lam > 1e16:
+            return p, cost, it, True
+    return p, cost, max_iter, False
+
+
+@njit(cache=True)
+def _nb_pcov(model, t, p, cost, pinv):
+    # covariance as in curve_fit, see _batched_pcov
+    n_par = len(p)
+    pcov = np.full((n_par, n_par), np.inf)
+    if len(t) <= n_par:
+        return pcov
+    J = np.empty((len(t), n_par))
+    _nb_jac(model, t, p, J, True)
+    if not np.all(np.isfinite(J)):
+        return pcov
+    _, s, VT = np.linalg.svd(J, full_matrices=False)
+    threshold = 2.220446049250313e-16 * max(len(t), n_par) * s[0] # machine eps, as in curve_fit
+    pcov[:, :] = 0.0
+    for k in range(n_par):
+        if s[k] > threshold:
+            for a in range(n_par):
+                for b in range(n_par):
+                    pcov[a, b] += VT[k, a] * VT[k, b] / s[k]**2
+        elif not pinv:
+            return np.full((n_par, n_par), np.inf)
+    return pcov * cost / (len(t) - n_par)
+
+
+@njit(cache=True)
+def _nb_exp1_grid_start(t, y, n_grid=64):
+    # see _exp1_grid_start
+    t_min, t_max = np.inf, 0.0
+    for i in range(len(t)):
+        if t[i] > 0:
+            t_min, t_max = min(t_min, t[i]), max(t_max, t[i])
+    f_grid = np.logspace(np.log10(0.1 / t_max), np.log10(10 / t_min), n_grid)
+    y_mean = np.mean(y)
+    best, best_proj2, best_C0, best_e_mean = 0, -1.0, 0.0, 0.0
+    e = np.empty(len(t))
+    for g in range(n_grid):
+        for i in range(len(t)):
+            e[i] = np.exp(- f_grid[g] * t[i])
+        e_mean = np.mean(e)
+        proj, norm2 = 0.0, 0.0
+        for i in range(len(t)):
+            proj += (y[i] - y_mean) * (e[i] - e_mean)
+            norm2 += (e[i] - e_mean)**2
+        if norm2 > 0 and proj**2 / norm2 > best_proj2:
+            best, best_proj2, best_C0, best_e_mean = g, proj**2 / norm2, proj / norm2, e_mean
+    return np.array([f_grid[best], best_C0, y_mean - best_C0 * best_e_mean])
+
+
+@njit(cache=True)
+def _nb_exp2_grid_start(t, y, popt1, lower, upper, n_grid=24):
+    # see _exp2_grid_start
+    ratios = np.array([3.5, 6, 10, 20, 50])
+    t_min, t_max = np.inf, 0.0
+    for i in range(len(t)):
+        if t[i] > 0:
+            t_min, t_max = min(t_min, t[i]), max(t_max, t[i])
+    f_grid = np.logspace(np.log10(max(0.1 / t_max, lower[0])), np.log10(min(10 / t_min, upper[0])), n_grid)
+    X = np.empty((len(t), 3))
+    A, b = np.empty((3, 3)), np.empty(3)
+    p0 = np.empty(5)
+    best_cost = np.inf
+    for f in f_grid:
+        for ratio in ratios:
+            f1 = ratio * f
+            for i in range(len(t)):
+                X[i, 0], X[i, 1], X[i, 2] = np.exp(- f * t[i]), np.exp(- f1 * t[i]), 1.0
+            for a in range(3):
+                b[a] = 0.0
+                for i in range(len(t)):
+                    b[a] += X[i, a] * y[i]
+                for c in range(3):
+                    A[a, c] = 0.0
+                    for i in range(len(t)):
+                        A[a, c] += X[i, a] * X[i, c]
+            coef, ok = _nb_solve_spd(A, b)
+            if not ok:
+                continue
+            cand = np.array([f, coef[0], coef[1], f1, coef[2]])
+            if np.any(cand < lower) or np.any(cand > upper) or not cand[2] < cand[1]:
+                continue
+            cost = 0.0
+            for i in range(len(t)):
+                cost += (y[i] - X[i, 0] * coef[0] - X[i, 1] * coef[1] - coef[2])**2
+            if cost < best_cost:
+                best_cost = cost
+                p0[:] = cand
+    if best_cost == np.inf:
+        # no allowed candidate - start from the 1-exp fit
+        p0[:] = np.minimum(np.maximum(np.array([popt1[0], popt1[1], 0.1 * popt1[1], 10 * popt1[0], popt1[2]]), lower), upper)
+        p0[1] = max(p0[1], 1e-3)
+        p0[2] = min(p0[2], 0.5 * p0[1])
+    return p0
+
+
+@njit(cache=True)
+def _nb_fit_exp1(t, y, p0, max_iter=200):
+    """1-exp fit of one curve from p0 (init_pars1 of fit_corr) and from a grid search start, the better one is kept."""
+    lower, upper = np.full(3, - np.inf), np.full(3, np.inf)
+    p_a, cost_a, _, ok_a = _nb_lm(1, t, y, p0.copy(), lower, upper, - np.inf, np.inf, max_iter)
+    p_b, cost_b, _, ok_b = _nb_lm(1, t, y, _nb_exp1_grid_start(t, y), lower, upper, - np.inf, np.inf, max_iter)
+    if ok_b and (not ok_a or cost_b < cost_a):
+        p_a, cost_a, ok_a = p_b, cost_b, ok_b
+    return p_a, _nb_pcov(1, t, p_a, cost_a, False), ok_a
+
+
+@njit(cache=True)
+def _nb_fit_exp2(t, y, popt1, init_pars, lower, upper, max_iter=200):
+    """2-exp fit of one curve from init_pars (if allowed) and from a grid search start, the better one is kept."""
+    lower_u = np.array([np.log(max(lower[0], 1e-300)), lower[1], lower[2], - np.inf, lower[4]])
+    upper_u = np.array([np.log(upper[0]), upper[1], upper[2], np.inf, upper[4]])
+    best_p, best_cost, best_ok = np.full(5, np.nan), np.inf, False
+    for start in range(2):
+        p0 = init_pars.copy() if start == 0 else _nb_exp2_grid_start(t, y, popt1, lower, upper)
+        if not (p0[0] > 0 and p0[3] / p0[0] > 3):
+            continue
+        u0 = p0.copy()
+        u0[0], u0[3] = np.log(p0[0]), np.log(p0[3] / p0[0] - 3)
+        u, cost, _, ok = _nb_lm(2, t, y, u0, lower_u, upper_u, lower[3], upper[3], max_iter)
+        if ok and cost < best_cost:
+            best_p, best_cost, best_ok = u.copy(), cost, True
+            best_p[0] = np.exp(u[0])
+            best_p[3] = best_p[0] * (3 + np.exp(u[3]))
+    if not best_ok:
+        return best_p, np.full((5, 5), np.nan), False
+    return best_p, _nb_pcov(2, t, best_p, best_cost, True), True
+
+
+
+def _numba_curve_fit(model, t, y, popt1=None, init_pars=None, bounds=None):
+    """
+    Drop-in for the two curve_fit calls in fit_corr (model 1: fit_func, model 2: fit_func2), using the numba kernels.
+    Like curve_fit, it raises a RuntimeError if the fit does not converge.
+    """
+    t, y = np.ascontiguousarray(t, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64)
+    if not (np.all(np.isfinite(t)) and np.all(np.isfinite(y))):
+        raise ValueError("array must not contain infs or NaNs")
+    if model == 1:
+        p0 = [10, 1, 0.01] if init_pars is None else init_pars
+        popt, pcov, ok = _nb_fit_exp1(t, y, np.asarray(p0, dtype=np.float64))
+    else:
+        popt, pcov, ok = _nb_fit_exp2(t, y, np.asarray(popt1, dtype=np.float64), np.asarray(init_pars, dtype=np.float64),
+                                      np.asarray(bounds[0], dtype=np.float64), np.asarray(bounds[1], dtype=np.float64))
+    if not ok:
+        raise RuntimeError("Optimal parameters not found.")
+    return popt, pcov
+
+#######################################
+### FUNCTIONS FOR FULL-GRID FITTING ###
+#######################################
+
+# Vectorized versions of fit_func (1-exp) and fit_func2 (2-exp) from fit_corr.
+# Parameters are stacked row-wise, p.shape = (points, parameters):
+#   1-exp: [f, C0, y0]
+#   2-exp: [f, C0, C1, f1, y0]
+
+def _exp1_model(t, p):
+    return p[:, 1, None] * np.exp(- p[:, 0, None] * t) + p[:, 2, None]
+
+
+def _exp1_jac(t, p):
+    e0 = np.exp(- p[:, 0, None] * t)
+    return np.stack((- p[:, 1, None] * t * e0, e0, np.ones_like(e0)), axis=-1)
+
+
+def _exp2_model(t, p):
+    return p[:, 1, None] * np.exp(- p[:, 0, None] * t) + p[:, 2, None] * np.exp(- p[:, 3, None] * t) + p[:, 4, None]
+
+
+def _exp2_jac(t, p):
+    e0 = np.exp(- p[:, 0, None] * t)
+    e1 = np.exp(- p[:, 3, None] * t)
+    return np.stack((- p[:, 1, None] * t * e0, e0, e1, - p[:, 2, None] * t * e1, np.ones_like(e0)), axis=-1)
+
+
+# The 2-exp fit itself runs in u = [log f, C0, C1, log(f1 / f - 3), y0], where f1 / f > 3 always holds.
+def _exp2_to_u(p):
+    u = np.array(p, dtype=float)
+    u[:, 0] = np.log(p[:, 0])
+    u[:, 3] = np.log(p[:, 3] / p[:, 0] - 3)
+    return u
+
+
+def _exp2_from_u(u):
+    p = np.array(u, dtype=float)
+    with np.errstate(over="ignore"):
+        p[:, 0] = np.exp(u[:, 0])
+        p[:, 3] = p[:, 0] * (3 + np.exp(u[:, 3]))
+    return p
+
+
+def _exp2u_model(t, u):
+    return _exp2_model(t, _exp2_from_u(u))
+
+
+def _exp2u_jac(t, u):
+    p = _exp2_from_u(u)
+    J = _exp2_jac(t, p)
+    Ju = J.copy()
+    Ju[:, :, 0] = J[:, :, 0] * p[:, None, 0] + J[:, :, 3] * p[:, None, 3]
+    Ju[:, :, 3] = J[:, :, 3] * (p[:, 0] * np.exp(u[:, 3]))[:, None]
+    return Ju
+
+
+def _exp2_feasible(p):
+    # same conditions as in fit_func2 - outside of them the model "returns np.inf"
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (p[:, 0] < p[:, 3]) & (p[:, 2] < p[:, 1]) & (p[:, 3] / p[:, 0] > 3)
+
+
+def _exp1_grid_start(t, y, n_grid=64, f_min=None, f_max=None):
+    """
+    Robust starting parameters [f, C0, y0] for the 1-exp fit of many curves (dictionary matching).
+    For each rate f on a log grid (by default spanning the measured time window) C0 and y0 follow from linear least squares,
+    the f with the smallest residual is taken and refined by a parabola through its neighbours.
+    All curves are matched against the whole grid with one matrix product.
+    """
+    t_pos = t[t > 0]
+    f_min = 0.1 / t_pos[-1] if f_min is None else f_min
+    f_max = 10 / t_pos[0] if f_max is None else f_max
+    log_f = np.linspace(np.log(f_min), np.log(f_max), n_grid)
+    e = np.exp(- np.exp(log_f)[:, None] * t)
+    e_c = e - np.mean(e, axis=1, keepdims=True)
+    e_norm = np.sqrt(np.sum(e_c**2, axis=1))
+    y_c = y - np.mean(y, axis=1, keepdims=True)
+    proj2 = (y_c @ (e_c / e_norm[:, None]).T)**2 # (points, grid), explained variance of each rate
+    best = np.clip(np.argmax(proj2, axis=1), 1, n_grid - 2)
+
+    rows = np.arange(len(y))
+    left, mid, right = proj2[rows, best - 1], proj2[rows, best], proj2[rows, best + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.clip(0.5 * (left - right) / (left - 2 * mid + right), -0.5, 0.5)
+    f = np.exp(log_f[best] + np.nan_to_num(shift) * (log_f[1] - log_f[0]))
+
+    e_best = np.exp(- f[:, None] * t)
+    e_best_c = e_best - np.mean(e_best, axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        C0 = np.sum(y_c * e_best_c, axis=1) / np.sum(e_best_c**2, axis=1)
+    y0 = np.mean(y, axis=1) - C0 * np.mean(e_best, axis=1)
+    return np.stack((f, C0, y0), axis=-1)
+
+
+def _exp2_grid_start(t, y, popt1, lower, upper, n_grid=24, ratios=(3.5, 6, 10, 20, 50)):
+    """
+    Starting parameters [f, C0, C1, f1, y0] for the 2-exp fit of many curves, same idea as _exp1_grid_start:
+    for each (f, f1 = ratio * f) on a grid C0, C1 and y0 follow from linear least squares,
+    the best candidate that satisfies the bounds and the fit_func2 conditions is taken.
+    Points without such a candidate start from their 1-exp parameters popt1.
+    """
+    t_pos = t[t > 0]
+    f_grid = np.logspace(np.log10(max(0.1 / t_pos[-1], lower[0])), np.log10(min(10 / t_pos[0], upper[0])), n_grid)
+    ff, rr = np.meshgrid(f_grid, ratios, indexing="ij")
+    ff, ff1 = ff.ravel(), (ff * rr).ravel()
+    X = np.stack((np.exp(- ff[:, None] * t), np.exp(- ff1[:, None] * t), np.ones((len(ff), len(t)))), axis=-1) # (grid, t, 3)
+    coef = np.einsum("gkt,nt->ngk", np.linalg.pinv(X), y) # (points, grid, [C0, C1, y0])
+    cost = np.sum(y**2, axis=1)[:, None] - np.einsum("ngk,gtk,nt->ng", coef, X, y)
+
+    cand = np.empty(coef.shape[:2] + (5,))
+    cand[..., 0], cand[..., 1], cand[..., 2], cand[..., 3], cand[..., 4] = ff, coef[..., 0], coef[..., 1], ff1, coef[..., 2]
+    allowed = np.all((cand >= lower) & (cand <= upper), axis=-1) & _exp2_feasible(cand.reshape(-1, 5)).reshape(cost.shape)
+    cost[~allowed] = np.inf
+    best = np.argmin(cost, axis=1)
+    p0 = cand[np.arange(len(y)), best]
+
+    # no allowed candidate - start from the 1-exp fit, with a small and 10x faster second exponent
+    none = ~np.any(allowed, axis=1)
+    if np.any(none):
+        f, C0, y0 = popt1[none, 0], popt1[none, 1], popt1[none, 2]
+        p0[none] = np.clip(np.stack((f, C0, 0.1 * C0, 10 * f, y0), axis=-1), lower, upper)
+        p0[none, 1] = np.maximum(p0[none, 1], 1e-3)
+        p0[none, 2] = np.minimum(p0[none, 2], 0.5 * p0[none, 1])
+    return p0
+
+
+def _batched_lm(model, jac, t, y, p0, lower=None, upper=None, feasible=None, max_iter=200, ftol=1.49012e-8, xtol=1.49012e-8):
+    """
+    Levenberg-Marquardt least squares for many independent curves at once.
+    Every row of y is fitted with its own parameters, damping factor and convergence state,
+    all linear algebra is done on stacked (points, parameters) arrays.
+    Bounds are handled by projecting each step onto the box, infeasible steps
+    (feasible(p) == False) are rejected like any step that increases the cost.
+
+    Parameters:
+        model, jac (callable): vectorized model and its analytic jacobian, see _exp1_model / _exp1_jac.
+        t (numpy.ndarray): 1D array of time values, shared by all curves.
+        y (numpy.ndarray): 2D array (points, len(t)) of data.
+        p0 (numpy.ndarray): 2D array (points, parameters) of initial parameters.
+        lower, upper (array-like or None): parameter bounds.
+        feasible (callable or None): returns a bool array of allowed parameter rows.
+        max_iter (int): max. number of LM iterations per point.
+        ftol, xtol (float): relative tolerances on cost reduction and step size (as in curve_fit).
+
+    Returns:
+        tuple: popt (points, parameters), cost (points,), n_iter (points,), success (points,)
+    """
+    n_par = p0.shape[1]
+    p = np.array(p0, dtype=float)
+    if lower is not None:
+        lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+        p = np.clip(p, lower, upper)
+
+    def cost_of(idx, pp):
+        with np.errstate(over="ignore", invalid="ignore"):
+            c = np.sum((y[idx] - model(t, pp))**2, axis=1)
+        bad = ~np.isfinite(c)
+        if feasible is not None:
+            bad |= ~feasible(pp)
+        c[bad] = np.inf
+        return c
+
+    cost = cost_of(np.arange(len(p)), p)
+    lam = np.full(len(p), 1e-3)
+    n_iter = np.zeros(len(p), dtype=int)
+    success = np.zeros(len(p), dtype=bool)
+    active = np.isfinite(cost) # infeasible starting points are failed fits
+    eye = np.eye(n_par)
+
+    for _ in range(max_iter):
+        idx = np.nonzero(active)[0]
+        if len(idx) == 0:
+            break
+        pp = p[idx]
+        with np.errstate(over="ignore", invalid="ignore"):
+            r = y[idx] - model(t, pp)
+            J = jac(t, pp)
+            JTJ = np.einsum("nij,nik->njk", J, J)
+            g = np.einsum("nij,ni->nj", J, r)
+        diag = np.einsum("njj->nj", JTJ)
+        diag = np.maximum(diag, 1e-12 * np.max(diag, axis=1, keepdims=True))
+
+        broken = ~(np.all(np.isfinite(JTJ), axis=(1, 2)) & np.all(np.isfinite(g), axis=1) & np.all(diag > 0, axis=1))
+        if np.any(broken):
+            active[idx[broken]] = False
+            idx, pp, JTJ, g, diag = idx[~broken], pp[~broken], JTJ[~broken], g[~broken], diag[~broken]
+            if len(idx) == 0:
+                break
+
+        if lower is not None:
+            # parameters sitting on a bound and pushed outwards are kept fixed in this step
+            fixed = ((pp <= lower) & (g < 0)) | ((pp >= upper) & (g > 0))
+            JTJ = np.where(fixed[:, :, None] | fixed[:, None, :], 0, JTJ)
+            g = np.where(fixed, 0, g)
+            diag = np.where(fixed, 1, diag)
+        A = JTJ + lam[idx, None, None] * diag[:, :, None] * eye
+        step = np.linalg.solve(A, g[..., None])[..., 0]
+        p_new = pp + step
+        if lower is not None:
+            p_new = np.clip(p_new, lower, upper)
+        step = p_new - pp
+
+        c_old = cost[idx]
+        c_new = cost_of(idx, p_new)
+        better = c_new < c_old
+
+        p[idx[better]] = p_new[better]
+        cost[idx[better]] = c_new[better]
+        lam[idx] = np.where(better, np.maximum(lam[idx] / 10, 1e-12), lam[idx] * 10)
+        n_iter[idx] += 1
+
+        small_step = np.all(np.abs(step) <= xtol * (np.abs(pp) + xtol), axis=1)
+        small_red = better & (c_old - c_new <= ftol * c_old)
+        converged = small_step | small_red | (cost[idx] == 0) | (lam[idx] > 1e16)
+        success[idx[converged]] = True
+        active[idx[converged]] = False
+
+    return p, cost, n_iter, success
+
+
+def _batched_pcov(jac, t, p, cost, n_data, pinv=True):
+    """
+    Covariance matrices in the same way curve_fit estimates them (absolute_sigma=False):
+    (J^T J)^-1 * cost / (n_data - parameters).
+    With pinv=True (bounded/trf fits) zero singular values are discarded (Moore-Penrose),
+    with pinv=False (unbounded/lm fits) a rank deficient jacobian gives an infinite covariance.
+    """
+    n_pts, n_par = p.shape
+    pcov = np.full((n_pts, n_par, n_par), np.inf)
+    with np.errstate(over="ignore", invalid="ignore"):
+        J = jac(t, p)
+    ok = np.all(np.isfinite(J), axis=(1, 2)) & np.isfinite(cost)
+    if n_data <= n_par or not np.any(ok):
+        return pcov
+
+    _, s, VT = np.linalg.svd(J[ok], full_matrices=False)
+    threshold = np.finfo(float).eps * max(n_data, n_par) * s[:, :1]
+    keep = s > threshold
+    with np.errstate(divide="ignore", over="ignore"):
+        inv_s2 = np.where(keep, 1 / s**2, 0)
+    cov = np.einsum("nki,nk,nkj->nij", VT, inv_s2, VT) * (cost[ok] / (n_data - n_par))[:, None, None]
+    if not pinv:
+        cov[~np.all(keep, axis=1)] = np.inf
+    pcov[ok] = cov
+    return pcov
+
+
+def _pack_popt_pcov(popt_list, pcov_list, shape):
+    """Pack per-point popt/pcov arrays (3 or 5 parameters) into 2D object arrays, as stored in popt_pcov_2D_tol*.npz."""
+    popt_2D, pcov_2D = np.empty(shape, dtype=object), np.empty(shape, dtype=object)
+    for i, (popt, pcov) in enumerate(zip(popt_list, pcov_list)):
+        popt_2D.flat[i], pcov_2D.flat[i] = popt, pcov
+    return popt_2D, pcov_2D
+
+
+def _continuation_shells(shape, shell_width=1.0, kx_values=None):
+    """
+    Flat indices of the (kx, ky) grid, split into shells of |k| of width shell_width, from low |k| outwards.
+    kx_values are the kx of the rows (None = the whole grid in fftfreq order).
+    """
+    kx = np.fft.fftfreq(shape[0], 1 / shape[0]) if kx_values is None else np.asarray(kx_values, dtype=float)
+    k = np.hypot(kx[:, None], np.arange(shape[1])[None, :]).ravel()
+    shell = np.floor(k / shell_width).astype(int)
+    order = np.argsort(shell, kind="stable")
+    return np.split(order, np.nonzero(np.diff(shell[order]))[0] + 1)
+
+
+def _grid_neighbours(shape, kx_values=None):
+    """
+    (points, 8) flat indices of the 8 neighbours of every (kx, ky) point, -1 outside of the grid.
+    kx_values are the kx of the rows (None = the whole grid in fftfreq order), rows are neighbours if their kx differ by 1.
+    """
+    kx_val = np.fft.fftfreq(shape[0], 1 / shape[0]) if kx_values is None else np.asarray(kx_values, dtype=float)
+    kx, ky = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    neighbours = []
+    for dx in [-1, 0, 1]:
+        for dy in [-1, 0, 1]:
+            if dx == 0 and dy == 0:
+                continue
+            nx, ny = (kx + dx) % shape[0], ky + dy
+            inside = (ny >= 0) & (ny < shape[1]) & (np.abs(kx_val[nx] - kx_val[kx]) <= 1) # no jump over the +-kx edge
+            neighbours.append(np.where(inside, nx * shape[1] + ny, -1).ravel())
+    return np.stack(neighbours, axis=-1)
+
+
+def _neighbour_start(popt_all, neighbours, p0, log_cols=(0,)):
+    """
+    Starting parameters from the converged fits of the neighbours: mean of every parameter,
+    geometric mean for the rates (log_cols, f for the 1-exp and f, f1 for the 2-exp model).
+    Rows without any converged neighbour keep p0.
+    """
+    log_cols = list(log_cols)
+    seeds = popt_all[neighbours] # (points, 8, parameters), NaN = not fitted (yet)
+    seeds[neighbours < 0] = np.nan
+    have = np.all(np.isfinite(seeds), axis=-1)
+    count = np.sum(have, axis=1)
+    p0 = np.array(p0, dtype=float)
+    use = count > 0
+    if np.any(use):
+        seeds = np.where(have[..., None], seeds, 1)
+        seeds[..., log_cols] = np.log(seeds[..., log_cols])
+        mean = np.sum(np.where(have[..., None], seeds, 0)[use], axis=1) / count[use, None]
+        mean[:, log_cols] = np.exp(mean[:, log_cols])
+        p0[use] = mean
+    return p0
+
+
+def _weighted(func, w, jac=False):
+    # residual weights w (1D, over t) applied to a vectorized model (points, t) or jacobian (points, t, parameters)
+    w = w[:, None] if jac else w
+    return lambda t, p: func(t, p) * w
+
+
+def fit_corr_full(corr, t, tolerance=0.0001, init_pars=None, bounds=([1, 0, 0, 100, 0], [3000, 1, 1, np.inf, 1]), init_pars1=None, cutoff=0.6, max_iter=200, chunk_size=2048, continuation=False, shell_width=1.0, kx_values=None, mask=None, single_exp=None, fallback=False, log_bins=None, dual=False):
+    """
+    Fits the correlation functions in ALL (kx, ky) points at once.
+    Same models and the same decision logic as fit_corr (1-exp fit, 2-exp fit if sigmatau / fittau > tolerance,
+    NaN if sigmatau / fittau > 1), but solved with a batched Levenberg-Marquardt on numpy arrays
+    with analytic jacobians instead of one curve_fit call per point.
+    By default every point gets its own starting parameters from a cheap grid search, so the LM
+    usually needs only a few iterations (and does not run into the f -> 0 solutions a fixed start can give).
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        tolerance (float): The tolerance sigmatau / fittau where 2-exp fit should be used.
+        init_pars (list or None): Initial parameter values for the 2-exp fit (as in fit_corr, e.g. [100, 1, 0.01, 600, 0.01]).
+            If None, a start is found for every point from a grid search over f, f1 (see _exp2_grid_start).
+        bounds (tuple): Bounds for the 2-exp fit parameters.
+        init_pars1 (list, numpy.ndarray or None): Initial parameters [f, C0, y0] for the 1-exp fit,
+            either one list for all points or an array of shape (kx, ky, 3).
+            If None, a start is found for every point by dictionary matching over f (as in preview_tau_map).
+        cutoff (float): where to cutoff fitting.
+        max_iter (int): max. number of LM iterations per point and model.
+        chunk_size (int): number of points fitted together (limits memory use).
+        continuation (bool): continuation mode - the grid is fitted in shells of |k| from low |k| outwards,
+            every point starts from the already converged 1-exp fits of its neighbours
+            (points without converged neighbours use init_pars1 / dictionary matching).
+        shell_width (float): width of the |k| shells (in k units) in continuation mode.
+        kx_values (numpy.ndarray or None): kx of the rows of corr in continuation mode, for a part of the grid
+            (kx row chunks, see fit_corr_full_parallel) or a folded grid (see fit_corr_symmetric). None = the whole grid in fftfreq order.
+        mask (numpy.ndarray or None): boolean (kx, ky) region of interest (see roi_mask), points outside are not fitted (NaN).
+        single_exp (numpy.ndarray or None): boolean (kx, ky), True = only the 1-exp fit in this point (see snr_prefilter).
+        fallback (bool): points where the fits fail (or are unreliable) get the log-linear estimate (as in fit_corr) instead of NaN.
+        log_bins (int or None): fit log-binned curves (see log_bin_corr) with this many points per decade, weighted by the bin counts.
+        dual (bool): fit the 2-exp model in every point (not only where the tolerance asks for it) and also return both raw fits,
+            popt1_array, pcov1_array, ok1_array (1-exp) and popt2_array, pcov2_array, ok2_array (2-exp), so that the tolerance
+            can be chosen afterwards (see select_by_tolerance, save_dual_fit). The usual arrays still follow tolerance.
+
+    Returns:
+        dict: fit result with the same keys as fit_full_tol*.npz and popt_pcov_2D_tol*.npz files:
+            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array, popt_2D, pcov_2D,
+            and additionally twoexp_array (bool, which model was used), n_iter_array (LM iterations)
+            and fit_path_array (index into FIT_PATHS of the rung that produced every result).
+    """
+    corr = np.asarray(corr)
+    shape = corr.shape[:2]
+    n = int(len(t) * cutoff)
+    t_fit = np.asarray(t[:n], dtype=float)
+    y_all = np.asarray(corr.reshape(-1, corr.shape[-1])[:, :n], dtype=float)
+    n_pts = len(y_all)
+    exp1_model, exp1_jac, exp2u_model, exp2u_jac, exp2_jac = _exp1_model, _exp1_jac, _exp2u_model, _exp2u_jac, _exp2_jac
+    w_fit = 1
+    if log_bins is not None: # same bins for all curves, so the weights can go into the models
+        t_fit, y_all, counts = log_bin_corr(y_all, t_fit, log_bins)
+        n, w_fit = len(t_fit), np.sqrt(counts)
+        exp1_model, exp2u_model = _weighted(_exp1_model, w_fit), _weighted(_exp2u_model, w_fit)
+        exp1_jac, exp2u_jac, exp2_jac = _weighted(_exp1_jac, w_fit, jac=True), _weighted(_exp2u_jac, w_fit, jac=True), _weighted(_exp2_jac, w_fit, jac=True)
+
+    if init_pars1 is not None:
+        p0_1 = np.broadcast_to(np.asarray(init_pars1, dtype=float), shape + (3,)).reshape(-1, 3)
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    # 2-exp bounds in the u parameters of _exp2_to_u (f1 is checked in feasible_u):
+    lower_u = np.array([np.log(max(lower[0], 1e-300)), lower[1], lower[2], -np.inf, lower[4]])
+    upper_u = np.array([np.log(upper[0]), upper[1], upper[2], np.inf, upper[4]])
+
+    def feasible_u(u):
+        p = _exp2_from_u(u)
+        return (p[:, 3] >= lower[3]) & (p[:, 3] <= upper[3]) & (p[:, 2] < p[:, 1])
+
+    fit_C0, fit_tau = np.full(n_pts, np.nan), np.full(n_pts, np.nan)
+    sigma_C0, sigma_tau = np.full(n_pts, np.nan), np.full(n_pts, np.nan)
+    twoexp = np.zeros(n_pts, dtype=bool)
+    n_iter = np.zeros(n_pts, dtype=int)
+    popt_list, pcov_list = [np.full(3, np.nan) for _ in range(n_pts)], [np.full((3, 3), np.nan) for _ in range(n_pts)]
+    if dual:
+        dual_arrays = {"popt1_array": np.full((n_pts, 3), np.nan), "pcov1_array": np.full((n_pts, 3, 3), np.nan), "ok1_array": np.zeros(n_pts, dtype=bool),
+                       "popt2_array": np.full((n_pts, 5), np.nan), "pcov2_array": np.full((n_pts, 5, 5), np.nan), "ok2_array": np.zeros(n_pts, dtype=bool)}
+    inside = np.ones(n_pts, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).ravel()
+    only1 = np.zeros(n_pts, dtype=bool) if single_exp is None else np.asarray(single_exp, dtype=bool).ravel()
+
+    if continuation:
+        shells = [shell[inside[shell]] for shell in _continuation_shells(shape, shell_width, kx_values)]
+        groups = [shell[i:i + chunk_size] for shell in shells for i in range(0, len(shell), chunk_size)]
+        neighbours = _grid_neighbours(shape, kx_values)
+        popt1_all, popt2_all = np.full((n_pts, 3), np.nan), np.full((n_pts, 5), np.nan) # converged fits, seeds for the next shells
+    else:
+        points = np.nonzero(inside)[0]
+        groups = [points[start:start + chunk_size] for start in range(0, len(points), chunk_size)]
+
+    for sl in groups:
+        y = y_all[sl]
+        valid = np.all(np.isfinite(y), axis=1) # curve_fit raises on NaN data
+
+        # try with one exponent:
+        p0 = p0_1[sl] if init_pars1 is not None else _exp1_grid_start(t_fit, np.nan_to_num(y))
+        if continuation:
+            p0 = _neighbour_start(popt1_all, neighbours[sl], p0)
+        popt1, cost1, it1, ok1 = _batched_lm(exp1_model, exp1_jac, t_fit, y * w_fit, p0, max_iter=max_iter)
+        pcov1 = _batched_pcov(exp1_jac, t_fit, popt1, cost1, n, pinv=False)
+        ok1 &= valid
+        if continuation:
+            seed = ok1 & (popt1[:, 0] > 0)
+            popt1_all[sl[seed]] = popt1[seed]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio1 = np.sqrt(pcov1[:, 0, 0]) / popt1[:, 0]
+        n_iter[sl] = it1
+
+        # if one-exp fit doesnt work, use two-exp:
+        need2 = ok1 & (ratio1 > tolerance) & ~only1[sl]
+        try2 = need2 | (dual & ok1 & ~only1[sl]) # dual: the 2-exp fit is stored for every point
+        popt2, pcov2 = np.full((len(sl), 5), np.nan), np.full((len(sl), 5, 5), np.nan)
+        ok2 = np.zeros(len(sl), dtype=bool)
+        if np.any(try2):
+            i2 = np.nonzero(try2)[0]
+            if init_pars is not None:
+                p0 = np.tile(np.asarray(init_pars, dtype=float), (len(i2), 1))
+            else:
+                p0 = _exp2_grid_start(t_fit, y[i2], popt1[i2], lower, upper)
+            if continuation:
+                p0 = _neighbour_start(popt2_all, neighbours[sl[i2]], p0, log_cols=(0, 3))
+                p0[:, 3] = np.maximum(p0[:, 3], 3 * (1 + 1e-6) * p0[:, 0]) # keep f1 / f > 3 after averaging
+            u2, cost2, it2, ok2[i2] = _batched_lm(exp2u_model, exp2u_jac, t_fit, y[i2] * w_fit, _exp2_to_u(p0), lower=lower_u, upper=upper_u, feasible=feasible_u, max_iter=max_iter)
+            p2 = _exp2_from_u(u2)
+            popt2[i2], pcov2[i2] = p2, _batched_pcov(exp2_jac, t_fit, p2, cost2, n, pinv=True)
+            n_iter[sl[i2]] += it2
+            if continuation:
+                popt2_all[sl[i2[ok2[i2]]]] = p2[ok2[i2]]
+        if dual:
+            for key, value in zip(["popt1_array", "pcov1_array", "ok1_array", "popt2_array", "pcov2_array", "ok2_array"], [popt1, pcov1, ok1, popt2, pcov2, ok2]):
+                dual_arrays[key][sl] = value
+
+        for j, k in enumerate(sl):
+            if need2[j]:
+                twoexp[k] = True
+                popt, pcov, ok = popt2[j], pcov2[j], ok2[j]
+            else:
+                popt, pcov, ok = popt1[j], pcov1[j], ok1[j]
+            popt_list[k], pcov_list[k] = (popt, pcov) if ok else (np.full(len(popt), np.nan), np.full(pcov.shape, np.nan))
+            if ok:
+                fit_C0[k], fit_tau[k], sigma_tau[k], sigma_C0[k] = popt[1], popt[0], np.sqrt(pcov[0, 0]), np.sqrt(pcov[1, 1])
+
+    # unreliable fits (tau = 1/tau):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unreliable = sigma_tau / fit_tau > 1
+    fit_C0[unreliable], fit_tau[unreliable], sigma_tau[unreliable], sigma_C0[unreliable] = np.nan, np.nan, np.nan, np.nan
+    fit_path = np.where(twoexp, FIT_PATHS.index("2exp"), FIT_PATHS.index("1exp")).astype(np.int8)
+    fit_path[np.isnan(fit_tau)] = FIT_PATHS.index("nan")
+
+    if fallback == True:
+        for k in np.nonzero(inside & np.isnan(fit_tau))[0]:
+            try:
+                popt, pcov = _loglin_fit_exp1(t_fit, y_all[k])
+            except (RuntimeError, ValueError, np.linalg.LinAlgError):
+                continue
+            if np.sqrt(pcov[0, 0]) / popt[0] <= 1:
+                fit_C0[k], fit_tau[k], sigma_tau[k], sigma_C0[k] = popt[1], popt[0], np.sqrt(pcov[0, 0]), np.sqrt(pcov[1, 1])
+                popt_list[k], pcov_list[k], twoexp[k] = popt, pcov, False
+                fit_path[k] = FIT_PATHS.index("loglin")
+    if continuation:
+        print(f"Continuation fit: {np.mean(n_iter[inside]):.1f} LM iterations per point on average, {np.sum(n_iter)} in total.")
+
+    popt_2D, pcov_2D = _pack_popt_pcov(popt_list, pcov_list, shape)
+    fit_result = {"fit_C0_array": fit_C0.reshape(shape),
+                  "fit_tau_array": fit_tau.reshape(shape),
+                  "sigma_C0_array": sigma_C0.reshape(shape),
+                  "sigma_tau_array": sigma_tau.reshape(shape),
+                  "popt_2D": popt_2D,
+                  "pcov_2D": pcov_2D,
+                  "twoexp_array": twoexp.reshape(shape),
+                  "n_iter_array": n_iter.reshape(shape),
+                  "fit_path_array": fit_path.reshape(shape)}
+    if dual:
+        fit_result.update({key: value.reshape(shape + value.shape[1:]) for key, value in dual_arrays.items()})
+    return fit_result
+
+
+def _varpro_fit_exp2(t, y, popt1, bounds, sigma=None):
+    """
+    2-exp fit (fit_func2) by variable projection: C0, C1 and y0 enter linearly and are solved in closed form
+    (bounded linear least squares if needed) for every (f, f1), least_squares only searches v = [log f, log(f1 / f - 3)] (so f1 / f > 3 always holds).
+    The start comes from a grid search (see _exp2_grid_start), popt1 ([f, C0, y0] of the 1-exp fit) is its fallback.
+    C1 <= C0 is built into the linear part, so (as the infimum curve_fit approaches) C1 = C0 is allowed.
+    pcov is the full 5x5 covariance of [f, C0, C1, f1, y0], estimated as in curve_fit.
+    Like curve_fit, it raises a RuntimeError if no optimum inside the bounds is found.
+    sigma (None or 1D array) weights the residuals as in curve_fit (absolute_sigma=False).
+
+    Returns:
+        tuple: popt, pcov, number of residual evaluations
+    """
+    t, y = np.asarray(t, dtype=float), np.asarray(y, dtype=float)
+    w = np.ones_like(t) if sigma is None else 1 / np.asarray(sigma, dtype=float)
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    lin_lower, lin_upper = np.array([0, lower[2], lower[4]]), np.array([np.inf, upper[2], upper[4]])
+
+    def project(v):
+        f = np.exp(v[0])
+        f1 = f * (3 + np.exp(v[1]))
+        # linear part written as (C0 - C1) * e0 + C1 * (e0 + e1) + y0, so C1 <= C0 is a simple bound
+        e0 = np.exp(- f * t)
+        X = np.stack((e0, e0 + np.exp(- f1 * t), np.ones_like(t)), axis=-1) * w[:, None]
+        coef = np.linalg.lstsq(X, y * w, rcond=None)[0]
+        if np.any(coef < lin_lower) or np.any(coef > lin_upper): # out of bounds - bounded linear least squares
+            coef = lsq_linear(X, y * w, bounds=(lin_lower, lin_upper), method="bvls").x
+        return np.array([f, coef[0] + coef[1], coef[1], f1, coef[2]]), X @ coef - y * w
+
+    p0 = _exp2_grid_start(t, y[None], np.asarray(popt1, dtype=float)[None], lower, upper)[0]
+    v_lower, v_upper = [np.log(max(lower[0], 1e-300)), - np.inf], [np.log(upper[0]), np.inf]
+    v0 = np.clip([np.log(p0[0]), np.log(p0[3] / p0[0] - 3)], v_lower, v_upper)
+    res = least_squares(lambda v: project(v)[1], v0, bounds=(v_lower, v_upper))
+    popt, residuals = project(res.x)
+    if not res.success or np.any(popt < lower) or np.any(popt > upper): # C1 <= C0 holds by construction
+        raise RuntimeError("Optimal parameters not found.")
+
+    pcov = _batched_pcov(_weighted(_exp2_jac, w, jac=True), t, popt[None], np.array([np.sum(residuals**2)]), len(t), pinv=True)[0]
+    return popt, pcov, res.nfev
+
+
+def benchmark_log_binning(corr, t, points_per_decade=(5, 10, 20), fit_function=None, **fit_kwargs):
+    """
+    Speed against accuracy of log-binned fits (log_bins option): the grid is fitted on all samples (reference)
+    and log-binned with every points_per_decade, 1/tau is compared point by point with the reference.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        points_per_decade (tuple): log_bins values to test.
+        fit_function (function or None): full-grid fit with a log_bins option (fit_corr_full or fit_corr_loop). None = fit_corr_full.
+        **fit_kwargs: passed on to fit_function (tolerance, cutoff, ...).
+
+    Returns:
+        list: one dict per setting (log_bins, points, time, speedup, median and 90th percentile of |d(1/tau)| / (1/tau), finite fraction).
+    """
+    if fit_function is None:
+        fit_function = fit_corr_full
+    cutoff = fit_kwargs.get("cutoff", 0.6)
+    results = []
+    for log_bins in (None,) + tuple(points_per_decade):
+        start = time.perf_counter()
+        fit_tau_array = fit_function(corr, t, log_bins=log_bins, **fit_kwargs)["fit_tau_array"]
+        duration = time.perf_counter() - start
+        if log_bins is None:
+            reference, reference_time = fit_tau_array, duration
+        t_cut = t[:int(len(t) * cutoff)]
+        n_points = len(t_cut) if log_bins is None else len(log_bin_corr(t_cut, t_cut, log_bins)[0])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_diff = np.abs(fit_tau_array - reference) / np.abs(reference)
+        finite = np.isfinite(rel_diff)
+        results.append({"log_bins": log_bins,
+                        "points": n_points,
+                        "time": duration,
+                        "speedup": reference_time / duration,
+                        "median_rel_diff": np.median(rel_diff[finite]) if np.any(finite) else np.nan,
+                        "p90_rel_diff": np.quantile(rel_diff[finite], 0.9) if np.any(finite) else np.nan,
+                        "finite_fraction": np.mean(np.isfinite(fit_tau_array))})
+        print(f"log_bins {str(log_bins):>4}: {n_points:5d} points, {duration:7.2f} s, speedup {results[-1]['speedup']:5.1f}x, "
+              f"1/tau rel. diff. median {results[-1]['median_rel_diff']:.2e}, 90% {results[-1]['p90_rel_diff']:.2e}, finite {results[-1]['finite_fraction']:.2f}")
+    return results
+
+
+def benchmark_corr_storage(corr, t, storage=("float32", "int16"), fit_function=None, **fit_kwargs):
+    """
+    Fit-result deviation of reduced-precision corr storage (see quantize_corr) against float64:
+    the grid is fitted on the original corr (reference) and on corr stored and upcast with every storage,
+    1/tau and C0 are compared point by point with the reference.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        storage (tuple): storage types to test ("float32", "int16").
+        fit_function (function or None): full-grid fit (fit_corr_full or fit_corr_loop). None = fit_corr_full.
+        **fit_kwargs: passed on to fit_function (tolerance, cutoff, ...).
+
+    Returns:
+        list: one dict per storage (storage, bytes ratio, max |d corr|, median and 90th percentile of |d(1/tau)| / (1/tau),
+        max |d(1/tau)| / (1/tau), median |d C0| / C0, finite fraction).
+    """
+    if fit_function is None:
+        fit_function = fit_corr_full
+    corr = np.asarray(corr)
+    reference = fit_function(corr, t, **fit_kwargs)
+    results = []
+    for storage_type in storage:
+        stored, scale = quantize_corr(corr, storage_type)
+        restored = dequantize_corr(stored, scale)
+        fit_result = fit_function(restored, t, **fit_kwargs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel_diff = np.abs(fit_result["fit_tau_array"] - reference["fit_tau_array"]) / np.abs(reference["fit_tau_array"])
+            rel_diff_C0 = np.abs(fit_result["fit_C0_array"] - reference["fit_C0_array"]) / np.abs(reference["fit_C0_array"])
+        finite = np.isfinite(rel_diff)
+        results.append({"storage": storage_type,
+                        "bytes_ratio": (stored.nbytes + (0 if scale is None else scale.nbytes)) / corr.nbytes,
+                        "max_corr_diff": np.nanmax(np.abs(restored - corr)),
+                        "median_rel_diff": np.median(rel_diff[finite]) if np.any(finite) else np.nan,
+                        "p90_rel_diff": np.quantile(rel_diff[finite], 0.9) if np.any(finite) else np.nan,
+                        "max_rel_diff": np.max(rel_diff[finite]) if np.any(finite) else np.nan,
+                        "median_rel_diff_C0": np.nanmedian(rel_diff_C0) if np.any(np.isfinite(rel_diff_C0)) else np.nan,
+                        "finite_fraction": np.mean(np.isfinite(fit_result["fit_tau_array"]))})
+        print(f"{storage_type:>7}: bytes {results[-1]['bytes_ratio']:.2f}x, max |d corr| {results[-1]['max_corr_diff']:.1e}, "
+              f"1/tau rel. diff. median {results[-1]['median_rel_diff']:.2e}, 90% {results[-1]['p90_rel_diff']:.2e}, max {results[-1]['max_rel_diff']:.2e}, "
+              f"C0 median {results[-1]['median_rel_diff_C0']:.2e}, finite {results[-1]['finite_fraction']:.2f}")
+    return results
+
+
+def save_full_fit(folder, tolerance, fit_result):
+    """
+    Save a full-grid fit result into the run folder, in the usual
+    fit_full_tol{tolerance}.npz and popt_pcov_2D_tol{tolerance}.npz files (fit_path_array is added to fit_full if present).
+    Both files are replaced atomically.
+    """
+    _save_npz(os.path.join(folder, f"popt_pcov_2D_tol{tolerance}.npz"),
+              popt_2D=fit_result["popt_2D"],
+              pcov_2D=fit_result["pcov_2D"])
+    _save_npz(os.path.join(folder, f"fit_full_tol{tolerance}.npz"), # written last, its existence marks a complete full fit
+              fit_C0_array=fit_result["fit_C0_array"],
+              fit_tau_array=fit_result["fit_tau_array"],
+              sigma_C0_array=fit_result["sigma_C0_array"],
+              sigma_tau_array=fit_result["sigma_tau_array"],
+              **{key: fit_result[key] for key in ["fit_path_array"] if key in fit_result})
+
+
+def load_full_fit(folder, tolerance, overrides=True):
+    """
+    Load a full-grid fit (fit_full_tol{tolerance}.npz and, if present, popt_pcov_2D_tol{tolerance}.npz)
+    from the run folder into a fit result dict (see fit_corr_full). Returns None if there is no full fit.
+    With overrides, the corrected points of the folder are merged onto it (see apply_overrides).
+    """
+    filename = os.path.join(folder, f"fit_full_tol{tolerance}.npz")
+    if not os.path.exists(filename):
+        return None
+    loaded_fit = cached_load(filename)
+    fit_result = {key: loaded_fit[key] for key in ["fit_C0_array", "fit_tau_array", "sigma_C0_array", "sigma_tau_array", "fit_path_array"] if key in loaded_fit}
+    filename_pc = os.path.join(folder, f"popt_pcov_2D_tol{tolerance}.npz")
+    if os.path.exists(filename_pc):
+        datapc = cached_load(filename_pc, allow_pickle=True)
+        fit_result["popt_2D"], fit_result["pcov_2D"] = datapc["popt_2D"], datapc["pcov_2D"]
+    if overrides == True:
+        fit_result = apply_overrides(folder, tolerance, fit_result)
+    return fit_result
+
+
+# corrected point fits of a run folder (see save_override): append-only file of fixed-size float64 records
+# [tolerance, kx, ky, number of parameters (0 = override removed), popt (5, NaN padded), pcov (5 x 5, NaN padded)]
+OVERRIDE_NAME = "fit_overrides.rec"
+_OVERRIDE_WIDTH = 4 + 5 + 25
+_OVERRIDES = {} # abspath of the run folder -> in-memory index of its overrides (see _override_index)
+
+
+def _override_record(tolerance, kx, ky, popt=None, pcov=None):
+    record = np.full(_OVERRIDE_WIDTH, np.nan)
+    record[:4] = float(tolerance), kx, ky, 0 if popt is None else len(popt)
+    if popt is not None:
+        n = len(popt)
+        record[4:4 + n] = np.asarray(popt, dtype=float)
+        pcov_full = np.full((5, 5), np.nan)
+        pcov_full[:n, :n] = np.asarray(pcov, dtype=float)
+        record[9:] = pcov_full.ravel()
+    return record
+
+
+def _override_index(folder):
+    """
+    In-memory index of the overrides of a run folder: {(tolerance, kx, ky): latest record of the point}.
+    Only the records appended since the last call are read (one os.stat per call). Old tmp_fit_kx*_ky*_tol*.npz files
+    are read once per session (see migrate_tmp_fits), records of the override file take precedence over them.
+    """
+    key = os.path.abspath(folder)
+    entry = _OVERRIDES.get(key)
+    if entry is None:
+        entry = {"offset": 0, "records": {}, "legacy": {}}
+        for name in os.listdir(folder):
+            match = re.fullmatch(r"tmp_fit_kx(\d+)_ky(\d+)_tol([\d.eE+-]+)\.npz", name)
+            if match:
+                datapc = cached_load(os.path.join(folder, name), allow_pickle=True)
+                point = (float(match.group(3)), int(match.group(1)), int(match.group(2)))
+                entry["legacy"][point] = _override_record(*point, datapc["popt"], datapc["pcov"])
+        _OVERRIDES[key] = entry
+    try:
+        size = os.path.getsize(os.path.join(folder, OVERRIDE_NAME))
+    except OSError:
+        size = 0
+    if size < entry["offset"]: # file replaced, read again
+        entry["offset"], entry["records"] = 0, {}
+    n_new = (size - entry["offset"]) // (8 * _OVERRIDE_WIDTH) # a partly written last record is skipped
+    if n_new > 0:
+        with open(os.path.join(folder, OVERRIDE_NAME), "rb") as file:
+            file.seek(entry["offset"])
+            records = np.frombuffer(file.read(n_new * 8 * _OVERRIDE_WIDTH), dtype="<f8").reshape(n_new, _OVERRIDE_WIDTH)
+        for record in records:
+            entry["records"][(float(record[0]), int(record[1]), int(record[2]))] = record
+        entry["offset"] += n_new * 8 * _OVERRIDE_WIDTH
+    return {**entry["legacy"], **entry["records"]}
+
+
+def _append_overrides(folder, records):
+    with open(os.path.join(folder, OVERRIDE_NAME), "ab") as file:
+        size = file.seek(0, os.SEEK_END)
+        if size % (8 * _OVERRIDE_WIDTH) != 0: # partly written last record (interrupted write), dropped
+            file.truncate(size - size % (8 * _OVERRIDE_WIDTH))
+        file.write(np.asarray(records, dtype="<f8").reshape(-1, _OVERRIDE_WIDTH).tobytes())
+
+
+def save_override(folder, tolerance, kx, ky, popt, pcov):
+    """
+    Store a corrected fit of one (kx, ky) point (popt, pcov of fit_corr, e.g. from DDM_correct_fits_GUI) in the
+    override file of the run folder (fit_overrides.rec). It replaces the point in every loaded fit of this tolerance
+    (load_full_fit, FitMap, the multimeasurement functions), the fit files themselves are not changed.
+    """
+    _append_overrides(folder, _override_record(tolerance, kx, ky, popt, pcov))
+
+
+def remove_override(folder, tolerance, kx, ky):
+    """
+    Remove the override of a point (an empty record is appended), the stored fit of the point is used again.
+    """
+    _append_overrides(folder, _override_record(tolerance, kx, ky))
+
+
+def override_table(folder, tolerance):
+    """
+    All overrides of a tolerance in a run folder as arrays.
+
+    Returns:
+        dict: kx, ky (int arrays), n_par (number of parameters), popt (n, 5) and pcov (n, 5, 5), NaN padded.
+    """
+    records = [record for (tol, kx, ky), record in _override_index(folder).items() if tol == float(tolerance) and record[3] > 0]
+    records = np.array(records).reshape(-1, _OVERRIDE_WIDTH)
+    return {"kx": records[:, 1].astype(int), "ky": records[:, 2].astype(int), "n_par": records[:, 3].astype(int),
+            "popt": records[:, 4:9], "pcov": records[:, 9:].reshape(-1, 5, 5)}
+
+
+def override_point(folder, kx, ky, tolerance):
+    """
+    popt, pcov of the override of a point, None if the point is not overridden.
+    """
+    record = _override_index(folder).get((float(tolerance), int(kx), int(ky)))
+    if record is None or record[3] == 0:
+        return None
+    n = int(record[3])
+    return record[4:4 + n].copy(), record[9:].reshape(5, 5)[:n, :n].copy()
+
+
+def apply_overrides(folder, tolerance, fit_result):
+    """
+    Merge the overrides of a run folder onto a dense fit result in one step: fitC0 = popt[1], fittau = popt[0],
+    sigmatau = pcov[0][0] and sigmaC0 = pcov[1][1] of every overridden point (as the corrected points were always read),
+    popt_2D / pcov_2D if present. Returns a new dict, fit_result itself is not changed.
+    """
+    table = override_table(folder, tolerance)
+    shape = np.shape(fit_result["fit_tau_array"])
+    inside = (table["kx"] < shape[0]) & (table["ky"] < shape[1])
+    if not np.any(inside):
+        return fit_result
+    kx, ky = table["kx"][inside], table["ky"][inside]
+    popt, pcov, n_par = table["popt"][inside], table["pcov"][inside], table["n_par"][inside]
+    fit_result = dict(fit_result)
+    for key, values in [("fit_C0_array", popt[:, 1]), ("fit_tau_array", popt[:, 0]), ("sigma_tau_array", pcov[:, 0, 0]), ("sigma_C0_array", pcov[:, 1, 1])]:
+        fit_result[key] = np.array(fit_result[key], dtype=float)
+        fit_result[key][kx, ky] = values
+    if "popt_2D" in fit_result:
+        fit_result["popt_2D"], fit_result["pcov_2D"] = np.array(fit_result["popt_2D"]), np.array(fit_result["pcov_2D"])
+        for i in range(len(kx)): # object arrays of different lengths
+            fit_result["popt_2D"][kx[i], ky[i]] = popt[i, :n_par[i]]
+            fit_result["pcov_2D"][kx[i], ky[i]] = pcov[i, :n_par[i], :n_par[i]]
+    return fit_result
+
+
+def migrate_tmp_fits(folder, remove_files=True):
+    """
+    Move the tmp_fit_kx*_ky*_tol*.npz files of a run folder into its override file (oldest first),
+    and remove them if remove_files. Returns the number of migrated files.
+    """
+    names = sorted([name for name in os.listdir(folder) if re.fullmatch(r"tmp_fit_kx(\d+)_ky(\d+)_tol([\d.eE+-]+)\.npz", name)],
+                   key=lambda name: os.path.getmtime(os.path.join(folder, name)))
+    if not names:
+        return 0
+    existing = _override_index(folder)
+    records = []
+    for name in names:
+        match = re.fullmatch(r"tmp_fit_kx(\d+)_ky(\d+)_tol([\d.eE+-]+)\.npz", name)
+        point = (float(match.group(3)), int(match.group(1)), int(match.group(2)))
+        if point not in _OVERRIDES[os.path.abspath(folder)]["records"]: # a newer correction in the override file is kept
+            records.append(existing[point])
+    _append_overrides(folder, records)
+    if remove_files == True:
+        for name in names:
+            os.remove(os.path.join(folder, name))
+    del _OVERRIDES[os.path.abspath(folder)]
+    return len(names)
+
+
+def migrate_experiment_overrides(exp_folder, remove_files=True):
+    """
+    migrate_tmp_fits for every run folder of an experiment (see catalog_runs).
+    """
+    n_files = sum(migrate_tmp_fits(run_folder, remove_files=remove_files) for run_folder in catalog_runs(exp_folder))
+    print(f"{n_files} tmp_fit files migrated.")
+    return n_files
+
+
+def _fit_rows_points(corr, t, start, stop, tolerance=0.2, mask=None, single_exp=None, **fit_kwargs):
+    """
+    fit_corr in every point of the kx rows start:stop (one block of checkpointed_fit).
+    Points outside mask are not fitted, points in single_exp get the 1-exp fit only, failed fits are NaN.
+
+    Returns:
+        dict: fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array, popt_2D and pcov_2D of the rows.
+    """
+    n_ky = corr.shape[1]
+    fit_result = {key: np.full((stop - start, n_ky), np.nan) for key in ["fit_C0_array", "fit_tau_array", "sigma_C0_array", "sigma_tau_array"]}
+    fit_result["popt_2D"], fit_result["pcov_2D"] = np.empty((stop - start, n_ky), dtype=object), np.empty((stop - start, n_ky), dtype=object)
+    for kx in range(start, stop):
+        for ky in range(n_ky):
+            if mask is not None and not mask[kx, ky]:
+                continue
+            fitC0, fittau, sigmatau, sigmaC0, popt, pcov = fit_corr_warm(corr, t, kx, ky, return_pcov=True,
+                                                                         tolerance=np.inf if single_exp is not None and single_exp[kx, ky] else tolerance,
+                                                                         **fit_kwargs)
+            i = kx - start
+            fit_result["fit_C0_array"][i, ky], fit_result["fit_tau_array"][i, ky] = fitC0, fittau
+            fit_result["sigma_C0_array"][i, ky], fit_result["sigma_tau_array"][i, ky] = sigmaC0, sigmatau
+            fit_result["popt_2D"][i, ky], fit_result["pcov_2D"][i, ky] = popt, pcov
+    return fit_result
+
+
+def checkpointed_fit(folder, name, n_rows, fit_rows, config, rows_per_block=4):
+    """
+    Full-grid fit in blocks of kx rows with a checkpoint: every finished block is appended to folder/{name}.ckpt
+    and listed in the index folder/{name}.json (rows, byte offset and length of every block, key of the fit configuration).
+    A restarted fit with the same configuration (corr, t, fit settings) reads the finished blocks and only fits the missing ones,
+    a checkpoint of another configuration is started again. A block that was not completely written (crash) is not
+    in the index and is fitted again. Remove the checkpoint with clear_checkpoint after the result is saved.
+
+    Parameters:
+        folder (str): run folder.
+        name (str): name of the checkpoint files (e.g. fit_checkpoint_tol0.2).
+        n_rows (int): number of kx rows.
+        fit_rows (function): fit_rows(start, stop) -> fit result dict of the rows start:stop (arrays (stop - start, ky, ...)).
+        config (dict): everything the fit depends on (corr, t, settings), arrays are hashed (see _config_value).
+        rows_per_block (int): kx rows per block.
+
+    Returns:
+        dict: fit result of the whole grid (blocks concatenated along kx).
+    """
+    key = hashlib.blake2b(json.dumps(_config_value(dict(config, version=FIT_CACHE_VERSION, rows_per_block=rows_per_block)), sort_keys=True).encode(), digest_size=16).hexdigest()
+    data_file, index_file = os.path.join(folder, name + ".ckpt"), os.path.join(folder, name + ".json")
+    index = None
+    if os.path.exists(index_file) and os.path.exists(data_file):
+        try:
+            with open(index_file) as file:
+                index = json.load(file)
+        except ValueError:
+            print("Broken checkpoint index, starting again.")
+        if index is not None and index.get("key") != key:
+            print("Checkpoint of other data / fit settings, starting again.")
+            index = None
+    if index is None:
+        index = {"key": key, "n_rows": n_rows, "rows_per_block": rows_per_block, "blocks": []}
+        open(data_file, "wb").close()
+
+    blocks, valid, end = {}, [], 0
+    with open(data_file, "rb") as file:
+        for block in index["blocks"]:
+            file.seek(block["offset"])
+            raw = file.read(block["length"])
+            if len(raw) != block["length"]:
+                continue
+            with np.load(io.BytesIO(raw), allow_pickle=True) as loaded:
+                blocks[block["start"]] = {quantity: loaded[quantity] for quantity in loaded.files}
+            valid.append(block)
+            end = max(end, block["offset"] + block["length"])
+    index["blocks"] = valid
+    os.truncate(data_file, end) # drop a partly written block
+    n_blocks = len(range(0, n_rows, rows_per_block))
+    if blocks:
+        print(f"Resuming from checkpoint: {len(blocks)} of {n_blocks} blocks done.")
+
+    starts = [start for start in range(0, n_rows, rows_per_block) if start not in blocks]
+    for start in tqdm(starts, desc="Fitting tau values", ncols=100, colour="#82e0aa", total=n_blocks, initial=n_blocks - len(starts)):
+        stop = min(start + rows_per_block, n_rows)
+        blocks[start] = fit_rows(start, stop)
+        buffer = io.BytesIO()
+        np.savez(buffer, **blocks[start])
+        with open(data_file, "ab") as file:
+            offset = file.tell()
+            file.write(buffer.getvalue())
+            file.flush()
+            os.fsync(file.fileno())
+        index["blocks"].append({"start": start, "stop": stop, "offset": offset, "length": len(buffer.getvalue())})
+        with open(index_file + ".tmp", "w") as file: # the block is only in the index once it is completely on disk
+            json.dump(index, file)
+        os.replace(index_file + ".tmp", index_file)
+    return {quantity: np.concatenate([blocks[start][quantity] for start in sorted(blocks)]) for quantity in blocks[0]}
+
+
+def clear_checkpoint(folder, name):
+    """
+    Remove the checkpoint files of checkpointed_fit.
+    """
+    for filename in [name + ".ckpt", name + ".json"]:
+        if os.path.exists(os.path.join(folder, filename)):
+            os.remove(os.path.join(folder, filename))
+
+
+DUAL_KEYS = ["popt1_array", "pcov1_array", "ok1_array", "popt2_array", "pcov2_array", "ok2_array"]
+
+
+def select_by_tolerance(dual_fit, tolerance, with_popt=True):
+    """
+    Tolerance selection of fit_corr (2-exp fit if sigmatau / fittau > tolerance, NaN if sigmatau / fittau > 1)
+    as a vectorized post-processing step on a dual fit (both models stored in every point, see fit_corr_full(dual=True)).
+    Choosing another tolerance this way takes milliseconds instead of a refit.
+
+    Parameters:
+        dual_fit (dict): popt1_array, pcov1_array, ok1_array, popt2_array, pcov2_array, ok2_array (e.g. from load_dual_fit).
+        tolerance (float): The tolerance sigmatau / fittau where 2-exp fit should be used.
+        with_popt (bool): also pack popt_2D / pcov_2D (object arrays as in popt_pcov_2D_tol*.npz files).
+
+    Returns:
+        dict: fit result with the keys of fit_full_tol*.npz (and popt_2D, pcov_2D), plus twoexp_array.
+    """
+    popt1, pcov1, ok1 = dual_fit["popt1_array"], dual_fit["pcov1_array"], dual_fit["ok1_array"]
+    popt2, pcov2, ok2 = dual_fit["popt2_array"], dual_fit["pcov2_array"], dual_fit["ok2_array"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        twoexp = ok1 & (np.sqrt(pcov1[..., 0, 0]) / popt1[..., 0] > tolerance)
+        ok = np.where(twoexp, ok2, ok1)
+        fit_tau = np.where(ok, np.where(twoexp, popt2[..., 0], popt1[..., 0]), np.nan)
+        fit_C0 = np.where(ok, np.where(twoexp, popt2[..., 1], popt1[..., 1]), np.nan)
+        sigma_tau = np.where(ok, np.sqrt(np.where(twoexp, pcov2[..., 0, 0], pcov1[..., 0, 0])), np.nan)
+        sigma_C0 = np.where(ok, np.sqrt(np.where(twoexp, pcov2[..., 1, 1], pcov1[..., 1, 1])), np.nan)
+        unreliable = sigma_tau / fit_tau > 1 # tau = 1/tau
+    fit_C0[unreliable], fit_tau[unreliable], sigma_tau[unreliable], sigma_C0[unreliable] = np.nan, np.nan, np.nan, np.nan
+
+    fit_result = {"fit_C0_array": fit_C0,
+                  "fit_tau_array": fit_tau,
+                  "sigma_C0_array": sigma_C0,
+                  "sigma_tau_array": sigma_tau,
+                  "twoexp_array": twoexp}
+    if with_popt == True:
+        popt_list, pcov_list = [], []
+        for i in range(ok.size):
+            popt, pcov, good = (popt2, pcov2, ok2) if twoexp.flat[i] else (popt1, pcov1, ok1)
+            idx = np.unravel_index(i, ok.shape)
+            popt_list.append(popt[idx] if good[idx] else np.full(popt.shape[-1], np.nan))
+            pcov_list.append(pcov[idx] if good[idx] else np.full(pcov.shape[-2:], np.nan))
+        fit_result["popt_2D"], fit_result["pcov_2D"] = _pack_popt_pcov(popt_list, pcov_list, ok.shape)
+    return fit_result
+
+
+def save_dual_fit(folder, fit_result):
+    """
+    Save both models of a dual full-grid fit (fit_corr_full(dual=True)) into the run folder as fit_dual.npz (tolerance independent).
+    """
+    np.savez(os.path.join(folder, "fit_dual.npz"), **{key: fit_result[key] for key in DUAL_KEYS})
+
+
+def load_dual_fit(folder):
+    """
+    Load fit_dual.npz from the run folder into a dict (see select_by_tolerance). Returns None if there is no dual fit.
+    """
+    filename = os.path.join(folder, "fit_dual.npz")
+    if not os.path.exists(filename):
+        return None
+    loaded_fit = cached_load(filename)
+    return {key: loaded_fit[key] for key in DUAL_KEYS}
+
+
+# arguments that do not change the fit result, left out of the fit cache keys:
+_FIT_CACHE_IGNORED = ["workers", "rows_per_chunk", "chunk_size"]
+
+
+def _config_value(value):
+    """
+    JSON-able form of a fit configuration value (arrays are replaced by their hash, shape and dtype).
+    """
+    if isinstance(value, np.ndarray):
+        return {"blake2b": hashlib.blake2b(np.ascontiguousarray(value).view(np.uint8)).hexdigest(), "shape": list(value.shape), "dtype": str(value.dtype)}
+    if isinstance(value, dict):
+        return {str(key): _config_value(item) for key, item in value.items() if key not in _FIT_CACHE_IGNORED}
+    if isinstance(value, (list, tuple)):
+        return [_config_value(item) for item in value]
+    if callable(value):
+        return value.__module__ + "." + value.__qualname__
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return str(value)
+    return value
+
+
+def fit_config(corr, t, full_fit, deltat=None, **fit_kwargs):
+    """
+    Full configuration of a fit: hash of the correlation data and t, the fit function with all its arguments
+    (defaults included, so bounds, cutoff, init_pars, tolerance, ... are always there), deltat and FIT_CACHE_VERSION.
+
+    Returns:
+        tuple: key (str, hash of the configuration) and config (dict, JSON-able).
+    """
+    arguments = inspect.signature(full_fit).bind(corr, t, **fit_kwargs)
+    arguments.apply_defaults()
+    arguments = {name: value for name, value in arguments.arguments.items() if name not in ["corr", "t"] + _FIT_CACHE_IGNORED}
+    config = {"version": FIT_CACHE_VERSION,
+              "full_fit": _config_value(full_fit),
+              "corr": _config_value(corr),
+              "t": _config_value(np.asarray(t, dtype=float)),
+              "deltat": _config_value(deltat),
+              "arguments": _config_value(arguments)}
+    key = hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=16).hexdigest()
+    return key, config
+
+
+def cached_fit(folder, corr, t, full_fit=None, deltat=None, use_cache=True, **fit_kwargs):
+    """
+    Full-grid fit through the persistent fit cache of the run folder (folder/fit_cache/<key>.npz).
+    The key is a hash of the correlation data and of the whole fit configuration (see fit_config), so a stored result
+    is only reused if corr, t and every fit setting are the same - a changed corr.npz, bounds, cutoff, tolerance, ...
+    gives a new key and a new fit. Every entry has a provenance sidecar <key>.json (configuration, source file, time, versions).
+
+    Parameters:
+        folder (str): run folder.
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        full_fit (function or None): full-grid fit returning a fit result dict (fit_corr_full, fit_corr_loop,
+            fit_corr_full_parallel, fit_corr_symmetric, ...). None = fit_corr_full.
+        deltat (float or None): time step, recorded in the key and provenance.
+        use_cache (bool): False = always fit and store the new result.
+        **fit_kwargs: passed on to full_fit.
+
+    Returns:
+        dict: fit result (arrays from the cache are read-only).
+    """
+    full_fit = full_fit or fit_corr_full
+    key, config = fit_config(corr, t, full_fit, deltat=deltat, **fit_kwargs)
+    cache_folder = os.path.join(folder, "fit_cache")
+    filename = os.path.join(cache_folder, key + ".npz")
+    if use_cache == True and os.path.exists(filename) and os.path.exists(os.path.join(cache_folder, key + ".json")):
+        print(f"Using cached fit {key}.")
+        return dict(cached_load(filename, allow_pickle=True))
+
+    start = time.time()
+    fit_result = full_fit(corr, t, **fit_kwargs)
+    fit_time = time.time() - start
+
+    os.makedirs(cache_folder, exist_ok=True)
+    np.savez(filename, **fit_result)
+    corr_file = os.path.join(folder, "corr.npz")
+    provenance = {"key": key,
+                  "created": str(datetime.datetime.now()),
+                  "fit_time_s": fit_time,
+                  "source": {"path": os.path.abspath(corr_file), "mtime": os.path.getmtime(corr_file)} if os.path.exists(corr_file) else None,
+                  "numpy": np.__version__,
+                  "config": config}
+    with open(os.path.join(cache_folder, key + ".json"), "w") as file: # written last, an entry without it is not used
+        json.dump(provenance, file, indent=2)
+    return fit_result
+
+
+def fit_run_folder(folder, deltat, full_fit=None, use_cache=True, **fit_kwargs):
+    """
+    Full-grid fit of the run folder's corr.npz through the persistent fit cache (see cached_fit).
+    """
+    t, corr = load_corr(folder, deltat)
+    return cached_fit(folder, corr, t, full_fit=full_fit, deltat=deltat, use_cache=use_cache, **fit_kwargs)
+
+
+def preview_tau_map(corr, t, n_rates=200, f_min=None, f_max=None, cutoff=0.6):
+    """
+    Quick approximate 1/tau and C0 maps for the whole k-grid, without any nonlinear fitting.
+    All points share the same t axis, so a bank of exp(-f t) curves for log-spaced rates is built once
+    and every correlation curve is matched against it with one matrix product (see _exp1_grid_start).
+    The result can be plotted directly (plot_2D(preview["fit_tau_array"]), plot_3D(...)) or used as
+    initial parameters of the full fit: fit_corr_full(corr, t, init_pars1=preview["init_pars1"]).
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        n_rates (int): number of rates in the bank.
+        f_min, f_max (float or None): range of rates 1/tau (1/s), default is set by the measured time window.
+        cutoff (float): where to cutoff the data (as in fit_corr).
+
+    Returns:
+        dict: fit_tau_array, fit_C0_array, fit_y0_array (kx, ky) and init_pars1 (kx, ky, 3) = [f, C0, y0].
+    """
+    corr = np.asarray(corr)
+    shape = corr.shape[:2]
+    n = int(len(t) * cutoff)
+    y = np.nan_to_num(np.asarray(corr.reshape(-1, corr.shape[-1])[:, :n], dtype=float))
+    p = _exp1_grid_start(np.asarray(t[:n], dtype=float), y, n_grid=n_rates, f_min=f_min, f_max=f_max).reshape(shape + (3,))
+    return {"fit_tau_array": p[..., 0],
+            "fit_C0_array": p[..., 1],
+            "fit_y0_array": p[..., 2],
+            "init_pars1": p}
+
+
+def snr_prefilter(corr, var1=None, var2=None, threshold=3.0, high_k_fraction=0.1, action="skip", printout=False):
+    """
+    Vectorized signal-to-noise estimate of every (kx, ky) curve, to skip hopeless points before fitting.
+    The signal is the unnormalized amplitude S = |corr[..., 0]| * sqrt(var1 * var2), the noise level is the median of S
+    over the highest |k| points (high_k_fraction of the grid), where only noise is left. SNR = S / noise level.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        var1, var2 (numpy.ndarray or None): 2D (kx, ky) variances from var.npz. None = S is just |corr[..., 0]|.
+        threshold (float): points with SNR below it are flagged.
+        high_k_fraction (float): fraction of the grid (highest |k|) used for the noise level.
+        action (str): what the fit does with flagged points, only for the report: "skip" (not fitted, NaN) or "1exp" (1-exp fit only).
+        printout (bool): print a summary of the flagged points.
+
+    Returns:
+        tuple: mask (boolean (kx, ky), True = SNR above threshold), report (dict: snr_array, n_points, n_flagged, action,
+            fits_avoided = flagged points for "skip", 0 for "1exp" (they are still fitted),
+            twoexp_avoided = max. number of avoided 2-exp fits, the flagged points for both actions).
+    """
+    shape = corr.shape[:2]
+    signal = np.abs(corr[..., 0])
+    if var1 is not None and var2 is not None:
+        signal = signal * np.sqrt(np.abs(var1 * var2))
+    k_abs = np.hypot(np.fft.fftfreq(shape[0], 1 / shape[0])[:, None], np.arange(shape[1])[None, :])
+    high_k = k_abs >= np.quantile(k_abs, 1 - high_k_fraction)
+    noise = np.nanmedian(signal[high_k])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr_array = signal / noise
+    mask = snr_array >= threshold # NaN curves are flagged too
+
+    n_flagged = int(np.sum(~mask))
+    report = {"snr_array": snr_array,
+              "n_points": mask.size,
+              "n_flagged": n_flagged,
+              "action": action,
+              "fits_avoided": n_flagged if action == "skip" else 0,
+              "twoexp_avoided": n_flagged}
+    if printout == True:
+        print(f"SNR pre-filter: {n_flagged} of {mask.size} points below SNR {threshold} ({'skipped' if action == 'skip' else '1-exp fit only'}).")
+    return mask, report
+
+
+def _snr_fit_masks(folder, corr, mask, snr_threshold, snr_action):
+    # mask / single_exp for a full-grid fit of corr in folder, with the snr_prefilter flags added
+    single_exp = None
+    if snr_threshold is None:
+        return mask, single_exp
+    var1, var2 = None, None
+    if os.path.exists(folder + "/" +  "var.npz") or os.path.exists(folder + "/" +  "var1.npy"):
+        var1, var2 = load_var(folder)
+    snr_ok, snr_report = snr_prefilter(corr, var1, var2, threshold=snr_threshold, action=snr_action)
+    if snr_action == "skip":
+        mask = snr_ok if mask is None else mask & snr_ok
+    else:
+        single_exp = ~snr_ok
+    return mask, single_exp
+
+
+def fit_corr_loop(corr, t, tolerance=0.0001, cutoff=0.6, mask=None, single_exp=None, **fit_kwargs):
+    """
+    Fits ALL (kx, ky) points one by one with fit_corr (curve_fit) and packs the results
+    in the same dict as fit_corr_full (without n_iter_array).
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        tolerance (float): The tolerance sigmatau / fittau where 2-exp fit should be used.
+        cutoff (float): where to cutoff fitting.
+        mask (numpy.ndarray or None): boolean (kx, ky) region of interest (see roi_mask), points outside are not fitted (NaN).
+        single_exp (numpy.ndarray or None): boolean (kx, ky), True = only the 1-exp fit in this point (see snr_prefilter).
+        **fit_kwargs: passed on to fit_corr (init_pars, bounds, max_nfev, time_budget, fallback, ...).
+
+    Returns:
+        dict: fit result (see fit_corr_full).
+    """
+    shape = corr.shape[:2]
+    fit_C0_array, fit_tau_array = np.full(shape, np.nan), np.full(shape, np.nan)
+    sigma_C0_array, sigma_tau_array = np.full(shape, np.nan), np.full(shape, np.nan)
+    twoexp_array = np.zeros(shape, dtype=bool)
+    fit_path_array = np.full(shape, FIT_PATHS.index("nan"), dtype=np.int8)
+    popt_list, pcov_list = [], []
+
+    for kx in range(shape[0]):
+        for ky in range(shape[1]):
+            if mask is not None and not mask[kx, ky]:
+                popt_list.append(np.full(3, np.nan))
+                pcov_list.append(np.full((3, 3), np.nan))
+                continue
+            try:
+                point_tolerance = np.inf if single_exp is not None and single_exp[kx, ky] else tolerance # inf: never 2-exp
+                result = fit_corr(corr, t, kx, ky, tolerance=point_tolerance, cutoff=cutoff, old_return=False, return_path=True, **fit_kwargs)
+                fit_C0_array[kx, ky], fit_tau_array[kx, ky], sigma_tau_array[kx, ky], sigma_C0_array[kx, ky] = result[:4]
+                popt, pcov = result[-3:-1]
+                twoexp_array[kx, ky] = len(popt) == 5
+                fit_path_array[kx, ky] = FIT_PATHS.index(result[-1])
+            except: # fit_corr failed before popt was assigned
+                popt, pcov = np.full(3, np.nan), np.full((3, 3), np.nan)
+            popt_list.append(popt)
+            pcov_list.append(pcov)
+
+    popt_2D, pcov_2D = _pack_popt_pcov(popt_list, pcov_list, shape)
+    return {"fit_C0_array": fit_C0_array,
+            "fit_tau_array": fit_tau_array,
+            "sigma_C0_array": sigma_C0_array,
+            "sigma_tau_array": sigma_tau_array,
+            "popt_2D": popt_2D,
+            "pcov_2D": pcov_2D,
+            "twoexp_array": twoexp_array,
+            "fit_path_array": fit_path_array}
+
+
+def fit_path_histogram(fit_path_array, printout=True):
+    """
+    Histogram of the fit fallback ladder rungs (FIT_PATHS) of a full-grid fit, e.g. fit_result["fit_path_array"].
+
+    Returns:
+        dict: number of points per rung.
+    """
+    counts = {path: int(np.sum(np.asarray(fit_path_array) == i)) for i, path in enumerate(FIT_PATHS)}
+    if printout == True:
+        total = max(sum(counts.values()), 1)
+        print("Fit paths: " + ", ".join(f"{path} {n} ({100 * n / total:.1f} %)" for path, n in counts.items()))
+    return counts
+
+
+def _fit_rows_worker(shm_name, shape, dtype, t, row_start, row_stop, engine, fit_kwargs):
+    # runs in a worker process: attach to the shared corr array and fit rows row_start:row_stop
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        corr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if engine == "batched":
+            fit_result = fit_corr_full(corr[row_start:row_stop], t, **fit_kwargs)
+        else:
+            fit_result = fit_corr_loop(corr[row_start:row_stop], t, **fit_kwargs)
+    finally:
+        shm.close()
+    return row_start, fit_result
+
+
+def fit_corr_full_parallel(corr, t, workers=None, rows_per_chunk=None, engine="curve_fit", **fit_kwargs):
+    """
+    Full-grid fit on several processes. The k-grid is split into chunks of kx rows,
+    which are fitted in a ProcessPoolExecutor. corr is placed in shared memory once,
+    so the workers read it directly instead of each receiving a pickled copy.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        workers (int or None): number of processes (None = all cores).
+        rows_per_chunk (int or None): kx rows per task (None = about 4 tasks per worker).
+        engine (str): "curve_fit" (fit_corr in every point, see fit_corr_loop) or "batched" (fit_corr_full).
+        **fit_kwargs: passed on to fit_corr_loop / fit_corr_full (tolerance, cutoff, init_pars, bounds, mask, single_exp, ...).
+            (kx, ky) masks are split into the kx rows of every task. With continuation (batched), every task gets the true kx
+            of its rows (kx_values, see fit_corr_full), so the |k| shells and neighbours are those of the whole grid.
+
+    Returns:
+        dict: fit result for the whole grid, same keys as the result of the chosen engine.
+    """
+    if engine not in ["curve_fit", "batched"]:
+        print(f"Unknown fitting engine {engine}, using curve_fit.")
+        engine = "curve_fit"
+    corr = np.ascontiguousarray(corr)
+    n_rows = corr.shape[0]
+    if engine == "batched" and fit_kwargs.get("continuation"):
+        fit_kwargs["kx_values"] = np.fft.fftfreq(n_rows, 1 / n_rows) if fit_kwargs.get("kx_values") is None else np.asarray(fit_kwargs["kx_values"])
+    row_arrays = {key: fit_kwargs.pop(key) for key in ["mask", "single_exp", "kx_values"] if fit_kwargs.get(key) is not None} # split into the rows of every task
+    workers = workers or os.cpu_count() or 1
+    if rows_per_chunk is None:
+        rows_per_chunk = max(1, int(np.ceil(n_rows / (4 * workers))))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(corr.nbytes, 1))
+    try:
+        np.ndarray(corr.shape, dtype=corr.dtype, buffer=shm.buf)[:] = corr
+        parts = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for start in range(0, n_rows, rows_per_chunk):
+                stop = min(start + rows_per_chunk, n_rows)
+                chunk_kwargs = dict(fit_kwargs, **{key: row_array[start:stop] for key, row_array in row_arrays.items()})
+                futures.append(executor.submit(_fit_rows_worker, shm.name, corr.shape, corr.dtype, t, start, stop, engine, chunk_kwargs))
+            for future in tqdm(futures, desc="Fitting tau values", ncols=100, colour="#82e0aa"):
+                row_start, fit_result = future.result()
+                parts[row_start] = fit_result
+    finally:
+        shm.close()
+        shm.unlink()
+
+    ordered = [parts[start] for start in sorted(parts)]
+    return {key: np.concatenate([part[key] for part in ordered]) for key in ordered[0]}
+
+
+def load_var_weights(folder):
+    """
+    Per-point weights (var1 + var2) / 2 from var.npz (or its converted .npy files) in folder, None if there is no var.npz.
+    """
+    try:
+        var1, var2 = load_var(folder)
+    except (OSError, KeyError):
+        return None
+    return (var1 + var2) / 2
+
+
+def fold_kx(corr, weights=None):
+    """
+    Averages the curves corr[kx] and corr[-kx] (1/tau is symmetric under q_parallel -> -q_parallel).
+    kx is in fftfreq order, so row -kx is row len(corr) - kx. Rows 0 and the Nyquist row (even length) are their own mirror.
+
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        weights (numpy.ndarray or None): 2D (kx, ky) weights of the curves, e.g. load_var_weights. None = plain average.
+
+    Returns:
+        numpy.ndarray: folded corr with rows kx = 0, 1, ..., len(corr) // 2.
+    """
+    n_kx = corr.shape[0]
+    rows = np.arange(n_kx // 2 + 1)
+    mirror = (- rows) % n_kx
+    if weights is None:
+        return (corr[rows] + corr[mirror]) / 2
+    w, w_mirror = weights[rows][..., None], weights[mirror][..., None]
+    w_sum = w + w_mirror
+    with np.errstate(invalid="ignore", divide="ignore"):
+        folded = (w * corr[rows] + w_mirror * corr[mirror]) / w_sum
+    return np.where(w_sum > 0, folded, (corr[rows] + corr[mirror]) / 2)
+
+
+def unfold_kx(fit_result, n_kx):
+    """
+    Mirrors a fit result of folded corr (see fold_kx) back to the full kx grid of length n_kx.
+    Every array of the dict (fit_*, sigma_*, popt_2D, ...) gets row -kx equal to row kx.
+    """
+    rows = np.arange(n_kx)
+    source = np.minimum(rows, n_kx - rows) # fftfreq index -> folded row |kx|
+    return {key: value[source] for key, value in fit_result.items()}
+
 
-            if len(crossings_plus) == 1:
-                p1 = [np.log10(t)[crossings_plus[0]], grad2[crossings_plus[0]]]
-                plt.axvline(x=t[crossings_plus[0]],
-                            label=f"2nd order derivative roots: \n 1/t = {round(1 / t[crossings_plus[0]], 1)} 1/s", c="C3",
-                            linestyle="-.")
-    except:
-        plt.title("Correlation function")
+def fit_corr_symmetric(corr, t, weights=None, fit_function=None, **fit_kwargs):
+    """
+    Symmetry-averaged full-grid fit: corr is folded in kx (fold_kx), fitted with fit_function
+    and the result is mirrored back to the full grid (unfold_kx). About half as many fits, with better SNR.
 
+    Parameters:
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        weights (numpy.ndarray or None): 2D weights for averaging kx and -kx (see load_var_weights).
+        fit_function (function or None): full-grid fit (fit_corr_loop, fit_corr_full, fit_corr_full_parallel). None = fit_corr_loop.
+        **fit_kwargs: passed on to fit_function. A (kx, ky) mask is folded too (kx is fitted if kx or -kx is inside)
+            and applied again to the mirrored result, single_exp holds for kx if it holds for both kx and -kx.
+            With continuation, the folded rows are fitted as kx = 0, 1, ..., len(corr) // 2 (kx_values, see fit_corr_full).
+
+    Returns:
+        dict: fit result for the whole grid, same keys as the result of fit_function.
+    """
+    if fit_function is None:
+        fit_function = fit_corr_loop
+    mask = fit_kwargs.get("mask")
+    if mask is not None:
+        rows = np.arange(corr.shape[0] // 2 + 1)
+        mask = np.asarray(mask, dtype=bool)
+        fit_kwargs["mask"] = mask[rows] | mask[(- rows) % corr.shape[0]]
+    if fit_kwargs.get("single_exp") is not None:
+        rows = np.arange(corr.shape[0] // 2 + 1)
+        single_exp = np.asarray(fit_kwargs["single_exp"], dtype=bool)
+        fit_kwargs["single_exp"] = single_exp[rows] & single_exp[(- rows) % corr.shape[0]]
+    if fit_kwargs.get("continuation") and fit_function is not fit_corr_loop:
+        fit_kwargs["kx_values"] = np.arange(corr.shape[0] // 2 + 1)
+    fit_result = unfold_kx(fit_function(fold_kx(corr, weights), t, **fit_kwargs), corr.shape[0])
+    return fit_result if mask is None else apply_roi(fit_result, mask)
+
+
+def apply_roi(fit_result, mask):
+    """
+    Sets all points of a full-grid fit result outside of the region of interest mask (see roi_mask) to NaN.
+    """
+    fit_result = dict(fit_result)
+    for key in ["fit_C0_array", "fit_tau_array", "sigma_C0_array", "sigma_tau_array"]:
+        fit_result[key] = np.where(mask, fit_result[key], np.nan)
+    if "fit_path_array" in fit_result:
+        fit_result["fit_path_array"] = np.where(mask, fit_result["fit_path_array"], FIT_PATHS.index("nan")).astype(np.int8)
+    for key in ["ok1_array", "ok2_array"]:
+        if key in fit_result:
+            fit_result[key] = fit_result[key] & mask
+    for key in ["popt_2D", "pcov_2D"]:
+        if key in fit_result:
+            fit_result[key] = fit_result[key].copy()
+            for kx, ky in zip(*np.nonzero(~mask)):
+                fit_result[key][kx, ky] = np.full(np.shape(fit_result[key][kx, ky]), np.nan)
+    return fit_result
 
-    if plotsave == True:
-        plt.legend()
-        try:
-            save_figure(f"corr_func_fit_{SAMPLE}_{curr}_mA_{round(mag_field,1)}_mT_kx{int(kx_name)}_ky{int(ky)}", overwrite=overwrite, out_folder=out_folder) ###
-        except:
-            save_figure(f"corr_func_fit_{SAMPLE}_000_mA_000_mT_kx{int(kx_name)}_ky{int(ky)}",
-                        overwrite=overwrite, out_folder=out_folder)
-    if plotshow == True:
-        plt.legend()
-        if canvas10:
-            print("plotting fit from ex")
-            canvas1.draw()
-        else:
-            plt.show()
-    else:
-        plt.cla()
 
 #########################################
 ### FUNCTIONS FOR SINGLE RUN ANALYSIS ###
@@ -1231,177 +3430,1196 @@ def plot_3D_fitted_parabolas(data, ky_array, fit_a_array, fit_c_array, fit_b_arr
     plt.show()
 
 
-def linear_fit_a(fit_a_array, ky_array, plotshow=True, plotsave=False, overwrite=False):
+def linear_fit_a(fit_a_array, ky_array, plotshow=True, plotsave=False, overwrite=False):
+    """
+    Fits the linear function to the array of fitted $a$ values from quadratic functions.
+
+    Parameters:
+        fit_a_array (numpy.ndarray): The array of fit $a$ values.\n
+        ky_array (numpy.ndarray): The array of k_y values.\n
+        plotshow (bool): Whether to show the plot of the fit (default is True).\n
+        plotsave (bool): Whether to save the plot (default is False). \n
+        overwrite (bool): Whether to overwrite existing file (default is False).
+
+    Returns:
+        tuple: A tuple containing the fit k, fit y0, sigma k, and sigma y0 values.
+    """
+
+
+    def fit_func_3(x, k, y0):
+        return k * x + y0
+
+
+    popt, pcov = curve_fit(fit_func_3, ky_array, fit_a_array)
+
+    if plotshow == True:
+        plt.plot(ky_array, fit_a_array, label = "data")
+        plt.title(r"Fitted $a$ parameters")
+        plt.suptitle("c-DDM: " + SAMPLE)
+        plt.xlabel("$k_\perp$")
+        plt.ylabel(r"$a$")
+        plt.plot(ky_array, fit_func_3(ky_array, *popt), c="black", linestyle="--",
+                                 label = "linear fit:"+"\n"+rf"$y_0$ = {round(popt[1],7)} $\pm$ {round(np.sqrt(pcov[1,1]), 7)}"
+                                 + "\n" +
+                                 rf"$k$ = {round(popt[0], 10)}$\pm$ {round(np.sqrt(pcov[0,0]), 9)}")
+
+        plt.legend()
+
+        if plotsave == True:
+            save_figure("lin_fit_a", overwrite=overwrite)
+
+        plt.show()
+
+    return popt[0], popt[1], np.sqrt(pcov[0][0]), np.sqrt(pcov[1][1])
+
+
+def amplitude_imshow(var1, var2, corr, vmax=None, cmap="plasma", plotsave=False, overwrite=False):
+    """
+    Plots the amplitude of the signal.
+
+    Parameters:
+        var1 (numpy.ndarray): Values from 1st camera \n
+        var2 (numpy.ndarray): Values from 2nd camera \n
+        corr: Correlation functions data \n
+        vmax: max value (used to cut off weird values)\n
+        cmap: colormap used for imshow \n
+        plotsave (bool): Whether to save the plot (default is False). \n
+        overwrite (bool): Whether to overwrite existing file (default is False).
+    """
+    # amplitude = (average(signal1, signal2))**1/4 * corr at time 0:
+    amplitude = np.abs(corr[...,0]) * ((var1 + var2) / 2)**0.25
+
+    # subplots settings:
+    plt.title("c-DDM amplitude: " + SAMPLE)
+    plt.xlabel(r"$k_\perp$")
+    plt.ylabel(r"$k_\parallel$")
+    plt.imshow(amplitude[1:-1], cmap=cmap, vmax=vmax)
+    plt.colorbar()
+
+    if plotsave == True:
+        save_figure("amplitude_2D" + SAMPLE, overwrite=overwrite)
+
+    plt.show()
+
+###########################################################
+### FUNCTIONS FOR ANALYZING AND COMPARING MULTIPLE RUNS ###
+###########################################################
+
+def _folder_value(name):
+    """
+    Current (or B) value from a run folder name, skipping the run number.
+    """
+    try: # decimal number exctraction:
+        return float(re.findall("(?<!run_)|(?<!run_\d)-?\d+\.\d+", name)[0])
+                                #(?<!run_)-?\d+\.\d+ (orig. decimal)
+                                # (?<!run_)-?\d+ (orig non-decimal)
+    except: # non-decimal number exctraction:
+        return float(re.findall("(?<!run_)(?<!run_\d)-?\d+", name)[0])
+
+
+def _scan_runs(FOLDER, old_runs=()):
+    """
+    Run folders of a sample folder (natsorted), reusing the entries of old_runs whose folder did not change.
+    """
+    old_runs = {run["name"]: run for run in old_runs}
+    runs = []
+    for name in natsorted(os.listdir(FOLDER)):
+        path = FOLDER + "/" + name
+        if os.path.isdir(path) == True and name != "results": # skip files, keep folders
+            mtime = os.path.getmtime(path)
+            run = old_runs.get(name)
+            if run is None or run["mtime"] != mtime:
+                run = {"name": name, "value": _folder_value(name), "mtime": mtime, "files": natsorted(os.listdir(path))}
+            runs.append(run)
+    return runs
+
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def experiment_catalog(exp_folder, hall_suffix=None, rebuild=False):
+    """
+    On-disk catalog of an experiment tree (see multifolder_extract for the folder structure), stored as
+    Experiment_folder/Results/ddm_catalog.json: samples, their run folders with current values (from the folder names),
+    the files in every run folder (corr.npz, fit results, ...), the files in the samples' results folders,
+    Hall probe data (current, Hall voltage) and the polarizers config.
+    Every call checks the folder modification times and only rescans the folders that changed, so repeated
+    scans of a large tree become a few os.stat calls.
+
+    Parameters:
+        exp_folder (str): Path to the folder containing all samples' experiments.
+        hall_suffix (str or None): also keep the Hall probe data results/DDM_results_Hall_{hall_suffix}.txt of every sample
+            (None if there is no such file) up to date.
+        rebuild (bool): ignore the stored catalog and scan the whole tree.
+
+    Returns:
+        dict: catalog with keys "order" (sample names in os.listdir order), "samples" (sample -> {"runs": [{"name", "value",
+            "mtime", "files"}, ...], "results_files", "hall": {suffix: {"current", "volt_hall", "mtime"} or None}, ...}) and "polarizers".
+    """
+    filename = os.path.join(exp_folder, "Results", CATALOG_NAME)
+    catalog = None
+    if rebuild != True and os.path.exists(filename):
+        try:
+            with open(filename) as file:
+                catalog = json.load(file)
+        except ValueError:
+            print("Broken experiment catalog, rebuilding it.")
+    if catalog is None or catalog.get("version") != CATALOG_VERSION:
+        catalog = {"version": CATALOG_VERSION, "mtime": None, "order": [], "samples": {}}
+    changed = False
+
+    mtime = os.path.getmtime(exp_folder)
+    if catalog["mtime"] != mtime: # samples added / removed
+        catalog["order"] = [name for name in os.listdir(exp_folder) if os.path.isdir(exp_folder + "/" + name) == True and name != "Results"] # skip files, keep folders
+        catalog["samples"] = {name: catalog["samples"].get(name) for name in catalog["order"]}
+        catalog["mtime"], catalog["polarizers"] = mtime, extract_polarizers_config(exp_folder)
+        changed = True
+
+    for sample in catalog["order"]:
+        FOLDER = exp_folder + "/" + sample
+        entry = catalog["samples"][sample]
+        sample_mtime = os.path.getmtime(FOLDER)
+        if entry is None or entry["mtime"] != sample_mtime: # runs added / removed
+            entry = {"mtime": sample_mtime, "runs": _scan_runs(FOLDER, entry["runs"] if entry else ()),
+                     "results_mtime": None, "results_files": [], "hall": entry["hall"] if entry else {}}
+            catalog["samples"][sample] = entry
+            changed = True
+        else: # files added / removed in the run folders
+            for i, run in enumerate(entry["runs"]):
+                run_mtime = os.path.getmtime(FOLDER + "/" + run["name"])
+                if run_mtime != run["mtime"]:
+                    entry["runs"][i] = dict(run, mtime=run_mtime, files=natsorted(os.listdir(FOLDER + "/" + run["name"])))
+                    changed = True
+
+        results_mtime = _mtime(FOLDER + "/results")
+        if entry["results_mtime"] != results_mtime:
+            entry["results_mtime"], entry["results_files"] = results_mtime, natsorted(os.listdir(FOLDER + "/results")) if results_mtime else []
+            changed = True
+
+        if hall_suffix is not None:
+            hall_file = FOLDER + "/results/DDM_results_Hall_" + hall_suffix + ".txt"
+            hall_mtime = _mtime(hall_file)
+            hall = entry["hall"].get(hall_suffix)
+            if hall_suffix not in entry["hall"] or (hall or {}).get("mtime") != hall_mtime:
+                hall = None
+                if hall_mtime is not None:
+                    current, volt_hall = np.loadtxt(hall_file, delimiter=",", unpack=True)
+                    hall = {"mtime": hall_mtime, "current": np.atleast_1d(current).tolist(), "volt_hall": np.atleast_1d(volt_hall).tolist()}
+                entry["hall"][hall_suffix] = hall
+                changed = True
+
+    if changed == True:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as file:
+            json.dump(catalog, file)
+    return catalog
+
+
+def catalog_runs(exp_folder, filename=None, sample=None):
+    """
+    Run folders of the experiment (from the catalog, see experiment_catalog), optionally only of one sample
+    and / or only the ones containing a given file (e.g. "fit_full_tol0.2.npz").
+    """
+    catalog = experiment_catalog(exp_folder)
+    return [exp_folder + "/" + name + "/" + run["name"] for name in catalog["order"] if sample is None or name == sample
+            for run in catalog["samples"][name]["runs"] if filename is None or filename in run["files"]]
+
+
+def multifolder_extract(exp_folder, suffix="", description="", halldata=False, use_catalog=True):
+    '''
+    Perform a scan through the folders with results from experiments with different magnetic fields,
+    extract relevant information and create arrays, used in later analysis:
+        - array of sample names
+        - 2D array of different magnetic field values folder (array of 1D arrays)
+        - list of 1D arrays of magnetic field values at each experiment
+
+    We may use Hall probe results file to determine magnetic field values.
+    If Hall file is not present, el. current values will be used for x-axis.
+
+    The data must be stored in the following folder structure:
+
+        Experiment_folder/
+        ├── Sample 1/
+        │   ├── Current_value 1/
+        │   │   └── measured DDM files (corr.npz, var.npz etc)
+        │   ├── Current_value 2/
+        │   │   └── measured DDM files (corr.npz, var.npz etc)
+        │   ├── ...
+        │   │
+        │   └── Results
+        │       └── DDM_results_Hall.txt (optional)
+        │
+        ├── Sample 2/
+        │   ├── ...
+        │
+        └── ...
+
+    The function should be able to convert different types of folder names (decimal, non-decimal etc) to number arrays, skipping individual files and results folders.
+
+    Parameters:
+    - exp_folder (str): Path to the folder containing all samples' experiments.\n
+    - suffix (str, optional): Suffix of the Hall probe data filename. Defaults to "".\n
+    - description (str, optional): Description of the saved plot filename. Defaults to "".\n
+    - halldata (bool, optional): Flag to indicate whether to use Hall probe data for B values. Defaults to False.\n
+    - use_catalog (bool, optional): Use the on-disk experiment catalog, rescanning only folders that changed (see experiment_catalog).
+      False = rescan the whole tree (the catalog is rebuilt). Defaults to True.\n
+
+    Returns:
+    - xlabel (str): Label for the x-axis in subsequent plots (depends on the Hall data).
+    - exp_folder (str): Path to the experiment folder containing all samples' experiments.
+    - samplelist_full (list): List of sample names within the experiment folder.
+    - folderlist_full (list): List of lists containing the folders within each sample.
+    - B_array_full (list): List of arrays containing the B values for each folder.
+    '''
+
+    catalog = experiment_catalog(exp_folder, hall_suffix=suffix if halldata == True else None, rebuild=use_catalog != True)
+
+    samplelist_full = []
+    folderlist_full = []
+    B_array_full = []
+    for sample in catalog["order"]:
+        entry = catalog["samples"][sample]
+        samplelist_full.append(sample)
+        initial_settings2(exp_folder, sample)
+        FOLDER = exp_folder + "/" + sample
+        xlabel = r"I [mA] (1 A $\approx$ 30 mT)"
+
+        # folders (natsorted) and B array from their names:
+        folderlist = [FOLDER + '/' + run["name"] for run in entry["runs"]] # make absolute path
+        B_array = np.array([run["value"] for run in entry["runs"]], dtype=float) # for current or magnetic field values
+        folderlist_full.append(folderlist)
+
+        if halldata == True: # Update B array with B values, calculated from Hall probe
+            hall = entry["hall"].get(suffix)
+            if hall is None:
+                raise FileNotFoundError(FOLDER + "/results/DDM_results_Hall_" + suffix + ".txt not found.")
+            volt_hall = hall["volt_hall"]
+
+            if len(volt_hall) == len(B_array): # if something is wrong, just use current values
+                xlabel = "B [mT]"
+                B_array = np.array([])
+                for volt in volt_hall:
+                    B_array = np.append(B_array, magnetic_field(volt/1000))
+            else: print("Legnth mismatch. Using current values instead.")
+        B_array_full.append(B_array)
+
+    return xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full
+
+
+# quantities stored in a fit cube (see build_fit_cube):
+CUBE_QUANTITIES = ["fit_tau_array", "sigma_tau_array", "fit_C0_array", "sigma_C0_array", "amplitude_array"]
+
+
+def _run_fit(folder, tolerance, deltat=None, fit_missing=False):
+    """
+    Full-grid fit of a run folder for the fit cube: fit_full_tol*.npz, else fit_dual.npz (select_by_tolerance),
+    else a new fit_corr_full fit through the fit cache if fit_missing (needs deltat).
+
+    Returns:
+        tuple: fit result (None if there is none) and its source ("fit_full", "fit_dual", "fitted" or None).
+    """
+    fit_result = load_full_fit(folder, tolerance)
+    if fit_result is not None:
+        return fit_result, "fit_full"
+    dual_fit = load_dual_fit(folder)
+    if dual_fit is not None:
+        return select_by_tolerance(dual_fit, tolerance, with_popt=False), "fit_dual"
+    if fit_missing == True and deltat is not None:
+        return fit_run_folder(folder, deltat, tolerance=tolerance), "fitted"
+    return None, None
+
+
+def build_fit_cube(exp_folder, tolerance=0.2, halldata=False, suffix="", deltat=None, fit_missing=False, out_folder=None):
+    """
+    Packs the full-grid fits of all runs of an experiment into one cube (sample, B, kx, ky), one memory-mappable .npy file
+    per quantity (CUBE_QUANTITIES) plus coords.json with the coordinate labels (samples, B values, run folders, polarizers).
+    The cube is written run by run, so it is never held in memory as a whole. Runs without a fit (and missing runs of
+    samples with fewer fields) are NaN. Open it with FitCube and query it with FitCube.select.
+
+    Parameters:
+        exp_folder (str): Path to the folder containing all samples' experiments (see multifolder_extract).
+        tolerance (float): tolerance of the fits (fit_full_tol{tolerance}.npz, or selected from fit_dual.npz).
+        halldata (bool): B values from Hall probe data (see multifolder_extract), else currents.
+        suffix (str): Suffix of the Hall probe data filename.
+        deltat (float or None): time step, needed for fit_missing.
+        fit_missing (bool): fit runs without an existing fit (fit_run_folder, stored in the fit cache).
+        out_folder (str or None): where to write the cube, default Experiment_folder/Results/fit_cube_tol{tolerance}.
+
+    Returns:
+        FitCube: the new cube.
+    """
+    call_args = dict(locals()) # for the output registry (see update_experiment)
+    xlabel, exp_folder, samplelist, folderlist_full, B_array_full = multifolder_extract(exp_folder, suffix=suffix, halldata=halldata)
+    out_folder = out_folder or os.path.join(exp_folder, "Results", f"fit_cube_tol{tolerance}")
+    os.makedirs(out_folder, exist_ok=True)
+    n_runs = [len(folderlist) for folderlist in folderlist_full]
+    n_B = max(n_runs, default=0)
+
+    cube, sources = None, []
+    for i, folderlist in enumerate(tqdm(folderlist_full, desc="Building fit cube", ncols=100, colour="#82e0aa")):
+        sources.append([])
+        for j, SUBFOLDER in enumerate(folderlist):
+            fit_result, source = _run_fit(SUBFOLDER, tolerance, deltat=deltat, fit_missing=fit_missing)
+            sources[i].append(source)
+            if fit_result is None:
+                print(f"No fit in {SUBFOLDER}.")
+                continue
+            t, corr = load_corr(SUBFOLDER)
+            maps = dict(fit_result, amplitude_array=np.abs(corr[..., 0]))
+            if cube is None: # the k-grid is known from the first fitted run
+                shape = (len(samplelist), n_B) + maps["fit_tau_array"].shape
+                cube = {quantity: open_memmap(os.path.join(out_folder, quantity + ".npy"), mode="w+", dtype=float, shape=shape) for quantity in CUBE_QUANTITIES}
+                for array in cube.values():
+                    array[:] = np.nan
+            for quantity in CUBE_QUANTITIES:
+                cube[quantity][i, j] = maps[quantity]
+    if cube is None:
+        print("No fits found, the fit cube is empty.")
+        return None
+    for array in cube.values():
+        array.flush()
+    del cube
+
+    coords = {"samples": samplelist,
+              "B": [np.asarray(B_array, dtype=float).tolist() for B_array in B_array_full],
+              "folders": folderlist_full,
+              "sources": sources,
+              "xlabel": xlabel,
+              "polarizers": extract_polarizers_config(exp_folder),
+              "tolerance": tolerance,
+              "quantities": CUBE_QUANTITIES,
+              "created": str(datetime.datetime.now())}
+    with open(os.path.join(out_folder, "coords.json"), "w") as file:
+        json.dump(coords, file, indent=1)
+    _record_output(build_fit_cube, call_args, exp_folder, samplelist, os.path.join(out_folder, "coords.json"))
+    return FitCube(out_folder)
+
+
+class FitCube(object):
+    """
+    Fit cube of an experiment (see build_fit_cube): quantities (sample, B, kx, ky) as read-only memory maps,
+    so a query only reads the values it needs.
+    Coordinates: samples (list), B (list of B arrays, one per sample), folders, polarizers, xlabel, tolerance.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "coords.json")) as file:
+            self.coords = json.load(file)
+        self.samples = self.coords["samples"]
+        self.B = [np.array(B_array, dtype=float) for B_array in self.coords["B"]]
+        self.folders = self.coords["folders"]
+        self.polarizers = self.coords["polarizers"]
+        self.xlabel = self.coords["xlabel"]
+        self.arrays = {quantity: np.load(os.path.join(folder, quantity + ".npy"), mmap_mode="r") for quantity in self.coords["quantities"]}
+        self.shape = self.arrays["fit_tau_array"].shape
+
+    def select(self, sample=None, B=None, kx=None, ky=None, quantity="fit_tau_array"):
+        """
+        Vectorized gather from the cube. Every coordinate is optional (None = all), a single value drops the dimension.
+
+        Parameters:
+            sample (str or None): sample name. None = all samples (B axis padded with NaN to the longest sample).
+            B (float or None): field (or current) value, the closest run of every sample is taken. None = all runs.
+            kx, ky (int, list, slice or None): k-grid indices (lists select all their combinations).
+            quantity (str): one of CUBE_QUANTITIES.
+
+        Returns:
+            numpy.ndarray: the selected values, dimensions in the order (sample, B, kx, ky).
+        """
+        data = self.arrays[quantity]
+        if sample is not None:
+            index_s = self.samples.index(sample)
+            data = data[index_s]
+            if B is None:
+                data = data[:len(self.B[index_s])]
+            else:
+                data = data[closest_element_index(self.B[index_s], B)]
+        elif B is not None:
+            data = data[np.arange(len(self.samples)), [closest_element_index(B_array, B) for B_array in self.B]]
+        if kx is not None:
+            data = data[..., kx, :]
+        if ky is not None:
+            data = data[..., ky]
+        return np.array(data)
+
+    def B_array(self, sample):
+        """
+        B (or current) values of the runs of a sample.
+        """
+        return self.B[self.samples.index(sample)]
+
+
+def _corr_digests(corr):
+    # (kx, ky) array of 64-bit digests of the single k-point curves, a changed point changes only its digest
+    corr = np.ascontiguousarray(corr)
+    curves = corr.reshape(corr.shape[0] * corr.shape[1], -1)
+    return np.array([int.from_bytes(hashlib.blake2b(curve.tobytes(), digest_size=8).digest(), "little") for curve in curves],
+                    dtype=np.uint64).reshape(corr.shape[:2])
+
+
+def _corr_file(folder):
+    # the file corr is loaded from (corr.npz, or corr.npy after convert_corr_to_npy(remove_npz=True))
+    return folder + "/" +  ("corr.npz" if os.path.exists(folder + "/" +  "corr.npz") else "corr.npy")
+
+
+def run_state(folder):
+    """
+    Dependency state of a run folder (folder/ddm_state.json, written by update_experiment), None if there is none:
+    revision (raised every time a stored result of the run changes), corr (mtime, size of the corr file)
+    and fits ("fit_full_tol{tolerance}" -> deltat, engine, fit settings and FIT_CACHE_VERSION the stored fit was made with,
+    "unknown" for fits that existed before the first update).
+    The digests of the single k-point curves are kept next to it in ddm_state_points.npy.
+    """
+    filename = folder + "/" +  STATE_NAME
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename) as file:
+            state = json.load(file)
+    except ValueError:
+        print(f"Broken state file {filename}, the run is analyzed again.")
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+
+def _save_run_state(folder, state, digests):
+    _save_npy(folder + "/" +  "ddm_state_points.npy", digests)
+    with open(folder + "/" +  STATE_NAME + ".tmp", "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(folder + "/" +  STATE_NAME + ".tmp", folder + "/" +  STATE_NAME) # written last, after the results
+
+
+def _json_value(value):
+    # plain JSON form of fit options (arrays, tuples -> lists), they can be passed to the fit again
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def _fit_settings(deltat, fit_kwargs, engine="batched"):
+    # what a stored full fit depends on besides corr (in the form it has after a round trip through the state file)
+    return json.loads(json.dumps({"deltat": _json_value(deltat), "version": FIT_CACHE_VERSION, "engine": engine, "fit_kwargs": _json_value(dict(fit_kwargs))}))
+
+
+# full-grid fits of update_run (engine names as in fit_corr_full_parallel):
+_UPDATE_ENGINES = {"batched": fit_corr_full, "curve_fit": fit_corr_loop}
+
+
+def update_run(folder, deltat, tolerance=0.2, engine=None, **fit_kwargs):
+    """
+    Bring the stored results of one run folder up to date with its corr data (see update_experiment):
+    new run -> full-grid fit fit_full_tol{tolerance}.npz; changed corr -> only the changed k-points of every stored full fit
+    (with the engine and settings it was made with) and of the FitMap files (fitmap_tol*.npz) are fitted again;
+    changed fit settings -> full refit.
+    Runs without a state file keep their existing fit_full files if they are not older than corr, with unknown settings
+    (they may be curve_fit maps or corrected by hand). They are only replaced by a whole-grid fit when an engine is given;
+    if corr changes without one, the file is kept and marked "stale" in the run state.
+
+    Parameters:
+        folder (str): run folder.
+        deltat (float): time step.
+        tolerance (float): tolerance of the full fit of a new run.
+        engine (str or None): "batched" (fit_corr_full) or "curve_fit" (fit_corr_loop). None = "batched" for new fits,
+            existing fits of unknown settings are kept.
+        **fit_kwargs: options (cutoff, bounds, ...) of the fit with this tolerance.
+
+    Returns:
+        dict: status ("clean" = nothing fitted, "new" or "changed"), refit (number of refitted points) and revision.
+    """
+    if engine is not None and engine not in _UPDATE_ENGINES:
+        raise ValueError(f"Unknown fitting engine {engine}, use one of {list(_UPDATE_ENGINES)}.")
+    state = run_state(folder)
+    corr_file = _corr_file(folder)
+    stamp = {"mtime": os.path.getmtime(corr_file), "size": os.path.getsize(corr_file)}
+    settings = _fit_settings(deltat, dict(fit_kwargs, tolerance=tolerance), engine or "batched")
+    name = f"fit_full_tol{tolerance}"
+    if state is not None and state["corr"] == stamp and (state["fits"].get(name) == settings or (state["fits"].get(name) in ["unknown", "stale"] and engine is None)):
+        return {"status": "clean", "refit": 0, "revision": state["revision"]}
+
+    t, corr = load_corr(folder, deltat)
+    digests = _corr_digests(corr)
+    fits = {}
+    if state is None: # first update: adopt the existing full fits that are not older than corr, it is not known how they were made
+        status, changed = "new", np.ones(digests.shape, dtype=bool)
+        for filename in natsorted(os.listdir(folder)):
+            match = re.fullmatch(r"fit_full_tol(.*)\.npz", filename)
+            if match and os.path.getmtime(folder + "/" + filename) >= stamp["mtime"]:
+                fits[filename[:-4]] = "unknown"
+                status, changed = "changed", np.zeros(digests.shape, dtype=bool)
+    else:
+        status, fits = "changed", dict(state["fits"])
+        old_digests = np.load(folder + "/" +  "ddm_state_points.npy") if os.path.exists(folder + "/" +  "ddm_state_points.npy") else None
+        changed = np.ones(digests.shape, dtype=bool) if old_digests is None or old_digests.shape != digests.shape else old_digests != digests
+    if name not in fits or (fits[name] != settings and (fits[name] not in ["unknown", "stale"] or engine is not None)):
+        fits[name] = None # new fit or new fit settings, fitted on the whole grid
+
+    refit = 0
+    for fit_name, fit_settings in fits.items():
+        if fit_settings in ["unknown", "stale"]:
+            if fit_settings == "unknown" and not np.any(changed):
+                continue
+            if engine is None: # not replaced by a default fit, the map may be a curve_fit map or corrected by hand
+                print(f"{folder}: {fit_name}.npz of unknown fit settings is kept although corr changed, give an engine to fit it again.")
+                fits[fit_name] = "stale"
+                continue
+            fit_settings = None # changed points can not be fitted the way the rest of the map was, whole grid again
+        fit_tolerance = float(fit_name[len("fit_full_tol"):])
+        if fit_name == name:
+            kwargs, fit_engine = dict(fit_kwargs, tolerance=tolerance), engine or "batched"
+        elif fit_settings is None:
+            kwargs, fit_engine = {"tolerance": fit_tolerance}, engine
+        else:
+            kwargs, fit_engine = dict(fit_settings["fit_kwargs"], tolerance=fit_tolerance), fit_settings.get("engine", "batched")
+        stored = load_full_fit(folder, fit_name[len("fit_full_tol"):], overrides=False)
+        if fit_settings is None or stored is None:
+            save_full_fit(folder, fit_name[len("fit_full_tol"):], cached_fit(folder, corr, t, _UPDATE_ENGINES[fit_engine], deltat=deltat, **kwargs))
+            refit += digests.size
+        elif np.any(changed):
+            mask = changed if kwargs.get("mask") is None else changed & np.asarray(kwargs["mask"], dtype=bool)
+            partial = _UPDATE_ENGINES[fit_engine](corr, t, **dict(kwargs, mask=mask)) # same engine as the stored map
+            for key in partial:
+                if key in stored:
+                    stored[key] = np.array(stored[key])
+                    stored[key][changed] = partial[key][changed]
+            save_full_fit(folder, fit_name[len("fit_full_tol"):], stored)
+            refit += int(np.sum(changed))
+        fits[fit_name] = _fit_settings(deltat, kwargs, fit_engine)
+
+    if state is not None and np.any(changed): # single point fits of the FitMap files and manual corrections
+        for filename in natsorted(os.listdir(folder)):
+            match = re.fullmatch(r"fitmap_tol(.*)\.npz", filename)
+            if match:
+                fitmap = FitMap(folder, deltat=deltat, tolerance=float(match.group(1)), use_existing_fit=False, corr=corr, t=t)
+                for kx, ky in fitmap._load_saved():
+                    if changed[kx, ky]:
+                        fitmap.point(kx, ky)
+                        refit += 1
+                fitmap.flush()
+        for (override_tolerance, kx, ky), record in _override_index(folder).items():
+            if record[3] > 0 and kx < changed.shape[0] and ky < changed.shape[1] and changed[kx, ky]:
+                print(f"{folder}: corr of the corrected point ({kx}, {ky}), tolerance {override_tolerance} changed, check the correction.")
+    with _FIT_MAPS_LOCK:
+        for key in [key for key in _FIT_MAPS if key[0] == os.path.abspath(folder)]:
+            del _FIT_MAPS[key]
+
+    revision = (state["revision"] if state is not None else 0) + (1 if refit > 0 or state is None else 0)
+    _save_run_state(folder, {"version": STATE_VERSION, "revision": revision, "corr": stamp, "fits": fits,
+                             "updated": str(datetime.datetime.now())}, digests)
+    return {"status": status if refit > 0 else "clean", "refit": refit, "revision": revision}
+
+
+# not recorded in the output registry (objects, plotting and speed options):
+_OUTPUT_IGNORED = ["cube", "prefetch", "show_fit_plots", "save_fit_plots", "showplot", "plotshow", "plotsave", "overwrite", "output_files"]
+
+
+def _json_serializable(value):
+    try:
+        json.dumps(value)
+        return True
+    except TypeError:
+        return False
+
+
+def _record_output(function, call_args, exp_folder, samples, filename):
+    """
+    Register an aggregate output in Results/ddm_outputs.json: the function, its arguments, the revisions
+    of the runs of the samples it was made from and its file(s) (filename: str or list, the first is the main output),
+    so update_experiment can make it again when one of them changes.
+    """
+    parameters = list(inspect.signature(function).parameters)
+    kwargs = {name: call_args[name] for name in parameters[1:] if name in call_args and name not in _OUTPUT_IGNORED}
+    try:
+        json.dumps(kwargs)
+    except TypeError:
+        unsaved = [name for name, value in kwargs.items() if not _json_serializable(value)]
+        warnings.warn(f"{function.__name__} output {os.path.basename(filename if isinstance(filename, str) else filename[0])} is not tracked "
+                      f"by update_experiment: arguments {unsaved} can not be stored in {OUTPUTS_NAME}.", stacklevel=3)
+        return
+    registry_file = os.path.join(exp_folder, "Results", OUTPUTS_NAME)
+    registry = {}
+    if os.path.exists(registry_file):
+        with open(registry_file) as file:
+            registry = json.load(file)
+    key = hashlib.blake2b(json.dumps([function.__name__, kwargs], sort_keys=True).encode(), digest_size=8).hexdigest()
+    files = [filename] if isinstance(filename, str) else list(filename)
+    registry[key] = {"function": function.__name__,
+                     "kwargs": kwargs,
+                     "samples": list(samples),
+                     "runs": _run_revisions(exp_folder, samples),
+                     "file": os.path.relpath(files[0], exp_folder),
+                     "files": [os.path.relpath(name, exp_folder) for name in files],
+                     "created": str(datetime.datetime.now())}
+    with open(registry_file + ".tmp", "w") as file:
+        json.dump(registry, file, indent=2)
+    os.replace(registry_file + ".tmp", registry_file)
+
+
+def _run_revisions(exp_folder, samples):
+    # run folder (relative to exp_folder) -> revision of its results (0 = never updated)
+    return {os.path.relpath(run, exp_folder): (run_state(run) or {"revision": 0})["revision"]
+            for sample in samples for run in catalog_runs(exp_folder, sample=sample)}
+
+
+def update_experiment(exp_folder, deltat, tolerance=0.2, regenerate=True, **fit_kwargs):
+    """
+    Incremental re-analysis of an experiment: every run folder is brought up to date with update_run
+    (a run without changes costs two os.stat calls, new runs are fitted, changed runs only in their changed k-points)
+    and then only the aggregate outputs (Results/*.npz of multimeasurement_comparison_B, the different_qs functions
+    and build_fit_cube, registered in Results/ddm_outputs.json when they are made) whose runs changed or got new runs
+    are made again (see regenerate_outputs).
+
+    Parameters:
+        exp_folder (str): Path to the folder containing all samples' experiments.
+        deltat (float): time step.
+        tolerance (float): tolerance of the full fits of new runs.
+        regenerate (bool): make the affected aggregate outputs again.
+        **fit_kwargs: update_run options (engine, cutoff, bounds, ...).
+
+    Returns:
+        dict: new, changed (run folders) and outputs (regenerated output files).
+    """
+    summary = {"new": [], "changed": [], "outputs": []}
+    for run in tqdm(catalog_runs(exp_folder), desc="Updating runs", ncols=100, colour="#82e0aa"):
+        if not (os.path.exists(run + "/" +  "corr.npz") or os.path.exists(run + "/" +  "corr.npy")):
+            continue
+        result = update_run(run, deltat, tolerance=tolerance, **fit_kwargs)
+        if result["status"] != "clean" and result["refit"] > 0:
+            summary[result["status"]].append(run)
+    print(f"{len(summary['new'])} new and {len(summary['changed'])} changed runs.")
+    if regenerate == True:
+        summary["outputs"] = regenerate_outputs(exp_folder)
+    return summary
+
+
+def regenerate_outputs(exp_folder):
+    """
+    Make the registered aggregate outputs (Results/ddm_outputs.json, see update_experiment) again
+    if the revisions of their runs changed or their samples got new runs. Returns the list of regenerated files.
+    The functions (_OUTPUT_FUNCTIONS) overwrite the registered files (output_files) and do not show their plots.
+    """
+    registry_file = os.path.join(exp_folder, "Results", OUTPUTS_NAME)
+    if not os.path.exists(registry_file):
+        return []
+    with open(registry_file) as file:
+        registry = json.load(file)
+    outputs = []
+    for entry in registry.values():
+        if _run_revisions(exp_folder, entry["samples"]) == entry["runs"]:
+            continue
+        function = _OUTPUT_FUNCTIONS.get(entry["function"])
+        if function is None:
+            print(f"{entry['file']}: {entry['function']} can not make registered outputs, skipped.")
+            continue
+        parameters = inspect.signature(function).parameters
+        quiet = {name: False for name in ["show_fit_plots", "save_fit_plots", "showplot", "plotshow"] if name in parameters}
+        if "output_files" in parameters:
+            quiet["output_files"] = [os.path.join(exp_folder, name) for name in entry.get("files", [entry["file"]])]
+        print(f"Updating {entry['file']} ({entry['function']})")
+        function(exp_folder, **dict(entry["kwargs"], **quiet))
+        plt.close()
+        outputs.append(entry["file"])
+    return outputs
+
+
+# index of the runs fitted by watch_experiment (Experiment_folder/Results/ddm_results_index.json):
+INDEX_NAME = "ddm_results_index.json"
+
+
+def _save_preview(folder, fit_tau_array, tolerance):
+    """
+    Preview plot of the fitted 1/tau map of a run (folder/preview_tol{tolerance}.png), in the (q_parallel, q_perp) layout of plot_2D.
+    """
+    data = np.fft.fftshift(np.asarray(fit_tau_array, dtype=float), axes=0)
+    x = np.fft.fftshift(np.fft.fftfreq(len(data), 1/len(data)))
+    y = np.arange(data.shape[1])
+    filename = os.path.join(folder, f"preview_tol{tolerance}.png")
+    fig = plt.figure()
+    plt.pcolormesh(q(x), q(y), np.transpose(data), cmap="plasma", shading="nearest")
+    plt.title(r"Fitted correlation times 1 / $\tau$")
+    plt.suptitle("c-DDM: " + os.path.basename(os.path.dirname(os.path.abspath(folder))) + ", " + os.path.basename(folder))
+    plt.xlabel("$q_\parallel (1/m)$")
+    plt.ylabel("$q_\perp$ (1/m)")
+    plt.colorbar(label=r"1 / $\tau$ (1/s)")
+    plt.savefig(filename)
+    plt.close(fig)
+    return filename
+
+
+def _watch_worker(folder, deltat, tolerance, preview, fit_kwargs):
     """
-    Fits the linear function to the array of fitted $a$ values from quadratic functions.
+    Task of watch_experiment, runs in a worker process: update_run of the folder and its results index entry.
+    """
+    start = time.time()
+    result = update_run(folder, deltat, tolerance=tolerance, **fit_kwargs)
+    fit_result = load_full_fit(folder, tolerance)
+    entry = dict(result, tolerance=tolerance, fit_time_s=time.time() - start, finished=str(datetime.datetime.now()))
+    if fit_result is not None:
+        fit_tau_array = np.asarray(fit_result["fit_tau_array"], dtype=float)
+        finite = np.isfinite(fit_tau_array)
+        entry.update(median_oneovertau=float(np.median(fit_tau_array[finite])) if np.any(finite) else None,
+                     finite_fraction=float(np.mean(finite)))
+        if preview == True and (result["status"] != "clean" or not os.path.exists(os.path.join(folder, f"preview_tol{tolerance}.png"))):
+            entry["preview"] = os.path.basename(_save_preview(folder, fit_tau_array, tolerance))
+    return entry
+
+
+def watch_experiment(exp_folder, deltat, tolerance=0.2, interval=10, settle=2, workers=None, preview=True, regenerate=False, idle_timeout=None, **fit_kwargs):
+    """
+    Live analysis during an acquisition (e.g. magnetic_setup_functions.run): the experiment tree is polled every interval
+    seconds (plain os.stat calls through experiment_catalog, no OS-specific file events). A run folder counts as complete
+    when its corr.npz did not change (mtime, size) for settle polls in a row, then its full-grid fit (update_run) is queued
+    on a pool of worker processes. Every finished run is added to Results/ddm_results_index.json
+    (status, revision, median 1/tau, finite fraction, preview plot) and gets a preview plot preview_tol{tolerance}.png.
+    Runs that are already up to date (see update_experiment) are only added to the index, a rewritten corr.npz is fitted again.
+    Stop it with Ctrl+C (or idle_timeout), the running fits are finished first.
+    On Windows call it under if __name__ == "__main__": (worker processes, as fit_corr_full_parallel).
 
     Parameters:
-        fit_a_array (numpy.ndarray): The array of fit $a$ values.\n
-        ky_array (numpy.ndarray): The array of k_y values.\n
-        plotshow (bool): Whether to show the plot of the fit (default is True).\n
-        plotsave (bool): Whether to save the plot (default is False). \n
-        overwrite (bool): Whether to overwrite existing file (default is False).
+        exp_folder (str): Path to the folder containing all samples' experiments.
+        deltat (float): time step.
+        tolerance (float): tolerance of the full fits.
+        interval (float): seconds between two polls.
+        settle (int): number of polls a corr.npz must stay unchanged before the run is fitted.
+        workers (int or None): number of worker processes (None = all cores).
+        preview (bool): save preview plots.
+        regenerate (bool): make the registered aggregate outputs again (regenerate_outputs) when all queued fits are done.
+        idle_timeout (float or None): stop after this many seconds without new runs and running fits (None = run until Ctrl+C).
+        **fit_kwargs: update_run options (engine, cutoff, bounds, ...).
 
     Returns:
-        tuple: A tuple containing the fit k, fit y0, sigma k, and sigma y0 values.
+        dict: results index (run folder relative to exp_folder -> entry).
     """
+    os.makedirs(os.path.join(exp_folder, "Results"), exist_ok=True)
+    index_file = os.path.join(exp_folder, "Results", INDEX_NAME)
+    index = {}
+    if os.path.exists(index_file):
+        with open(index_file) as file:
+            index = json.load(file)
+    seen = {} # run -> [corr.npz (mtime, size), number of polls without change]
+    done = {} # run -> corr.npz (mtime, size) it was fitted with
+    running = {} # future -> (run, stamp)
+    last_activity = time.time()
+    print(f"Watching {exp_folder} (Ctrl+C to stop) ...")
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            for run in catalog_runs(exp_folder, "corr.npz"):
+                corr_file = run + "/" +  "corr.npz"
+                try:
+                    stamp = [os.path.getmtime(corr_file), os.path.getsize(corr_file)]
+                except OSError: # removed / being replaced
+                    continue
+                if done.get(run) == stamp or any(running_run == run for running_run, _ in running.values()):
+                    continue
+                if seen.get(run, [None])[0] != stamp:
+                    seen[run] = [stamp, 0]
+                    continue
+                seen[run][1] += 1
+                if seen[run][1] >= settle:
+                    running[executor.submit(_watch_worker, run, deltat, tolerance, preview, fit_kwargs)] = (run, stamp)
+                    print(f"{run}: complete, fitting.")
+                    last_activity = time.time()
+
+            finished = [future for future in running if future.done()]
+            for future in finished:
+                run, stamp = running.pop(future)
+                try:
+                    entry = future.result()
+                except Exception as exception:
+                    entry = {"status": "error", "error": repr(exception), "finished": str(datetime.datetime.now())}
+                    print(f"{run}: fit failed ({exception!r}).")
+                done[run] = stamp
+                index[os.path.relpath(run, exp_folder)] = entry
+                if entry["status"] != "error" and entry["refit"] > 0:
+                    print(f"{run}: {entry['status']}, {entry['refit']} points fitted in {entry['fit_time_s']:.1f} s.")
+                last_activity = time.time()
+            if finished:
+                with open(index_file + ".tmp", "w") as file:
+                    json.dump(index, file, indent=2)
+                os.replace(index_file + ".tmp", index_file)
+                if regenerate == True and not running:
+                    regenerate_outputs(exp_folder)
+
+            if idle_timeout is not None and not running and time.time() - last_activity > idle_timeout:
+                print("No new runs, stopping.")
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for the running fits ...")
+    finally:
+        executor.shutdown(wait=True)
+    return index
 
 
-    def fit_func_3(x, k, y0):
-        return k * x + y0
-
 
-    popt, pcov = curve_fit(fit_func_3, ky_array, fit_a_array)
+def _existing_full_fit(SUBFOLDER, tolerance):
+    """
+    Existing dense fit of SUBFOLDER with the point overrides merged on it (see apply_overrides): fit_full_tol{tolerance}.npz,
+    else the tolerance independent fit_dual.npz (selected with select_by_tolerance). None if there is neither.
+    """
+    fit_result = load_full_fit(SUBFOLDER, tolerance)
+    if fit_result is None:
+        dual_fit = load_dual_fit(SUBFOLDER)
+        if dual_fit is not None:
+            fit_result = apply_overrides(SUBFOLDER, tolerance, select_by_tolerance(dual_fit, tolerance, with_popt=False))
+    return fit_result
 
-    if plotshow == True:
-        plt.plot(ky_array, fit_a_array, label = "data")
-        plt.title(r"Fitted $a$ parameters")
-        plt.suptitle("c-DDM: " + SAMPLE)
-        plt.xlabel("$k_\perp$")
-        plt.ylabel(r"$a$")
-        plt.plot(ky_array, fit_func_3(ky_array, *popt), c="black", linestyle="--",
-                                 label = "linear fit:"+"\n"+rf"$y_0$ = {round(popt[1],7)} $\pm$ {round(np.sqrt(pcov[1,1]), 7)}"
-                                 + "\n" +
-                                 rf"$k$ = {round(popt[0], 10)}$\pm$ {round(np.sqrt(pcov[0,0]), 9)}")
 
-        plt.legend()
+def _existing_fit_point(SUBFOLDER, kx, ky, tolerance, fit_result=None):
+    """
+    fitC0, fittau, sigmatau, sigmaC0 of one (kx, ky) point from an existing fit in SUBFOLDER: the dense fit with the overrides
+    merged on it (_existing_full_fit, or fit_result if it was already loaded), else the override of the point alone.
+    Raises FileNotFoundError if there is no existing fit of the point.
+    """
+    fit_result = fit_result if fit_result is not None else _existing_full_fit(SUBFOLDER, tolerance)
+    if fit_result is not None:
+        return fit_result["fit_C0_array"][kx, ky], fit_result["fit_tau_array"][kx, ky], fit_result["sigma_tau_array"][kx, ky], fit_result["sigma_C0_array"][kx, ky]
+    override = override_point(SUBFOLDER, kx, ky, tolerance)
+    if override is None:
+        raise FileNotFoundError(f"No existing fit of ({kx}, {ky}) in {SUBFOLDER}.")
+    popt, pcov = override
+    return popt[1], popt[0], pcov[0][0], pcov[1][1]
 
-        if plotsave == True:
-            save_figure("lin_fit_a", overwrite=overwrite)
 
-        plt.show()
+def _existing_popt(SUBFOLDER, kx, ky, tolerance):
+    """
+    Loads popt of the (kx, ky) point from an existing fit in SUBFOLDER: the override of the point first, then popt_pcov_2D.
 
-    return popt[0], popt[1], np.sqrt(pcov[0][0]), np.sqrt(pcov[1][1])
+    Returns:
+        numpy.ndarray or None: popt, None if there is no existing fit.
+    """
+    override = override_point(SUBFOLDER, kx, ky, tolerance)
+    if override is not None:
+        return override[0]
+    try:
+        return np.asarray(cached_load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)["popt_2D"][int(kx), int(ky)], dtype=float)
+    except:
+        return None
 
 
-def amplitude_imshow(var1, var2, corr, vmax=None, cmap="plasma", plotsave=False, overwrite=False):
+def fit_corr_warm(corr, t, kx, ky, prev_popt=None, return_pcov=False, **fit_kwargs):
     """
-    Plots the amplitude of the signal.
+    fit_corr in one (kx, ky) point, started from popt of the previous field step (warm start).
+    If the warm-started fit fails, it is repeated with the default initial parameters of fit_corr.
 
     Parameters:
-        var1 (numpy.ndarray): Values from 1st camera \n
-        var2 (numpy.ndarray): Values from 2nd camera \n
-        corr: Correlation functions data \n
-        vmax: max value (used to cut off weird values)\n
-        cmap: colormap used for imshow \n
-        plotsave (bool): Whether to save the plot (default is False). \n
-        overwrite (bool): Whether to overwrite existing file (default is False).
-    """
-    # amplitude = (average(signal1, signal2))**1/4 * corr at time 0:
-    amplitude = np.abs(corr[...,0]) * ((var1 + var2) / 2)**0.25
-
-    # subplots settings:
-    plt.title("c-DDM amplitude: " + SAMPLE)
-    plt.xlabel(r"$k_\perp$")
-    plt.ylabel(r"$k_\parallel$")
-    plt.imshow(amplitude[1:-1], cmap=cmap, vmax=vmax)
-    plt.colorbar()
-
-    if plotsave == True:
-        save_figure("amplitude_2D" + SAMPLE, overwrite=overwrite)
+        corr (numpy.ndarray): 3D array (kx, ky, t) of correlation data.
+        t (numpy.ndarray): 1D array representing the time values.
+        kx (int): The k_x value.
+        ky (int): The k_y value.
+        prev_popt (numpy.ndarray or None): popt of the same point at the previous field step, [f, C0, y0] or [f, C0, C1, f1, y0].
+            None (or non-finite) = cold start.
+        return_pcov (bool): also return pcov (None if the fit failed) as the last value.
+        **fit_kwargs: passed on to fit_corr (tolerance, plotting options, ...).
 
-    plt.show()
+    Returns:
+        tuple: fitC0, fittau(=1/tau), sigmatau, sigmaC0 and popt (None if the fit failed).
+    """
+    warm_pars = {}
+    if prev_popt is not None and np.all(np.isfinite(prev_popt)):
+        prev_popt = list(np.asarray(prev_popt, dtype=float))
+        if len(prev_popt) == 5: # 2-exp: both fits start from it, 1-exp from the summed amplitude
+            warm_pars = {"init_pars1": [prev_popt[0], prev_popt[1] + prev_popt[2], prev_popt[4]], "init_pars": prev_popt}
+        else:
+            warm_pars = {"init_pars1": prev_popt}
 
-###########################################################
-### FUNCTIONS FOR ANALYZING AND COMPARING MULTIPLE RUNS ###
-###########################################################
+    fitC0, fittau, sigmatau, sigmaC0, popt, pcov = np.nan, np.nan, np.nan, np.nan, None, None
+    for pars in ([warm_pars, {}] if warm_pars else [{}]):
+        try:
+            result = fit_corr(corr, t, kx, ky, old_return=False, **pars, **fit_kwargs)
+            fitC0, fittau, sigmatau, sigmaC0 = result[:4]
+            popt, pcov = result[-2], result[-1]
+        except: # fit_corr failed before popt was assigned
+            continue
+        if np.isfinite(fittau):
+            break
+    if return_pcov == True:
+        return fitC0, fittau, sigmatau, sigmaC0, popt, pcov
+    return fitC0, fittau, sigmatau, sigmaC0, popt
 
-def multifolder_extract(exp_folder, suffix="", description="", halldata=False):
-    '''
-    Perform a scan through the folders with results from experiments with different magnetic fields,
-    extract relevant information and create arrays, used in later analysis:
-        - array of sample names
-        - 2D array of different magnetic field values folder (array of 1D arrays)
-        - list of 1D arrays of magnetic field values at each experiment
 
-    We may use Hall probe results file to determine magnetic field values.
-    If Hall file is not present, el. current values will be used for x-axis.
+class FitMap(object):
+    """
+    Lazy, memoizing fit map of one run folder: fitmap[kx, ky] gives fitC0, fittau(=1/tau), sigmatau, sigmaC0 of that point.
+    Only the requested points are fitted (fit_corr, see fit_corr_warm), every point is done once and kept in memory.
+    With use_existing_fit, existing fits of the folder are used first (fit_full_tol*.npz or fit_dual.npz with the point overrides,
+    see _existing_fit_point), then points fitted earlier by a FitMap, which are stored in the folder as fitmap_tol{tolerance}.npz.
+    Slices (fitmap[:, ky], fitmap[kx, :], fitmap[2:5, 0], ...) give a tuple of arrays fitC0, fittau, sigmatau, sigmaC0.
+    New point fits are written to the fitmap file by flush (once per slice, the multimeasurement functions call flush_fit_maps after their loops).
+
+    corr.npz is only loaded when a point actually has to be fitted (or corr and t can be given directly).
+    Use fit_map to get the same object (and its memo) for a folder across function calls.
+    """
 
-    The data must be stored in the following folder structure:
+    def __init__(self, folder, deltat=1, tolerance=0.2, use_existing_fit=True, corr=None, t=None, **fit_kwargs):
+        self.folder = folder
+        self.deltat = deltat
+        self.tolerance = tolerance
+        self.use_existing_fit = use_existing_fit
+        self.fit_kwargs = fit_kwargs # default fit_corr options of new fits
+        self._corr, self._t = corr, t
+        self._points = {} # (kx, ky) -> [fitC0, fittau, sigmatau, sigmaC0, popt, pcov]
+        self._fitted = set() # points fitted by this object (saved to fitmap file)
+        self._saved = None # points in fitmap file, loaded on first use
+        self._existing = False # existing dense fit with overrides (see _existing_full_fit), loaded on first use
+        self._dirty = False # points fitted since the last save
+
+    @property
+    def filename(self):
+        return os.path.join(self.folder, f"fitmap_tol{self.tolerance}.npz")
+
+    @property
+    def corr(self):
+        if self._corr is None:
+            self._t, self._corr = load_corr(self.folder, self.deltat)
+        return self._corr
+
+    @property
+    def t(self):
+        self.corr
+        return self._t
+
+    def set_data(self, corr, t):
+        """
+        Use already loaded corr and t (e.g. corr.npz loaded by the caller) for new fits.
+        """
+        self._corr, self._t = corr, t
+
+    def _load_saved(self):
+        if self._saved is None:
+            self._saved = {}
+            if os.path.exists(self.filename):
+                saved = cached_load(self.filename)
+                for i, (kx, ky) in enumerate(zip(saved["kx"], saved["ky"])):
+                    popt, pcov = saved["popt"][i], saved["pcov"][i]
+                    n = int(np.sum(np.isfinite(popt))) or len(popt)
+                    self._saved[(int(kx), int(ky))] = list(saved["values"][i]) + [popt[:n], pcov[:n, :n]]
+        return self._saved
+
+    def _lookup(self, key):
+        """
+        Memoized or existing fit of a point, None if there is none.
+        """
+        if key in self._points:
+            return self._points[key]
+        if self._existing is False: # one load for all points instead of file checks in every point
+            self._existing = _existing_full_fit(self.folder, self.tolerance)
+        try:
+            self._points[key] = list(_existing_fit_point(self.folder, key[0], key[1], self.tolerance, fit_result=self._existing)) + [None, None]
+            return self._points[key]
+        except:
+            pass
+        if key in self._load_saved():
+            self._points[key] = self._saved[key]
+            return self._points[key]
+        return None
+
+    def prefetch(self, points):
+        """
+        Look up the existing fits of the points and load corr if any of them has to be fitted
+        (for a memory-mapped corr the curves of these points are read, so they are in the page cache).
+        Called from the prefetch threads (see prefetch_folders), returns the FitMap.
+        """
+        missing = [(int(kx), int(ky)) for kx, ky in points if not self.has_fit(kx, ky)]
+        if missing:
+            corr = self.corr
+            if isinstance(corr, (np.memmap, QuantizedCorr)):
+                for kx, ky in missing:
+                    np.asarray(corr[kx, ky])
+        return self
+
+    def has_fit(self, kx, ky):
+        """
+        True if the point does not have to be fitted (use_existing_fit and a memoized or existing fit of the point).
+        """
+        return self.use_existing_fit == True and self._lookup((int(kx), int(ky))) is not None
+
+    def point(self, kx, ky, prev_popt=None, **fit_kwargs):
+        """
+        Fit of one point: memoized / existing fit if use_existing_fit, else a new fit (fit_corr_warm from prev_popt),
+        which is memoized (and saved to the fitmap file by flush).
+
+        Parameters:
+            kx (int): The k_x value.
+            ky (int): The k_y value.
+            prev_popt (numpy.ndarray or None): warm start of a new fit (see fit_corr_warm).
+            **fit_kwargs: fit_corr options of a new fit (plotting options, ...), added to the ones of the FitMap.
+
+        Returns:
+            tuple: fitC0, fittau(=1/tau), sigmatau, sigmaC0 and popt (None if not known).
+        """
+        key = (int(kx), int(ky))
+        if self.has_fit(*key):
+            return tuple(self._points[key][:4]) + (self.popt(*key),)
+        fit_kwargs = dict(self.fit_kwargs, **fit_kwargs)
+        fit_kwargs.setdefault("tolerance", self.tolerance)
+        fitC0, fittau, sigmatau, sigmaC0, popt, pcov = fit_corr_warm(self.corr, self.t, key[0], key[1], prev_popt=prev_popt, return_pcov=True, **fit_kwargs)
+        self._points[key] = [fitC0, fittau, sigmatau, sigmaC0, popt, pcov]
+        self._fitted.add(key)
+        self._dirty = True
+        return fitC0, fittau, sigmatau, sigmaC0, popt
+
+    def popt_pcov(self, kx, ky):
+        """
+        popt, pcov of a point (fitted if needed). For existing fits they are taken from the override of the point
+        or popt_pcov_2D_tol*.npz (see _existing_full_fit).
+        """
+        key = (int(kx), int(ky))
+        if key not in self._fitted and not self.has_fit(*key):
+            self.point(*key)
+        entry = self._points[key]
+        if entry[4] is None:
+            if self._existing and "popt_2D" in self._existing:
+                entry[4], entry[5] = self._existing["popt_2D"][key], self._existing["pcov_2D"][key]
+            else:
+                entry[4], entry[5] = override_point(self.folder, key[0], key[1], self.tolerance)
+        return entry[4], entry[5]
+
+    def popt(self, kx, ky):
+        """
+        popt of a point, None if it cannot be found (no fitting is done).
+        """
+        if (int(kx), int(ky)) not in self._fitted and not self.has_fit(kx, ky):
+            return None
+        try:
+            return np.asarray(self.popt_pcov(kx, ky)[0], dtype=float)
+        except:
+            return None
+
+    def __getitem__(self, index):
+        kx, ky = index
+        if not isinstance(kx, slice) and not isinstance(ky, slice):
+            return self.point(kx, ky)[:4]
+        n_kx, n_ky = self.corr.shape[:2]
+        kx_list = range(n_kx)[kx] if isinstance(kx, slice) else [kx]
+        ky_list = range(n_ky)[ky] if isinstance(ky, slice) else [ky]
+        values = np.array([[self.point(kxi, kyi)[:4] for kyi in ky_list] for kxi in kx_list], dtype=float)
+        self.flush()
+        values = values[:, 0] if not isinstance(ky, slice) else values[0] if not isinstance(kx, slice) else values
+        return tuple(np.moveaxis(values, -1, 0))
+
+    def save(self):
+        """
+        Save the points fitted by this FitMap (together with the ones already in the file) to fitmap_tol{tolerance}.npz.
+        """
+        points = dict(self._load_saved())
+        points.update({key: self._points[key] for key in self._fitted})
+        if not points:
+            return
+        keys = sorted(points)
+        popt_all, pcov_all = np.full((len(keys), 5), np.nan), np.full((len(keys), 5, 5), np.nan)
+        for i, key in enumerate(keys):
+            popt, pcov = points[key][4], points[key][5]
+            if popt is not None and pcov is not None:
+                popt, pcov = np.asarray(popt, dtype=float), np.asarray(pcov, dtype=float)
+                popt_all[i, :len(popt)], pcov_all[i, :len(popt), :len(popt)] = popt, pcov
+        np.savez(self.filename,
+                 kx=np.array([key[0] for key in keys]),
+                 ky=np.array([key[1] for key in keys]),
+                 values=np.array([points[key][:4] for key in keys], dtype=float),
+                 popt=popt_all,
+                 pcov=pcov_all)
+        self._saved = points
+        self._dirty = False
+
+    def flush(self):
+        """
+        Save the fitmap file if points were fitted since the last save (see save).
+        """
+        if self._dirty:
+            self.save()
+
+
+_FIT_MAPS = {}
+_FIT_MAPS_LOCK = threading.Lock() # fit_map is also called from the prefetch threads (see prefetch_folders)
+
+
+def fit_map(folder, deltat=1, tolerance=0.2, use_existing_fit=True, corr=None, t=None):
+    """
+    The FitMap of a run folder, created once per (folder, deltat, tolerance) and kept for the session,
+    so points fitted by one multimeasurement function are not fitted again by the next one.
+    use_existing_fit (and corr, t if given) are updated on the returned object.
+    """
+    key = (os.path.abspath(folder), deltat, tolerance)
+    with _FIT_MAPS_LOCK:
+        if key not in _FIT_MAPS:
+            _FIT_MAPS[key] = FitMap(folder, deltat=deltat, tolerance=tolerance)
+        fitmap = _FIT_MAPS[key]
+    fitmap.use_existing_fit = use_existing_fit
+    if corr is not None and t is not None:
+        fitmap.set_data(corr, t)
+    return fitmap
+
+
+def flush_fit_maps():
+    """
+    Save the new point fits of all FitMaps of the session (see fit_map) to their fitmap files.
+    """
+    with _FIT_MAPS_LOCK:
+        fitmaps = list(_FIT_MAPS.values())
+    for fitmap in fitmaps:
+        fitmap.flush()
 
-        Experiment_folder/
-        ├── Sample 1/
-        │   ├── Current_value 1/
-        │   │   └── measured DDM files (corr.npz, var.npz etc)
-        │   ├── Current_value 2/
-        │   │   └── measured DDM files (corr.npz, var.npz etc)
-        │   ├── ...
-        │   │
-        │   └── Results
-        │       └── DDM_results_Hall.txt (optional)
-        │
-        ├── Sample 2/
-        │   ├── ...
-        │
-        └── ...
 
-    The function should be able to convert different types of folder names (decimal, non-decimal etc) to number arrays, skipping individual files and results folders.
+def prefetch_folders(folderlist, load, depth=2):
+    """
+    Pipelined folder iterator: yields (folder, load(folder)) in the order of folderlist, while load of the next
+    depth folders already runs in a background thread pool. The file reading (corr.npz, var.npz, fit files) of the next
+    folders is so hidden behind the fitting of the current one. At most depth folders are loaded ahead,
+    so the memory is bounded to depth + 1 loaded folders. An exception of load is raised at its folder.
 
     Parameters:
-    - exp_folder (str): Path to the folder containing all samples' experiments.\n
-    - suffix (str, optional): Suffix of the Hall probe data filename. Defaults to "".\n
-    - description (str, optional): Description of the saved plot filename. Defaults to "".\n
-    - halldata (bool, optional): Flag to indicate whether to use Hall probe data for B values. Defaults to False.\n
-
-    Returns:
-    - xlabel (str): Label for the x-axis in subsequent plots (depends on the Hall data).
-    - exp_folder (str): Path to the experiment folder containing all samples' experiments.
-    - samplelist_full (list): List of sample names within the experiment folder.
-    - folderlist_full (list): List of lists containing the folders within each sample.
-    - B_array_full (list): List of arrays containing the B values for each folder.
-    '''
-
-    samplelist = os.listdir(exp_folder)
+        folderlist (list): run folders.
+        load (function): load(folder) -> loaded data (e.g. _load_run).
+        depth (int): number of folders loaded ahead (0 = no prefetching, load in the loop).
 
-    samplelist_full = []
-    folderlist_full = []
-    B_array_full = []
-    for FOLDER in samplelist:
-        if os.path.isdir(exp_folder + "/" + FOLDER) == True and FOLDER != "Results": # skip files, keep folders
-
-            samplelist_full.append(FOLDER)
-            sample = os.path.basename(FOLDER)
-            initial_settings2(exp_folder, sample)
-            FOLDER = exp_folder + "/" + FOLDER
-            B_array = np.array([]) # for current or magnetic field values
-            xlabel = r"I [mA] (1 A $\approx$ 30 mT)"
-
-            # find all folders and make B array from them:
-            # natsorted.
-            folderlist = natsorted(os.listdir(FOLDER))
-
-            for i in range(len(folderlist)):
-                if os.path.isdir(FOLDER + "/" + folderlist[i]) == True and folderlist[i] != "results": # skip files, keep folders
-                    # create an array with B values from each experiment:
-                    try: # decimal number exctraction:
-                        B_array = np.append(B_array, float(re.findall("(?<!run_)|(?<!run_\d)-?\d+\.\d+", folderlist[i])[0]))
-                                                                        #(?<!run_)-?\d+\.\d+ (orig. decimal)
-                                                                        # (?<!run_)-?\d+ (orig non-decimal)
-                    except: # non-decimal number exctraction:
-                        B_array = np.append(B_array, float(re.findall("(?<!run_)(?<!run_\d)-?\d+", folderlist[i])[0]))
-                    folderlist[i] = FOLDER + '/' + str(folderlist[i]) # make absolute path
-                else: folderlist[i] = None
-            folderlist = [x for x in folderlist if x is not None] # keep only folders
-            folderlist_full.append(folderlist)
-
-            if halldata == True: # Update B array with B values, calculated from Hall probe
-                current, volt_hall = np.loadtxt(FOLDER+"/results/DDM_results_Hall_" + suffix + ".txt", delimiter=",", unpack=True)
-
-                if not isinstance(volt_hall, (list, np.ndarray)):  # if only one value
-                    volt_hall = [volt_hall]
-
-                if len(volt_hall) == len(B_array): # if something is wrong, just use current values
-                    xlabel = "B [mT]"
-                    B_array = np.array([])
-                    for volt in volt_hall:
-                        B_array = np.append(B_array, magnetic_field(volt/1000))
-                else: print("Legnth mismatch. Using current values instead.")
-            B_array_full.append(B_array)
-
-    return xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full
+    Yields:
+        tuple: folder and load(folder).
+    """
+    folderlist = list(folderlist)
+    if depth <= 0:
+        for folder in folderlist:
+            yield folder, load(folder)
+        return
+    executor = ThreadPoolExecutor(max_workers=depth)
+    pending = deque()
+    try:
+        for folder in folderlist[:depth]:
+            pending.append((folder, executor.submit(load, folder)))
+        for i in range(len(folderlist)):
+            folder, future = pending.popleft()
+            if i + depth < len(folderlist):
+                pending.append((folderlist[i + depth], executor.submit(load, folderlist[i + depth])))
+            yield folder, future.result()
+    finally: # also on break out of the loop
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _load_run(folder, deltat, points=()):
+    """
+    t, corr, var1, var2 of a run folder for prefetch_folders (var1, var2 None without var.npz).
+    For memory-mapped files the curves of points (list of (kx, ky)) are read, so they are in the page cache.
+    """
+    t, corr = load_corr(folder, deltat)
+    try:
+        var1, var2 = load_var(folder)
+    except FileNotFoundError:
+        var1, var2 = None, None
+    if isinstance(corr, (np.memmap, QuantizedCorr)):
+        for kx, ky in points:
+            np.asarray(corr[kx, ky])
+    return t, corr, var1, var2
 
 
-def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", description="", add_suptitle="", tolerance=0.5, halldata=False, show_fit_plots=False, save_fit_plots=False, showplot=True, plotsave=False, overwrite=False, use_existing_fit=True, mode=1, theory=False):
+def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", description="", add_suptitle="", tolerance=0.5, halldata=False, show_fit_plots=False, save_fit_plots=False, showplot=True, plotsave=False, overwrite=False, use_existing_fit=True, mode=1, theory=False, warm_start=False, cube=None, prefetch=2, output_files=None):
     '''
     Perform a comparison of measurements across different magnetic field values.
     We choose certain kx, ky values. Then we calculate 1/tau in in this point and compare it over different B values (different folders).
@@ -1441,10 +4659,15 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
     - plotsave (bool, optional): Flag to indicate whether to save the plot. Defaults to False.\n
     - overwrite (bool, optional): Flag to indicate whether to overwrite existing saved plot. Defaults to False.\n
     - use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+    - warm_start (bool, optional): Start each fit from popt of the same point at the previous field step (folders in natsorted order). Defaults to False.\n
+    - cube (FitCube or None, optional): Take 1/tau and sigma of all fields from this fit cube (see build_fit_cube) instead of loading / fitting every run folder. Defaults to None.\n
+    - prefetch (int, optional): Number of run folders loaded ahead in background threads while the current one is fitted (see prefetch_folders), 0 = no prefetching. Defaults to 2.\n
+    - output_files (list or None, optional): Output .npz files, overwritten in the order the function writes them (see regenerate_outputs). None = new files in Results (see filename_update). Defaults to None.
 
     Returns:
     - final_oneovertau_array (list): List of arrays containing the values of 1/tau for each magnetic field value.
     '''
+    call_args = dict(locals()) # for the output registry (see update_experiment)
 
     final_B_array, final_oneovertau_array, final_sigmatau_array, final_sample = [], [], [], []
     xlabel, exp_folder, samplelist, folderlist_full, B_array_full = multifolder_extract(exp_folder, suffix=suffix, description="test1", halldata=halldata)#, halldata=False, show_fit_plots=False, showplot=True, plotsave=PLOTSAVE, overwrite=OVERWRITE)
@@ -1472,8 +4695,13 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
         colour = "#" + hex(int(int(colourbase[1:3], 16) * (percent_ini + delta * 0.9 * i) / 100))[2:] + hex(int(int(colourbase[3:5], 16) * (percent_ini + delta * 0.9 * i) / 100))[2:]+ hex(int(int(colourbase[5:7], 16) * (percent_ini + delta * 1 * i) / 100))[2:]
 
 
+        prev_popt = None # warm start: popt of the previous field step
+        if cube is not None: # the whole B dependence from the fit cube, the folder loop is skipped
+            oneovertau_array = cube.select(sample=sample, kx=kx, ky=ky)
+            sigmatau_array = cube.select(sample=sample, kx=kx, ky=ky, quantity="sigma_tau_array")
         mag_ind = - 1
-        for SUBFOLDER in tqdm(folderlist, ncols=100, colour=colour):
+        prefetched = prefetch_folders(folderlist if cube is None else [], lambda folder: fit_map(folder, deltat, tolerance, use_existing_fit).prefetch([(kx, ky)]), depth=prefetch)
+        for SUBFOLDER, fitmap in tqdm(prefetched, total=len(folderlist) if cube is None else 0, ncols=100, colour=colour):
             mag_ind += 1
             mag_field = B_array[mag_ind]
 
@@ -1485,42 +4713,25 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
             else:
                 print("No match found in the folder string.")
 
-            # analysis:
-            if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz") == True) and use_existing_fit == True:
+            # analysis (fitmap loaded by prefetch_folders):
+            if fitmap.has_fit(kx, ky):
+                popt = fitmap.popt(kx, ky) if warm_start else None
                 #print("using old")
-                try:
-                    loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                    fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array[kx, ky], fit_tau_array[kx, ky], sigma_tau_array[kx, ky], sigma_C0_array[kx, ky]
-                except:
-                    print("")
-                    datapc = np.load(
-                        SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                        allow_pickle=True)
-                    popt, pcov = datapc["popt"], datapc["pcov"]
-                    # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                    fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
+                fitC0, fittau, sigmatau, sigmaC0 = fitmap[kx, ky]
 
                 if show_fit_plots == True or save_fit_plots == True:
                     try:
-                        data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                        t, corr = data["t"] * deltat, data["corr"]
-                        try:
-                            datapc = np.load(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz", allow_pickle=True)
-                            popt, pcov = datapc["popt"], datapc["pcov"]
-                            print("using old but correct")
-                        except:
-                            datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                            popt, pcov = datapc["popt_2D"][int(kx), int(ky)], datapc["pcov_2D"][int(kx), int(ky)]
+                        t, corr = load_corr(SUBFOLDER, deltat)
+                        popt, pcov = fitmap.popt_pcov(kx, ky)
                         plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}")
                     except:
                         "Exception showing fit plot"
 
             else:
-                data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                t, corr = data["t"] * deltat, data["corr"]
-                fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, mag_field=mag_field, curr=curr, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}")
+                fitC0, fittau, sigmatau, sigmaC0, popt = fitmap.point(prev_popt=prev_popt if warm_start else None, kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, mag_field=mag_field, curr=curr, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}")
 
+            if warm_start and np.isfinite(fittau) and popt is not None:
+                prev_popt = popt
             oneovertau_array = np.append(oneovertau_array, fittau)
             sigmatau_array = np.append(sigmatau_array, sigmatau)
 
@@ -1532,6 +4743,8 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
         final_sigmatau_array.append(sigmatau_array)
         final_sample.append(sample)
 
+    flush_fit_maps()
+
     # plot final arrays:
     plt.clf()
     expBarr=[]
@@ -1578,14 +4791,15 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
 
     # export data:
     #DTYPE OBJECT!!!
-    name=filename_update(exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}.npz")
-    np.savez(filename_update(exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}.npz"),
+    name = filename_update(exp_folder+f"/Results/multi_compare_B_kx{kx}_ky{ky}.npz") if output_files is None else output_files[0]
+    np.savez(name,
              #samples=np.array(final_sample,dtype="object"),
              final_B_array=np.array(final_B_array,dtype="object"),
              final_oneovertau_array=np.array(final_oneovertau_array,dtype="object"),
              final_sigmatau_array=np.array(final_sigmatau_array,dtype="object"),
              tau_theor_arr = np.array(tau_theor_arr,dtype="object")) ######
-    npz_to_csv(name, output_folder=exp_folder+"/Results/")
+    npz_to_csv(name, output_folder=exp_folder+"/Results/", overwrite=output_files is not None)
+    _record_output(multimeasurement_comparison_B, call_args, exp_folder, samplelist, name)
 
     plt.xlabel(xlabel)
     plt.ylabel(r"1/$\tau$[1/s]")
@@ -1601,7 +4815,7 @@ def multimeasurement_comparison_B(exp_folder, kx, ky, deltat, suffix="", descrip
     if showplot == True:
         plt.show()
 
-def multimeasurement_comparison_ky_slice(FOLDER, ky_sl, B_target, deltat, tolerance=0.2, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers", use_existing_fit = True):
+def multimeasurement_comparison_ky_slice(FOLDER, ky_sl, B_target, deltat, tolerance=0.2, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers", use_existing_fit = True, cube=None):
     """
     Perform multi-measurement comparison for a given slice of k_y.
 
@@ -1635,6 +4849,7 @@ def multimeasurement_comparison_ky_slice(FOLDER, ky_sl, B_target, deltat, tolera
         halldata (bool, optional): Whether the data is hall data or not. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"$EE$ polarizers".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        cube (FitCube or None, optional): Take the fitted (kx, ky) map from this fit cube (see build_fit_cube) instead of loading / fitting the run folder.\n
     """
 
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
@@ -1658,62 +4873,47 @@ def multimeasurement_comparison_ky_slice(FOLDER, ky_sl, B_target, deltat, tolera
         for ind, SUBFOLDER in enumerate(folderlist):
             if ind == B_ind:
 
-                data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                t, corr = data["t"] * deltat, data["corr"]
+                if cube is not None: # the fitted map of this field from the fit cube
+                    fit_tau_array = cube.select(sample=sample, B=B_array[ind])
+                else:
+                    t, corr = load_corr(SUBFOLDER, deltat)
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
 
-                # LOOP ONLY THROUGH THE WHOLE DESIRED SLICE OF K-SPACE AND FIT TAU IN EVERY POINT:
-                fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
-                sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
+                    # LOOP ONLY THROUGH THE WHOLE DESIRED SLICE OF K-SPACE AND FIT TAU IN EVERY POINT:
+                    fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
+                    sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
 
-                print("\n")
-                # Iterate over the correlation function's indices for fitting tau values
-                for kx in range(len(corr)):
-                    for ky in range(len(corr[0])):
-                        if ky == ky_sl:
-                            try:
-                                if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz") == True)and use_existing_fit == True:
+                    print("\n")
+                    # Iterate over the correlation function's indices for fitting tau values
+                    ky = ky_sl
+                    for kx in range(len(corr)):
+                        try:
+                            if fitmap.has_fit(kx, ky):
+
+                                fitC0, fittau, sigmatau, sigmaC0 = fitmap[kx, ky]
 
+                                if show_fit_plots == True or save_fit_plots == True:
+                                    #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
+                                    #t, corr = data["t"] * deltat, data["corr"]
                                     try:
-                                        loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                        fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                        fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kx, ky], fit_tau_array1[kx, ky], sigma_tau_array1[kx, ky], sigma_C0_array1[kx, ky]
+                                        popt, pcov = fitmap.popt_pcov(kx, ky)
+
+                                        plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_ky{ky}_slice_B{B_target}")
                                     except:
-                                        print("")
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                        fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
-
-                                    if show_fit_plots == True or save_fit_plots == True:
-                                        #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
-                                        #t, corr = data["t"] * deltat, data["corr"]
-                                        try:
-                                            try:
-                                                datapc = np.load(
-                                                    SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                                                    allow_pickle=True)
-                                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                                print("using old but correct")
-                                            except:
-                                                datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                                popt, pcov = datapc["popt_2D"][int(kx), int(ky)], datapc["pcov_2D"][int(kx), int(ky)]
+                                        print("Exception showing fit plot.")
 
-                                            plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_ky{ky}_slice_B{B_target}")
-                                        except:
-                                            print("Exception showing fit plot.")
+                            else:
+                                fitC0, fittau, sigmatau, sigmaC0 = fitmap.point(kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, mag_field=mag_field,curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_ky{ky}_slice_B{B_target}")[:4]
 
-                                else:
-                                    fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, mag_field=mag_field,curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_ky{ky}_slice_B{B_target}")
+                            # Store the fitted values in the respective arrays
+                            fit_C0_array[kx, ky] = fitC0
+                            fit_tau_array[kx, ky] = fittau
+                            sigma_C0_array[kx, ky] = sigmaC0
+                            sigma_tau_array[kx, ky] = sigmatau
+                        except:
+                            print("Exception - fitting error")
 
-                                # Store the fitted values in the respective arrays
-                                fit_C0_array[kx, ky] = fitC0
-                                fit_tau_array[kx, ky] = fittau
-                                sigma_C0_array[kx, ky] = sigmaC0
-                                sigma_tau_array[kx, ky] = sigmatau
-                            except:
-                                print("Exception - fitting error")
+                flush_fit_maps()
 
                 # PLOT 2D PLOT OF A GIVEN SLICE (ky = const.) OF ALL TAU VALUES:
                 data = fit_tau_array
@@ -1748,7 +4948,7 @@ def multimeasurement_comparison_ky_slice(FOLDER, ky_sl, B_target, deltat, tolera
     plt.show()
 
 
-def multimeasurement_comparison_kx_slice(FOLDER, kx_sl, B_target, deltat, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"$EE$ polarizers", use_existing_fit = True):
+def multimeasurement_comparison_kx_slice(FOLDER, kx_sl, B_target, deltat, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"$EE$ polarizers", use_existing_fit = True, cube=None):
     """
     Perform multi-measurement comparison for a given slice of k_x.
 
@@ -1782,6 +4982,7 @@ def multimeasurement_comparison_kx_slice(FOLDER, kx_sl, B_target, deltat, tolera
         halldata (bool, optional): Whether the data is hall data or not. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"$EE$ polarizers".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        cube (FitCube or None, optional): Take the fitted (kx, ky) map from this fit cube (see build_fit_cube) instead of loading / fitting the run folder.\n
     """
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
 
@@ -1803,66 +5004,51 @@ def multimeasurement_comparison_kx_slice(FOLDER, kx_sl, B_target, deltat, tolera
         for ind, SUBFOLDER in enumerate(folderlist):
             if ind == B_ind:
 
-                # IMPORT DATA:
-                data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                t, corr = data["t"] * deltat, data["corr"]
+                if cube is not None: # the fitted map of this field from the fit cube
+                    fit_tau_array = cube.select(sample=sample, B=B_array[ind])
+                else:
+                    # IMPORT DATA:
+                    t, corr = load_corr(SUBFOLDER, deltat)
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
 
-                # LOOP ONLY THROUGH THE WHOLE DESIRED SLICE OF K-SPACE AND FIT TAU IN EVERY POINT:
-                fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
-                sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
+                    # LOOP ONLY THROUGH THE WHOLE DESIRED SLICE OF K-SPACE AND FIT TAU IN EVERY POINT:
+                    fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
+                    sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
 
-                print("\n")
-                # Iterate over the correlation function's indices for fitting tau values
+                    print("\n")
+                    # Iterate over the correlation function's indices for fitting tau values
 
-                kx = kx_sl
-                for ky in range(len(corr[0])):
-                    try:
-                        if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz")==True) and use_existing_fit == True:
-                            try:
-                                loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kx, ky], fit_tau_array1[kx, ky], sigma_tau_array1[kx, ky], sigma_C0_array1[kx, ky]
-                            except:
-                                print("")
-                                datapc = np.load(
-                                    SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                                    allow_pickle=True)
-                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
+                    kx = kx_sl
+                    for ky in range(len(corr[0])):
+                        try:
+                            if fitmap.has_fit(kx, ky):
+                                fitC0, fittau, sigmatau, sigmaC0 = fitmap[kx, ky]
 
-                            if show_fit_plots == True or save_fit_plots == True:
-                                #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
-                                #t, corr = data["t"] * deltat, data["corr"]
-                                try:
+                                if show_fit_plots == True or save_fit_plots == True:
+                                    #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
+                                    #t, corr = data["t"] * deltat, data["corr"]
                                     try:
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        print("using old but correct")
-                                    except:
+                                        popt, pcov = fitmap.popt_pcov(kx, ky)
 
-                                        datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                        popt, pcov = datapc["popt_2D"][int(kx), int(ky)], datapc["pcov_2D"][int(kx), int(ky)]
 
+                                        plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_kx{kx}_slice_B{B_target}")
+                                    except:
+                                        print("Exception showing fit plots.")
 
-                                    plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_kx{kx}_slice_B{B_target}")
-                                except:
-                                    print("Exception showing fit plots.")
+                            else:
+                                #data = np.load(SUBFOLDER + "/" +  "corr.npz")
+                                #t, corr = data["t"] * deltat, data["corr"]
+                                fitC0, fittau, sigmatau, sigmaC0 = fitmap.point(kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, curr=curr, mag_field=mag_field, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_kx{kx}_slice_B{B_target}")[:4]
 
-                        else:
-                            #data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                            #t, corr = data["t"] * deltat, data["corr"]
-                            fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kx, ky=ky, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, curr=curr, mag_field=mag_field, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_kx{kx}_slice_B{B_target}")
+                            # Store the fitted values in the respective arrays
+                            fit_C0_array[kx, ky] = fitC0
+                            fit_tau_array[kx, ky] = fittau
+                            sigma_C0_array[kx, ky] = sigmaC0
+                            sigma_tau_array[kx, ky] = sigmatau
+                        except:
+                            print("Exception - fitting error")
 
-                        # Store the fitted values in the respective arrays
-                        fit_C0_array[kx, ky] = fitC0
-                        fit_tau_array[kx, ky] = fittau
-                        sigma_C0_array[kx, ky] = sigmaC0
-                        sigma_tau_array[kx, ky] = sigmatau
-                    except:
-                        print("Exception - fitting error")
+                flush_fit_maps()
 
                 data = fit_tau_array
                 x = np.fft.fftfreq(len(data), 1/len(data))
@@ -1894,7 +5080,7 @@ def multimeasurement_comparison_kx_slice(FOLDER, kx_sl, B_target, deltat, tolera
     plt.show()
 
 
-def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_arr=[0, 1, 3], kx=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False):
+def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_arr=[0, 1, 3], kx=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False, warm_start=False, cube=None, prefetch=2, plotshow=True, output_files=None):
     """
     Perform multi-measurement comparison for one sample at different B values for different q vectors along the y-direction.
 
@@ -1930,10 +5116,16 @@ def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_ar
             If False, el. current values will be used to extract B values. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        warm_start (bool, optional): Start each fit from popt of the same point at the previous field step (folders in natsorted order). Defaults to False.\n
+        cube (FitCube or None, optional): Take 1/tau, sigma and amplitudes of all fields from this fit cube (see build_fit_cube) instead of loading / fitting every run folder.
+        prefetch (int, optional): Number of run folders loaded ahead in background threads while the current one is fitted (see prefetch_folders), 0 = no prefetching. Defaults to 2.
+        plotshow (bool, optional): Whether to show the plots of the results (plt.show). Defaults to True.
+        output_files (list or None, optional): Output .npz files, overwritten in the order the function writes them (see regenerate_outputs). None = new files in Results (see filename_update). Defaults to None.
 
     Returns:
         None
     """
+    call_args = dict(locals()) # for the output registry (see update_experiment)
 
 
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
@@ -1975,16 +5167,19 @@ def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_ar
                 colour = "#" + hex(int(int(colourbase[1:3], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:] + hex(int(int(colourbase[3:5], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:]+ hex(int(int(colourbase[5:7], 16) * (percent_ini + delta * 1 * ind1) / 100))[2:]
 
 
-                for ind2, SUBFOLDER in enumerate(tqdm(folderlist, ncols=100, colour=colour)): # for each B
-                    # IMPORT DATA:
-                    data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                    t, corr = data["t"] * deltat, data["corr"]
+                if cube is not None: # all fields of this point at once from the fit cube
+                    final_multiarray[ind1] = cube.select(sample=sample, kx=kx, ky=kyi)
+                    final_multiarray_sig[ind1] = cube.select(sample=sample, kx=kx, ky=kyi, quantity="sigma_tau_array")
+                    final_multiarray_ampl[ind1] = cube.select(sample=sample, kx=kx, ky=kyi, quantity="amplitude_array")
+                    continue
 
-                    datavar = np.load(SUBFOLDER + "/" +  "var.npz")
-                    var1, var2 = datavar["var1"], datavar["var2"]
+                prev_popt = None # warm start: popt of the previous field step
+                for ind2, (SUBFOLDER, (t, corr, var1, var2)) in enumerate(tqdm(prefetch_folders(folderlist, lambda folder, points=[(kx, kyi)]: _load_run(folder, deltat, points), depth=prefetch), total=len(folderlist), ncols=100, colour=colour)): # for each B, the next folders are loaded in the background
+                    # IMPORT DATA (loaded by prefetch_folders):
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
 
-                    amplitude = np.abs(corr[...,0]) #* ((var1 + var2) / 2)**0.25
-                    final_multiarray_ampl[ind1][ind2] = amplitude[kx][kyi]
+                    amplitude = np.abs(corr[kx, kyi, 0]) #* ((var1 + var2) / 2)**0.25
+                    final_multiarray_ampl[ind1][ind2] = amplitude
 
                     mag_field = B_array[ind2]
 
@@ -1997,45 +5192,30 @@ def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_ar
                         print("No match found in the folder string.")
                     # only check the desired kx, ky point:
                     try:
-                        if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz")==True) and use_existing_fit == True:
-                            try:
-                                loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kx, kyi], fit_tau_array1[kx, kyi], sigma_tau_array1[kx, kyi], sigma_C0_array1[kx, kyi]
-                            except:
-                                print("")
-                                datapc = np.load(
-                                    SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz",
-                                    allow_pickle=True)
-                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
+                        if fitmap.has_fit(kx, kyi):
+                            popt = fitmap.popt(kx, kyi) if warm_start else None
+                            fitC0, fittau, sigmatau, sigmaC0 = fitmap[kx, kyi]
 
                             if show_fit_plots == True or save_fit_plots == True:
                                 try:
-                                    try:
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        print("using old but correct")
-                                    except:
-
-                                        datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                        popt, pcov = datapc["popt_2D"][int(kx), int(kyi)], datapc["pcov_2D"][int(kx), int(kyi)]
+                                    popt, pcov = fitmap.popt_pcov(kx, kyi)
                                     plot_fit_from_existing(corr, t, kx, kyi, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}")
                                 except:
                                     print("Exception showing fit plots.")
                                     print(popt)
 
                         else:
-                            fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kx, ky=kyi, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, curr=curr, mag_field=mag_field, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}")
+                            fitC0, fittau, sigmatau, sigmaC0, popt = fitmap.point(prev_popt=prev_popt if warm_start else None, kx=kx, ky=kyi, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, curr=curr, mag_field=mag_field, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}")
 
                         final_multiarray[ind1][ind2] = fittau
                         final_multiarray_sig[ind1][ind2] = sigmatau
+                        if warm_start and np.isfinite(fittau) and popt is not None:
+                            prev_popt = popt
                     except:
                         print("Exception - fitting error")
 
+    flush_fit_maps()
+
     # PLOT 2D PLOT:
     #-------------
     tau_theor_arr = [] # it would be more consistent if tau_theor_arr would be created simultaneoously with final_multiarray etc
@@ -2078,23 +5258,25 @@ def multimeasurement_comparison_different_qs_y(FOLDER, samplename, deltat, ky_ar
         #----------------------------------------------------------------#
 
     # extract data:
-    name=filename_update(exp_folder + f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_compare_different_qs_kx_{kx}_ky_{str_ky}_{samplename}.npz") if output_files is None else output_files[0]
+    np.savez(name,
              B_array=B_array,
              final_multiarray=final_multiarray,
              final_multiarray_sig=final_multiarray_sig,
              tau_theor_arr = tau_theor_arr)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    _record_output(multimeasurement_comparison_different_qs_y, call_args, exp_folder, [samplename], name)
 
     plt.title(rf"Fitted correlation times 1 / $\tau$ for different $q_\perp$'s, $q_\parallel$ = {q(kx)}")
     plt.suptitle("c-DDM: " + samplename + ",  " + add_suptitle)
     plt.xlabel("$\mu_0 H$ $(mT)$")
     plt.ylabel(r"$1/\tau$ $(1/s)$")
     plt.legend(title=r"$q_\perp$ (1/m)")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
 
-def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_arr=[0, 1, 3], ky=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit=True, theory=False):
+def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_arr=[0, 1, 3], ky=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit=True, theory=False, warm_start=False, cube=None, prefetch=2, plotshow=True, output_files=None):
     """
     Perform multi-measurement comparison for one sample at different B values for different q vectors.
 
@@ -2126,7 +5308,13 @@ def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_a
         halldata (bool, optional): Whether the data is hall data or not. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        warm_start (bool, optional): Start each fit from popt of the same point at the previous field step (folders in natsorted order). Defaults to False.\n
+        cube (FitCube or None, optional): Take 1/tau, sigma and amplitudes of all fields from this fit cube (see build_fit_cube) instead of loading / fitting every run folder.
+        prefetch (int, optional): Number of run folders loaded ahead in background threads while the current one is fitted (see prefetch_folders), 0 = no prefetching. Defaults to 2.
+        plotshow (bool, optional): Whether to show the plots of the results (plt.show). Defaults to True.
+        output_files (list or None, optional): Output .npz files, overwritten in the order the function writes them (see regenerate_outputs). None = new files in Results (see filename_update). Defaults to None.
     """
+    call_args = dict(locals()) # for the output registry (see update_experiment)
 
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
     str_kx = str(kx_arr)
@@ -2155,7 +5343,14 @@ def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_a
                 delta = (255 * percent_ini / highest - percent_ini) / len(kx_arr)
                 colour = "#" + hex(int(int(colourbase[1:3], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:] + hex(int(int(colourbase[3:5], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:]+ hex(int(int(colourbase[5:7], 16) * (percent_ini + delta * 1 * ind1) / 100))[2:]
 
-                for ind2, SUBFOLDER in enumerate(tqdm(folderlist, ncols=100, colour=colour)): # for each B
+                if cube is not None: # all fields of this point at once from the fit cube
+                    final_multiarray[ind1] = cube.select(sample=sample, kx=kxi, ky=ky)
+                    final_multiarray_sig[ind1] = cube.select(sample=sample, kx=kxi, ky=ky, quantity="sigma_tau_array")
+                    final_multiarray_ampl[ind1] = cube.select(sample=sample, kx=kxi, ky=ky, quantity="amplitude_array")
+                    continue
+
+                prev_popt = None # warm start: popt of the previous field step
+                for ind2, (SUBFOLDER, (t, corr, var1, var2)) in enumerate(tqdm(prefetch_folders(folderlist, lambda folder, points=[(kxi, ky)]: _load_run(folder, deltat, points), depth=prefetch), total=len(folderlist), ncols=100, colour=colour)): # for each B, the next folders are loaded in the background
                     mag_field = B_array[ind2]
                     curr_f = folderlist[ind2]  # Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers/E7/run_0_current_0_mA
                     pattern = r"current_(.*?)_mA"
@@ -2165,46 +5360,22 @@ def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_a
                     else:
                         print("No match found in the folder string.")
 
-                    # IMPORT DATA:
-                    data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                    t, corr = data["t"] * deltat, data["corr"]
-
-                    datavar = np.load(SUBFOLDER + "/" +  "var.npz")
-                    var1, var2 = datavar["var1"], datavar["var2"]
+                    # IMPORT DATA (loaded by prefetch_folders):
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
 
-                    amplitude = np.abs(corr[...,0]) #* ((var1 + var2) / 2)**0.25
-                    final_multiarray_ampl[ind1][ind2] = amplitude[kxi][ky]
+                    amplitude = np.abs(corr[kxi, ky, 0]) #* ((var1 + var2) / 2)**0.25
+                    final_multiarray_ampl[ind1][ind2] = amplitude
 
                     # only check the desired kx, ky point:
                     try:
-                        if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz")==True) and use_existing_fit == True:
-                            try:
-                                loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kxi, ky], fit_tau_array1[kxi, ky], sigma_tau_array1[kxi, ky], sigma_C0_array1[kxi, ky]
-                            except:
-                                print("")
-                                datapc = np.load(
-                                    SUBFOLDER + f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz",
-                                    allow_pickle=True)
-                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                #fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0],pcov[1][1]
-
-                                #ERROR: LOOP DOESNT COVER SCENARIO WHEN YOU WANT TO USE CORRECETED VALUES FROM "OLD BUT CORRECTED" IF YOU DONT PLOT!
+                        if fitmap.has_fit(kxi, ky):
+                            popt = fitmap.popt(kxi, ky) if warm_start else None
+                            fitC0, fittau, sigmatau, sigmaC0 = fitmap[kxi, ky]
                             if show_fit_plots == True or save_fit_plots == True:
                                 #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
                                 #t, corr = data["t"] * deltat, data["corr"]
                                 try:
-                                    try:
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        print("using old but corrected")
-                                    except:
-                                        datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                        popt, pcov = datapc["popt_2D"][int(kxi), int(ky)], datapc["pcov_2D"][int(kxi), int(ky)]
+                                    popt, pcov = fitmap.popt_pcov(kxi, ky)
                                     plot_fit_from_existing(corr, t, kxi, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}")
                                 except:
                                     print("Exception showing fit plots.")
@@ -2213,13 +5384,17 @@ def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_a
                             #print("again")
                             #data = np.load(SUBFOLDER + "/" +  "corr.npz")
                             #t, corr = data["t"] * deltat, data["corr"]
-                            fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kxi, ky=ky, tolerance=tolerance, curr=curr, mag_field=mag_field, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}")
+                            fitC0, fittau, sigmatau, sigmaC0, popt = fitmap.point(prev_popt=prev_popt if warm_start else None, kx=kxi, ky=ky, tolerance=tolerance, curr=curr, mag_field=mag_field, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}")
 
                         final_multiarray[ind1][ind2] = fittau
                         final_multiarray_sig[ind1][ind2] = sigmatau
+                        if warm_start and np.isfinite(fittau) and popt is not None:
+                            prev_popt = popt
                     except:
                         print("Exception - fitting error")
 
+    flush_fit_maps()
+
     # PLOT 2D PLOT:
     #-------------
     tau_theor_arr = [] # it would be more consistent if tau_theor_arr would be created simultaneoously with final_multiarray etc
@@ -2259,23 +5434,25 @@ def multimeasurement_comparison_different_qs_x (FOLDER, samplename, deltat, kx_a
         #----------------------------------------------------------------#
 
     # extract data:
-    name=filename_update(exp_folder + f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_compare_different_qs_ky_{ky}_kx_{str_kx}_{samplename}.npz") if output_files is None else output_files[0]
+    np.savez(name,
              B_array=B_array,
              final_multiarray=final_multiarray,
              final_multiarray_sig=final_multiarray_sig,
              tau_theor_arr = tau_theor_arr)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    _record_output(multimeasurement_comparison_different_qs_x, call_args, exp_folder, [samplename], name)
 
     plt.title(rf"Fitted correlation times 1 / $\tau$ for different $q_\parallel$'s, $k_\perp$ = {ky}")
     plt.suptitle("c-DDM: " + samplename + ",  " + add_suptitle)
     plt.xlabel("$B$ $(mT)$")
     plt.ylabel(r"$1/\tau$ $(1/s)$")
     plt.legend(title=r"$q_\parallel$ (1/m)", loc="upper right")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
 
-def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat, kx_arr=[0, 1, 3], ky=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False):
+def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat, kx_arr=[0, 1, 3], ky=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False, warm_start=False, cube=None, prefetch=2, plotshow=True, output_files=None):
     """
     Perform multi-measurement comparison for one sample at different B values for different q vectors.
 
@@ -2307,7 +5484,13 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
         halldata (bool, optional): Whether the data is hall data or not. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        warm_start (bool, optional): Start each fit from popt of the same point at the previous field step (folders in natsorted order). Defaults to False.\n
+        cube (FitCube or None, optional): Take 1/tau, sigma and amplitudes of all fields from this fit cube (see build_fit_cube) instead of loading / fitting every run folder.
+        prefetch (int, optional): Number of run folders loaded ahead in background threads while the current one is fitted (see prefetch_folders), 0 = no prefetching. Defaults to 2.
+        plotshow (bool, optional): Whether to show the plots of the results (plt.show). Defaults to True.
+        output_files (list or None, optional): Output .npz files, overwritten in the order the function writes them (see regenerate_outputs). None = new files in Results (see filename_update). Defaults to None.
     """
+    call_args = dict(locals()) # for the output registry (see update_experiment)
 
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
     str_kx = str(kx_arr)
@@ -2337,7 +5520,14 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
                 delta = (255 * percent_ini / highest - percent_ini) / len(kx_arr)
                 colour = "#" + hex(int(int(colourbase[1:3], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:] + hex(int(int(colourbase[3:5], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:]+ hex(int(int(colourbase[5:7], 16) * (percent_ini + delta * 1 * ind1) / 100))[2:]
 
-                for ind2, SUBFOLDER in enumerate(tqdm(folderlist, ncols=100, colour=colour)): # for each B
+                if cube is not None: # all fields of this point at once from the fit cube
+                    final_multiarray[ind1] = cube.select(sample=sample, kx=kxi, ky=ky)
+                    final_multiarray_sig[ind1] = cube.select(sample=sample, kx=kxi, ky=ky, quantity="sigma_tau_array")
+                    final_multiarray_ampl[ind1] = cube.select(sample=sample, kx=kxi, ky=ky, quantity="amplitude_array")
+                    continue
+
+                prev_popt = None # warm start: popt of the previous field step
+                for ind2, (SUBFOLDER, (t, corr, var1, var2)) in enumerate(tqdm(prefetch_folders(folderlist, lambda folder, points=[(kxi, ky)]: _load_run(folder, deltat, points), depth=prefetch), total=len(folderlist), ncols=100, colour=colour)): # for each B, the next folders are loaded in the background
                     mag_field = B_array[ind2]
                     curr_f = folderlist[ind2]  # Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers/E7/run_0_current_0_mA
                     pattern = r"current_(.*?)_mA"
@@ -2347,44 +5537,22 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
                     else:
                         print("No match found in the folder string.")
 
-                    # IMPORT DATA:
-                    data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                    t, corr = data["t"] * deltat, data["corr"]
-
-                    datavar = np.load(SUBFOLDER + "/" +  "var.npz")
-                    var1, var2 = datavar["var1"], datavar["var2"]
+                    # IMPORT DATA (loaded by prefetch_folders):
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
 
-                    amplitude = np.abs(corr[...,0]) #* ((var1 + var2) / 2)**0.25
-                    final_multiarray_ampl[ind1][ind2] = amplitude[kxi][ky]
+                    amplitude = np.abs(corr[kxi, ky, 0]) #* ((var1 + var2) / 2)**0.25
+                    final_multiarray_ampl[ind1][ind2] = amplitude
 
                     # only check the desired kx, ky point:
                     try:
-                        if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz")==True) and use_existing_fit == True:
-                            try:
-                                loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kxi, ky], fit_tau_array1[kxi, ky], sigma_tau_array1[kxi, ky], sigma_C0_array1[kxi, ky]
-                            except:
-                                print("")
-                                datapc = np.load(
-                                    SUBFOLDER + f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz",
-                                    allow_pickle=True)
-                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
+                        if fitmap.has_fit(kxi, ky):
+                            popt = fitmap.popt(kxi, ky) if warm_start else None
+                            fitC0, fittau, sigmatau, sigmaC0 = fitmap[kxi, ky]
                             if show_fit_plots == True or save_fit_plots == True:
                                 #data = np.load(SUBFOLDER + "/" +  "corr.npz") # needed because of corr length, takes 6 microseconds
                                 #t, corr = data["t"] * deltat, data["corr"]
                                 try:
-                                    try:
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kxi}_ky{ky}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        print("using old but correct")
-                                    except:
-                                        datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                        popt, pcov = datapc["popt_2D"][int(kxi), int(ky)], datapc["pcov_2D"][int(kxi), int(ky)]
+                                    popt, pcov = fitmap.popt_pcov(kxi, ky)
                                     plot_fit_from_existing(corr, t, kxi, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}")
                                 except:
                                     print("Exception showing fit plots.")
@@ -2392,13 +5560,17 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
                         else:
                             #data = np.load(SUBFOLDER + "/" +  "corr.npz")
                             #t, corr = data["t"] * deltat, data["corr"]
-                            fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kxi, ky=ky, curr=curr, mag_field=mag_field, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}")
+                            fitC0, fittau, sigmatau, sigmaC0, popt = fitmap.point(prev_popt=prev_popt if warm_start else None, kx=kxi, ky=ky, curr=curr, mag_field=mag_field, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}")
 
                         final_multiarray[ind1][ind2] = fittau
                         final_multiarray_sig[ind1][ind2] = sigmatau
+                        if warm_start and np.isfinite(fittau) and popt is not None:
+                            prev_popt = popt
                     except:
                         print("Exception - fitting error")
 
+    flush_fit_maps()
+
     # fit for each k:
     koef_array, offset_array = np.array([]), np.array([])
     er_koef_array, er_offset_array = np.array([]), np.array([])
@@ -2470,22 +5642,24 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
 
     # extract data:
 
-    name=filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}.npz") if output_files is None else output_files[0]
+    np.savez(name,
              B_array=B_array,#,
              final_multiarray=final_multiarray,
              final_multiarray_sig=final_multiarray_sig,
              fitx=np.array(fitxarr, dtype="object"),
              fity=np.array(fityarr, dtype="object"),
              tau_theor_arr=tau_theor_arr)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    names = [name]
 
     plt.title(rf"Fitted correlation times 1 / $\tau$ for different $q_\parallel$'s, $k_\perp$ = {ky}")
     plt.suptitle("c-DDM: " + samplename + ",  " + add_suptitle)
     plt.xlabel("$B$ $(mT)$")
     plt.ylabel(r"$1/\tau$ $(1/s)$")
     plt.legend(title=r"$q_\parallel$ (1/m)", loc="upper left")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
     ############
     plt.clf()
@@ -2495,14 +5669,16 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
     plt.xlabel("$k_\parallel$")
     plt.ylabel(r"slope $1/\tau$/$B$ [1/(s*mT)]")
     #plt.legend(title=r"$q_x$ (1/m)", loc="upper right")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
-    name=filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_slopes.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_slopes.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_slopes.npz") if output_files is None else output_files[1]
+    np.savez(name,
              kx_arr=kx_arr,
              koef_array=koef_array,
              er_koef_array=er_koef_array)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    names.append(name)
 
     #############
     plt.clf()
@@ -2512,17 +5688,20 @@ def multimeasurement_comparison_different_qs_x_fit (FOLDER, samplename, deltat,
     plt.xlabel("$k_\parallel$")
     plt.ylabel(r"offset $1/\tau$ [1/s]")
     #plt.legend(title=r"$q_x$ (1/m)", loc="upper right")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
-    name=filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_offsets.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_offsets.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_ky_{ky}_kx_{str_kx}_{samplename}_offsets.npz") if output_files is None else output_files[2]
+    np.savez(name,
              kx_arr=kx_arr,
              koef_array=offset_array,
              er_koef_array=er_offset_array)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    names.append(name)
+    _record_output(multimeasurement_comparison_different_qs_x_fit, call_args, exp_folder, [samplename], names)
 
 
-def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat, ky_arr=[0, 1, 3], kx=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False):
+def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat, ky_arr=[0, 1, 3], kx=0, tolerance=0.2, show_fit_plots=False, save_fit_plots = False, halldata=True, add_suptitle=r"", use_existing_fit = True, theory=False, warm_start=False, cube=None, prefetch=2, plotshow=True, output_files=None):
     """
     Perform multi-measurement comparison for one sample at different B values for different q vectors.
 
@@ -2554,7 +5733,13 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
         halldata (bool, optional): Whether the data is hall data or not. Defaults to True.
         add_suptitle (str, optional): Additional suptitle for the plot. Defaults to r"".
         use_existing_fit (bool, optional): Flag to indicate whether to load existing full fit data.\n
+        warm_start (bool, optional): Start each fit from popt of the same point at the previous field step (folders in natsorted order). Defaults to False.\n
+        cube (FitCube or None, optional): Take 1/tau, sigma and amplitudes of all fields from this fit cube (see build_fit_cube) instead of loading / fitting every run folder.
+        prefetch (int, optional): Number of run folders loaded ahead in background threads while the current one is fitted (see prefetch_folders), 0 = no prefetching. Defaults to 2.
+        plotshow (bool, optional): Whether to show the plots of the results (plt.show). Defaults to True.
+        output_files (list or None, optional): Output .npz files, overwritten in the order the function writes them (see regenerate_outputs). None = new files in Results (see filename_update). Defaults to None.
     """
+    call_args = dict(locals()) # for the output registry (see update_experiment)
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
     str_ky = str(ky_arr)
 
@@ -2582,7 +5767,14 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
                 delta = (255 * percent_ini / highest - percent_ini) / len(ky_arr)
                 colour = "#" + hex(int(int(colourbase[1:3], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:] + hex(int(int(colourbase[3:5], 16) * (percent_ini + delta * 0.9 * ind1) / 100))[2:]+ hex(int(int(colourbase[5:7], 16) * (percent_ini + delta * 1 * ind1) / 100))[2:]
 
-                for ind2, SUBFOLDER in enumerate(tqdm(folderlist, ncols=100, colour=colour)): # for each B
+                if cube is not None: # all fields of this point at once from the fit cube
+                    final_multiarray[ind1] = cube.select(sample=sample, kx=kx, ky=kyi)
+                    final_multiarray_sig[ind1] = cube.select(sample=sample, kx=kx, ky=kyi, quantity="sigma_tau_array")
+                    final_multiarray_ampl[ind1] = cube.select(sample=sample, kx=kx, ky=kyi, quantity="amplitude_array")
+                    continue
+
+                prev_popt = None # warm start: popt of the previous field step
+                for ind2, (SUBFOLDER, (t, corr, var1, var2)) in enumerate(tqdm(prefetch_folders(folderlist, lambda folder, points=[(kx, kyi)]: _load_run(folder, deltat, points), depth=prefetch), total=len(folderlist), ncols=100, colour=colour)): # for each B, the next folders are loaded in the background
                     mag_field = B_array[ind2]
                     curr_f = folderlist[ind2]  # Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers/E7/run_0_current_0_mA
                     pattern = r"current_(.*?)_mA"
@@ -2592,52 +5784,34 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
                     else:
                         print("No match found in the folder string.")
 
-                    # IMPORT DATA:
-                    data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                    t, corr = data["t"] * deltat, data["corr"]
-
-                    datavar = np.load(SUBFOLDER + "/" +  "var.npz")
-                    var1, var2 = datavar["var1"], datavar["var2"]
-                    amplitude = np.abs(corr[...,0]) #* ((var1 + var2) / 2)**0.25
-                    final_multiarray_ampl[ind1][ind2] = amplitude[kx][kyi]
+                    # IMPORT DATA (loaded by prefetch_folders):
+                    fitmap = fit_map(SUBFOLDER, deltat, tolerance, use_existing_fit, corr=corr, t=t)
+                    amplitude = np.abs(corr[kx, kyi, 0]) #* ((var1 + var2) / 2)**0.25
+                    final_multiarray_ampl[ind1][ind2] = amplitude
 
                     # only check the desired kx, ky point:
                     try:
-                        if (os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True or os.path.exists(SUBFOLDER+f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz")==True) and use_existing_fit == True:
-                            try:
-                                loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
-                                fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_C0_array1[kx, kyi], fit_tau_array1[kx, kyi], sigma_tau_array1[kx, kyi], sigma_C0_array1[kx, kyi]
-                            except:
-                                print("")
-                                datapc = np.load(
-                                    SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz",
-                                    allow_pickle=True)
-                                popt, pcov = datapc["popt"], datapc["pcov"]
-                                # fit_C0_array1, fit_tau_array1, sigma_C0_array1, sigma_tau_array1 = loaded_fit["fit_C0_array"], loaded_fit[ "fit_tau_array"], loaded_fit["sigma_C0_array"],loaded_fit["sigma_tau_array"]
-                                fitC0, fittau, sigmatau, sigmaC0 = popt[1], popt[0], pcov[0][0], pcov[1][1]
+                        if fitmap.has_fit(kx, kyi):
+                            popt = fitmap.popt(kx, kyi) if warm_start else None
+                            fitC0, fittau, sigmatau, sigmaC0 = fitmap[kx, kyi]
                             if show_fit_plots == True or save_fit_plots == True:
                                 try:
-                                    try:
-                                        datapc = np.load(
-                                            SUBFOLDER + f"\\tmp_fit_kx{kx}_ky{kyi}_tol{tolerance}.npz",
-                                            allow_pickle=True)
-                                        popt, pcov = datapc["popt"], datapc["pcov"]
-                                        print("using old but correct")
-                                    except:
-                                        datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
-                                        popt, pcov = datapc["popt_2D"][int(kx), int(kyi)], datapc["pcov_2D"][int(kx), int(kyi)]
+                                    popt, pcov = fitmap.popt_pcov(kx, kyi)
                                     plot_fit_from_existing(corr, t, kx, kyi, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}")
                                 except:
                                     print("Exception showing fit plots.")
                         else:
-                            fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx=kx, ky=kyi, curr=curr, mag_field=mag_field, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}")
+                            fitC0, fittau, sigmatau, sigmaC0, popt = fitmap.point(prev_popt=prev_popt if warm_start else None, kx=kx, ky=kyi, curr=curr, mag_field=mag_field, tolerance=tolerance, showplot=show_fit_plots, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}")
 
                         final_multiarray[ind1][ind2] = fittau
                         final_multiarray_sig[ind1][ind2] = sigmatau
+                        if warm_start and np.isfinite(fittau) and popt is not None:
+                            prev_popt = popt
                     except:
                         print("Exception - fitting error")
 
+    flush_fit_maps()
+
     # fit for each k:
     koef_array, offset_array = np.array([]), np.array([])
     er_koef_array, er_offset_array = np.array([]), np.array([])
@@ -2709,22 +5883,24 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
         fityarr.append(linfit(xfit[:int(len(xfit)/2)], *popt))
 
     # extract data:
-    name=filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}.npz") if output_files is None else output_files[0]
+    np.savez(name,
              B_array=B_array,
              final_multiarray=final_multiarray,
              final_multiarray_sig=final_multiarray_sig,
              fitx=fitxarr,
              fity=fityarr,
              tau_theor_arr=tau_theor_arr)
-    npz_to_csv(name, output_folder=exp_folder + "/Results")
+    npz_to_csv(name, output_folder=exp_folder + "/Results", overwrite=output_files is not None)
+    names = [name]
 
     plt.title(rf"Fitted correlation times 1 / $\tau$ for different $q_\perp$'s, $k_\parallel$ = {kx}")
     plt.suptitle("c-DDM: " + samplename + ",  " + add_suptitle)
     plt.xlabel("$B$ $(mT)$")
     plt.ylabel(r"$1/\tau$ $(1/s)$")
     plt.legend(title=r"$q_\perp$ (1/m)", loc="upper left")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
     ############
     plt.clf()
@@ -2734,14 +5910,16 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
     plt.xlabel("$k_\perp$")
     plt.ylabel(r"slope $1/\tau$/$B$ [1/(s*mT)]")
     #plt.legend(title=r"$q_x$ (1/m)", loc="upper right")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
-    name=filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_slopes.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_slopes.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_slopes.npz") if output_files is None else output_files[1]
+    np.savez(name,
              ky_arr=ky_arr,
              koef_array=koef_array,
              er_koef_array=er_koef_array)
-    npz_to_csv(name, output_folder=exp_folder + "/Results")
+    npz_to_csv(name, output_folder=exp_folder + "/Results", overwrite=output_files is not None)
+    names.append(name)
 
     #############
     plt.clf()
@@ -2751,17 +5929,26 @@ def multimeasurement_comparison_different_qs_y_fit (FOLDER, samplename, deltat,
     plt.xlabel("$k_\perp$")
     plt.ylabel(r"offset $1/\tau$ [1/s]")
     #plt.legend(title=r"$q_x$ (1/m)", loc="upper right")
-    plt.show()
+    if plotshow == True:
+        plt.show()
 
-    name=filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_offsets.npz")
-    np.savez(filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_offsets.npz"),
+    name = filename_update(exp_folder + f"/Results/multi_slopes_kx_{kx}_ky_{str_ky}_{samplename}_offsets.npz") if output_files is None else output_files[2]
+    np.savez(name,
              ky_arr=ky_arr,
              koef_array=offset_array,
              er_koef_array=er_offset_array)
-    npz_to_csv(name, output_folder=exp_folder + "/Results/")
+    npz_to_csv(name, output_folder=exp_folder + "/Results/", overwrite=output_files is not None)
+    names.append(name)
+    _record_output(multimeasurement_comparison_different_qs_y_fit, call_args, exp_folder, [samplename], names)
+
+
+# functions whose outputs _record_output registers, made again by regenerate_outputs:
+_OUTPUT_FUNCTIONS = {function.__name__: function for function in [build_fit_cube, multimeasurement_comparison_B, multimeasurement_comparison_different_qs_y,
+                                                                   multimeasurement_comparison_different_qs_x, multimeasurement_comparison_different_qs_x_fit,
+                                                                   multimeasurement_comparison_different_qs_y_fit]}
 
 
-def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_existing_fit=False, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers"):
+def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_existing_fit=False, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers", workers=None, preview=False, symmetric=False, roi=None, snr_threshold=None, snr_action="skip", max_nfev=None, time_budget=None, fallback=False, dual=False, fit_cache=False):
     """
     Perform multi-measurement comparison of 3D plots for a target B field.
 
@@ -2787,7 +5974,22 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
     The function should be able to convert different types of folder names (decimal, non-decimal etc) to number arrays, skipping individual files and results folders.
 
     Parameters:
-
+        workers (int or None): if set, a new full-grid fit is done on this many processes (fit_corr_full_parallel)
+            and saved as fit_full_tol*.npz / popt_pcov_2D_tol*.npz. None = the serial fit_corr loop, checkpointed in blocks of kx rows (see checkpointed_fit).
+        preview (bool): quick look - plot the approximate 1/tau map of preview_tau_map instead of fitting.
+        symmetric (bool): fit the kx / -kx averaged curves (weighted by var.npz) and mirror the result (fit_corr_symmetric),
+            saved like a full-grid fit (on workers processes if set, else serial).
+        roi (numpy.ndarray, dict or None): region of interest - boolean (kx, ky) mask or dict of roi_mask arguments (q in 1/m).
+            Points outside are not fitted and are NaN. None = whole grid.
+        snr_threshold (float or None): skip points with SNR below it (see snr_prefilter), applies to new fits. None = no pre-filter.
+        snr_action (str): "skip" (flagged points are NaN) or "1exp" (flagged points get the 1-exp fit only).
+        max_nfev, time_budget, fallback: per-point fit budget and fallback ladder of new fits (see fit_corr).
+            Full-grid fits (workers / symmetric) print the histogram of fit paths and save fit_path_array.
+        dual (bool): new fits are batched dual-model fits (fit_corr_full(dual=True), on workers processes if set),
+            saved as fit_dual.npz next to fit_full_tol*.npz. With use_existing_fit, an existing fit_dual.npz is used
+            for any tolerance (select_by_tolerance) if there is no fit_full_tol*.npz.
+        fit_cache (bool): full-grid fits (workers / symmetric / dual) go through the persistent fit cache (see cached_fit),
+            a stored fit is reused only if corr.npz and all fit settings are unchanged.
     """
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
 
@@ -2801,8 +6003,7 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
         for ind, SUBFOLDER in enumerate(folderlist):
             if ind == B_ind:
                 # IMPORT DATA:
-                data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                t, corr = data["t"] * deltat, data["corr"]
+                t, corr = load_corr(SUBFOLDER, deltat)
                 mag_field = B_array[ind]
 
                 curr_f = folderlist[ind]  # Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers/E7/run_0_current_0_mA
@@ -2813,13 +6014,18 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
                 else:
                     print("No match found in the folder string.")
 
+                mask = roi_mask(corr.shape[:2], **roi) if isinstance(roi, dict) else roi
+                mask, single_exp = _snr_fit_masks(SUBFOLDER, corr, mask, snr_threshold, snr_action)
                 # LOOP THROUGH THE WHOLE K-SPACE AND FIT TAU IN EVERY POINT:
-                if os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True and use_existing_fit == True:
+                if preview == True:
+                    print("Quick-look preview map (no fitting).")
+                    fit_tau_array = preview_tau_map(corr, t)["fit_tau_array"]
+                elif os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True and use_existing_fit == True:
                     print("Using existing fit data.")
                     #fit_tau_array = np.load(FOLDER + f"\\fit_tau_array_tol{tolerance}.npy")
-                    loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
+                    loaded_fit = load_full_fit(SUBFOLDER, tolerance) # with the point overrides (see apply_overrides)
                     fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
-                    datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
+                    datapc = loaded_fit
 
                     for kx in tqdm(range(len(corr)), desc="Fitting tau values", ncols=100, colour="#82e0aa"):
                         for ky in range(len(corr[0])):
@@ -2830,25 +6036,46 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
                                         plot_fit_from_existing(corr, t, kx, ky, popt, pcov, mag_field=mag_field, curr=curr, plotshow=show_fit_plots, plotsave=save_fit_plots, out_folder=exp_folder+f"/Results/multi_3D_{str(round(mag_field,1))}mT")
                                     except:
                                         "Exception showing fit plot"
+                elif os.path.exists(SUBFOLDER + "/fit_dual.npz") == True and use_existing_fit == True:
+                    print(f"Using existing dual fit data (tolerance {tolerance}).")
+                    fit_result = _existing_full_fit(SUBFOLDER, tolerance) # with the point overrides (see apply_overrides)
+                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                elif dual == True:
+                    if workers is not None:
+                        fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full_parallel, deltat=deltat, use_cache=fit_cache, workers=workers, engine="batched", tolerance=tolerance, mask=mask, single_exp=single_exp, fallback=fallback, dual=True)
+                    else:
+                        fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full, deltat=deltat, use_cache=fit_cache, tolerance=tolerance, mask=mask, single_exp=single_exp, fallback=fallback, dual=True)
+                    save_dual_fit(SUBFOLDER, fit_result)
+                    fit_path_histogram(fit_result["fit_path_array"])
+                    save_full_fit(SUBFOLDER, tolerance, fit_result)
+                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                    np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+                elif symmetric == True:
+                    fit_function, fit_kwargs = (fit_corr_full_parallel, {"workers": workers}) if workers is not None else (fit_corr_loop, {})
+                    fit_kwargs.update(max_nfev=max_nfev, time_budget=time_budget, fallback=fallback)
+                    fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_symmetric, deltat=deltat, use_cache=fit_cache, weights=load_var_weights(SUBFOLDER), fit_function=fit_function, tolerance=tolerance, mask=mask, single_exp=single_exp, **fit_kwargs)
+                    fit_path_histogram(fit_result["fit_path_array"])
+                    save_full_fit(SUBFOLDER, tolerance, fit_result)
+                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                    np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+                elif workers is not None:
+                    fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full_parallel, deltat=deltat, use_cache=fit_cache, workers=workers, tolerance=tolerance, mask=mask, single_exp=single_exp, max_nfev=max_nfev, time_budget=time_budget, fallback=fallback)
+                    fit_path_histogram(fit_result["fit_path_array"])
+                    save_full_fit(SUBFOLDER, tolerance, fit_result)
+                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                    np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
                 else:
-                    fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
-                    sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
                     print("\n")
-                    # Iterate over the correlation function's indices for fitting tau values
-                    for kx in tqdm(range(len(corr)), desc="Fitting tau values", ncols=100, colour="#82e0aa"):
-                        for ky in range(len(corr[0])):
-                            try:
-                                fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx, ky,
-                                                                                tolerance=tolerance,
-                                                                                showplot=show_fit_plots)
-                                # Store the fitted values in the respective arrays
-                                fit_C0_array[kx, ky] = fitC0
-                                fit_tau_array[kx, ky] = fittau
-                                sigma_C0_array[kx, ky] = sigmaC0
-                                sigma_tau_array[kx, ky] = sigmatau
-                            except:
-                                print("Exception - fitting error")
+                    # fit blocks of kx rows, every finished block goes to a checkpoint, a restarted fit continues from the first missing block:
+                    fit_result = checkpointed_fit(SUBFOLDER, f"fit_checkpoint_tol{tolerance}", len(corr),
+                                                  lambda start, stop: _fit_rows_points(corr, t, start, stop, tolerance=tolerance, mask=mask, single_exp=single_exp, showplot=show_fit_plots, max_nfev=max_nfev, time_budget=time_budget, fallback=fallback),
+                                                  config={"corr": corr, "t": t, "tolerance": tolerance, "mask": mask, "single_exp": single_exp, "max_nfev": max_nfev, "time_budget": time_budget, "fallback": fallback})
+                    save_full_fit(SUBFOLDER, tolerance, fit_result)
+                    clear_checkpoint(SUBFOLDER, f"fit_checkpoint_tol{tolerance}")
+                    fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
                     np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+                if mask is not None:
+                    fit_tau_array = np.where(mask, fit_tau_array, np.nan)
                 # PLOT 3D SURFACE PLOT OF ALL FITTED TAU VALUES:
                 # have to be plotted with 2 contributions (left/ right), otherwise there is a connecting "roof"
                 # have to rearange the data from [0, ... , 63, -63, -62, ... 1]
@@ -2863,7 +6090,8 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
                 data = np.concatenate((data_plus, data_minus))
 
                 # take care for Nan values - replace with closest neighbour that is not Nan:
-                nanarray = np.argwhere(np.isnan(data) * 1 == 1) # convert bool to int with * 1
+                roi_plot = np.ones(data.shape, dtype=bool) if mask is None else np.concatenate((mask[half_index + 1:], mask[:half_index + 1])) # points outside the ROI stay NaN
+                nanarray = np.argwhere(np.isnan(data) & roi_plot)
                 print(f"Start: {len(np.argwhere(np.isnan(data) * 1 == 1))} Nan values")
                 for pair in nanarray:
                     xa, ya = pair[0], pair[1]
@@ -2907,7 +6135,7 @@ def multimeasurement_comparison_3D(FOLDER, B_target, deltat, tolerance=0.2, use_
     plt.show()
 
 
-def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename, deltat, tolerance=0.2, use_existing_fit=False, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers"):
+def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename, deltat, tolerance=0.2, use_existing_fit=False, show_fit_plots=False, save_fit_plots=False, halldata=True, add_suptitle=r"$EE$ polarizers", workers=None, preview=False, symmetric=False, roi=None, snr_threshold=None, snr_action="skip", max_nfev=None, time_budget=None, fallback=False, dual=False, fit_cache=False):
     """
     Perform multi-measurement comparison of 3D plots for a target B field.
     We may use Hall probe results file to determine magnetic field values. If Hall file is not present, el. current values will be used.
@@ -2930,6 +6158,22 @@ def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename,
         └── ...
     The function should be able to convert different types of folder names (decimal, non-decimal etc) to number arrays, skipping individual files and results folders.
     Parameters:
+        workers (int or None): if set, a new full-grid fit is done on this many processes (fit_corr_full_parallel)
+            and saved as fit_full_tol*.npz / popt_pcov_2D_tol*.npz. None = the serial fit_corr loop, checkpointed in blocks of kx rows (see checkpointed_fit).
+        preview (bool): quick look - plot the approximate 1/tau map of preview_tau_map instead of fitting.
+        symmetric (bool): fit the kx / -kx averaged curves (weighted by var.npz) and mirror the result (fit_corr_symmetric),
+            saved like a full-grid fit (on workers processes if set, else serial).
+        roi (numpy.ndarray, dict or None): region of interest - boolean (kx, ky) mask or dict of roi_mask arguments (q in 1/m).
+            Points outside are not fitted and are NaN. None = whole grid.
+        snr_threshold (float or None): skip points with SNR below it (see snr_prefilter), applies to new fits. None = no pre-filter.
+        snr_action (str): "skip" (flagged points are NaN) or "1exp" (flagged points get the 1-exp fit only).
+        max_nfev, time_budget, fallback: per-point fit budget and fallback ladder of new fits (see fit_corr).
+            Full-grid fits (workers / symmetric) print the histogram of fit paths and save fit_path_array.
+        dual (bool): new fits are batched dual-model fits (fit_corr_full(dual=True), on workers processes if set),
+            saved as fit_dual.npz next to fit_full_tol*.npz. With use_existing_fit, an existing fit_dual.npz is used
+            for any tolerance (select_by_tolerance) if there is no fit_full_tol*.npz.
+        fit_cache (bool): full-grid fits (workers / symmetric / dual) go through the persistent fit cache (see cached_fit),
+            a stored fit is reused only if corr.npz and all fit settings are unchanged.
     """
     xlabel, exp_folder, samplelist_full, folderlist_full, B_array_full = multifolder_extract(exp_folder=FOLDER, halldata=halldata)
 
@@ -2948,8 +6192,7 @@ def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename,
                     if ind == B_ind:
                         #print(SUBFOLDER)
                         # IMPORT DATA:
-                        data = np.load(SUBFOLDER + "/" +  "corr.npz")
-                        t, corr = data["t"] * deltat, data["corr"]
+                        t, corr = load_corr(SUBFOLDER, deltat)
                         mag_field = B_array[ind]
 
                         curr_f = folderlist[ind]  # Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers/E7/run_0_current_0_mA
@@ -2960,14 +6203,19 @@ def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename,
                         else:
                             print("No match found in the folder string.")
 
+                        mask = roi_mask(corr.shape[:2], **roi) if isinstance(roi, dict) else roi
+                        mask, single_exp = _snr_fit_masks(SUBFOLDER, corr, mask, snr_threshold, snr_action)
                         # LOOP THROUGH THE WHOLE K-SPACE AND FIT TAU IN EVERY POINT:
-                        if os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True and use_existing_fit == True:
+                        if preview == True:
+                            print("Quick-look preview map (no fitting).")
+                            fit_tau_array = preview_tau_map(corr, t)["fit_tau_array"]
+                        elif os.path.exists(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz") == True and use_existing_fit == True:
                             print("Using existing fit data.")
                             #fit_tau_array = np.load(FOLDER + f"\\fit_tau_array_tol{tolerance}.npy")
-                            loaded_fit = np.load(SUBFOLDER + f"\\fit_full_tol{tolerance}.npz")
+                            loaded_fit = load_full_fit(SUBFOLDER, tolerance) # with the point overrides (see apply_overrides)
                             fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = loaded_fit["fit_C0_array"], loaded_fit["fit_tau_array"], loaded_fit["sigma_C0_array"], loaded_fit["sigma_tau_array"]
 
-                            datapc = np.load(SUBFOLDER + f"/popt_pcov_2D_tol{tolerance}.npz", allow_pickle=True)
+                            datapc = loaded_fit
 
                             for kx in tqdm(range(len(corr)), desc="Fitting tau values", ncols=100, colour="#82e0aa"):
                                 for ky in range(len(corr[0])):
@@ -2980,30 +6228,49 @@ def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename,
                                             except:
                                                 "Exception showing fit plot"
 
+                        elif os.path.exists(SUBFOLDER + "/fit_dual.npz") == True and use_existing_fit == True:
+                            print(f"Using existing dual fit data (tolerance {tolerance}).")
+                            fit_result = _existing_full_fit(SUBFOLDER, tolerance) # with the point overrides (see apply_overrides)
+                            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                        elif dual == True:
+                            if workers is not None:
+                                fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full_parallel, deltat=deltat, use_cache=fit_cache, workers=workers, engine="batched", tolerance=tolerance, mask=mask, single_exp=single_exp, fallback=fallback, dual=True)
+                            else:
+                                fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full, deltat=deltat, use_cache=fit_cache, tolerance=tolerance, mask=mask, single_exp=single_exp, fallback=fallback, dual=True)
+                            save_dual_fit(SUBFOLDER, fit_result)
+                            fit_path_histogram(fit_result["fit_path_array"])
+                            save_full_fit(SUBFOLDER, tolerance, fit_result)
+                            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                            np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+                        elif symmetric == True:
+                            fit_function, fit_kwargs = (fit_corr_full_parallel, {"workers": workers}) if workers is not None else (fit_corr_loop, {})
+                            fit_kwargs.update(max_nfev=max_nfev, time_budget=time_budget, fallback=fallback)
+                            fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_symmetric, deltat=deltat, use_cache=fit_cache, weights=load_var_weights(SUBFOLDER), fit_function=fit_function, tolerance=tolerance, mask=mask, single_exp=single_exp, **fit_kwargs)
+                            fit_path_histogram(fit_result["fit_path_array"])
+                            save_full_fit(SUBFOLDER, tolerance, fit_result)
+                            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                            np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+                        elif workers is not None:
+                            fit_result = cached_fit(SUBFOLDER, corr, t, fit_corr_full_parallel, deltat=deltat, use_cache=fit_cache, workers=workers, tolerance=tolerance, mask=mask, single_exp=single_exp, max_nfev=max_nfev, time_budget=time_budget, fallback=fallback)
+                            fit_path_histogram(fit_result["fit_path_array"])
+                            save_full_fit(SUBFOLDER, tolerance, fit_result)
+                            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
+                            np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
+
                         else:
                             #print(SUBFOLDER)
-                            fit_tau_array, fit_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
-                            sigma_tau_array, sigma_C0_array = np.zeros((len(corr), len(corr[0]))), np.zeros((len(corr), len(corr[0])))
-
                             print("\n")
-                            # Iterate over the correlation function's indices for fitting tau values
-                            for kx in tqdm(range(len(corr)), desc="Fitting tau values", ncols=100, colour="#82e0aa"):
-                                for ky in range(len(corr[0])):
-                                    try:
-                                        fitC0, fittau, sigmatau, sigmaC0 = fit_corr(corr, t, kx, ky,
-                                                                                        tolerance=tolerance,
-                                                                                        showplot=False)
-
-                                        # Store the fitted values in the respective arrays
-                                        fit_C0_array[kx, ky] = fitC0
-                                        fit_tau_array[kx, ky] = fittau
-                                        sigma_C0_array[kx, ky] = sigmaC0
-                                        sigma_tau_array[kx, ky] = sigmatau
-                                    except:
-                                        print("Exception - fitting error")
-
+                            # fit blocks of kx rows, every finished block goes to a checkpoint, a restarted fit continues from the first missing block:
+                            fit_result = checkpointed_fit(SUBFOLDER, f"fit_checkpoint_tol{tolerance}", len(corr),
+                                                          lambda start, stop: _fit_rows_points(corr, t, start, stop, tolerance=tolerance, mask=mask, single_exp=single_exp, showplot=False, max_nfev=max_nfev, time_budget=time_budget, fallback=fallback),
+                                                          config={"corr": corr, "t": t, "tolerance": tolerance, "mask": mask, "single_exp": single_exp, "max_nfev": max_nfev, "time_budget": time_budget, "fallback": fallback})
+                            save_full_fit(SUBFOLDER, tolerance, fit_result)
+                            clear_checkpoint(SUBFOLDER, f"fit_checkpoint_tol{tolerance}")
+                            fit_C0_array, fit_tau_array, sigma_C0_array, sigma_tau_array = fit_result["fit_C0_array"], fit_result["fit_tau_array"], fit_result["sigma_C0_array"], fit_result["sigma_tau_array"]
                             np.save(SUBFOLDER + f"\\fit_tau_array_tol{tolerance}.npy", fit_tau_array)
 
+                        if mask is not None:
+                            fit_tau_array = np.where(mask, fit_tau_array, np.nan)
                         # PLOT 3D SURFACE PLOT OF ALL FITTED TAU VALUES:
 
                         # have to be plotted with 2 contributions (left/ right), otherwise there is a connecting "roof"
@@ -3019,7 +6286,8 @@ def multimeasurement_comparison_3D_onesample(FOLDER, B_target_list, samplename,
                         data = np.concatenate((data_plus, data_minus))
 
                         # take care for Nan values - replace with closest neighbour that is not Nan:
-                        nanarray = np.argwhere(np.isnan(data) * 1 == 1) # convert bool to int with * 1
+                        roi_plot = np.ones(data.shape, dtype=bool) if mask is None else np.concatenate((mask[half_index + 1:], mask[:half_index + 1])) # points outside the ROI stay NaN
+                        nanarray = np.argwhere(np.isnan(data) & roi_plot)
                         #print(f"Start: {len(np.argwhere(np.isnan(data) * 1 == 1))} Nan values")
                         for pair in nanarray:
                             xa, ya = pair[0], pair[1]
@@ -19,6 +19,7 @@ import os
 import re
 import numpy as np
 import DDM_analysis_module_Simon_y0 as DDM
+from DDM_analysis_module_Simon import save_override, override_point # the override store (fit_overrides.rec)
 
 # INITIAL SETTINGS:
 expfolder = "D:/Users Data/Simon/Magnetic experiments/Automatic/Run 2/EE polarizers"
@@ -83,6 +84,10 @@ def process(showold, refit, rewrite_and_continue, swaptau=False, only_continue=F
             popt, pcov = datapc["popt_2D"][int(kx), int(ky)], datapc["pcov_2D"][int(kx), int(ky)]
         except:
             print("")
+        # a point corrected before (correct_but_old) is shown as it was saved:
+        override = override_point(final_folder, kx, ky, tolerance)
+        if override is not None:
+            popt, pcov = override
 
         # show old fit:
         if showold:
@@ -135,10 +140,8 @@ def process(showold, refit, rewrite_and_continue, swaptau=False, only_continue=F
                 #
                 if correct_but_old:
 
-                    print(f"saving ... {final_folder}/tmp_fit_kx{kx}_ky{ky}.npz")
-                    np.savez(final_folder + f"/tmp_fit_kx{kx}_ky{ky}_tol{tolerance}.npz",
-                             popt=popt_new,
-                             pcov=pcov_new)
+                    print(f"saving override ({kx}, {ky}) ... {final_folder}/fit_overrides.rec")
+                    save_override(final_folder, tolerance, kx, ky, popt_new, pcov_new)
                 #
                 else:
                     # save old fit with new name: "_old_i"